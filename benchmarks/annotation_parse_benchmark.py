@@ -0,0 +1,82 @@
+"""Compares sly.Annotation.from_json with the LazyAnnotation view on dense annotations.
+
+For each image the benchmark does what the gallery does with the annotation: parses it,
+clones it, collects classes of labels and serializes labels back to JSON. Annotations are
+generated by the mock API with the given number of polygons per image.
+
+Usage:
+    python -m benchmarks.annotation_parse_benchmark --images 30 --labels 2000 --points 16
+"""
+
+import argparse
+import time
+
+import supervisely as sly
+
+from benchmarks.mock_api import MockApi
+from src.annotations import LazyAnnotation
+
+
+def render(ann):
+    # Same calls as GridGallery.append and GridGallery._update do.
+    ann = ann.clone()
+    classes = {label.obj_class.name: label.obj_class for label in ann.labels}
+    figures = [label.to_json() for label in ann.labels]
+    return classes, figures
+
+
+def measure(name, parse, anns_json, project_meta, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        parsed = [parse(ann_json, project_meta) for ann_json in anns_json]
+        parse_time = time.perf_counter() - started
+        for ann in parsed:
+            render(ann)
+        timings.append((parse_time, time.perf_counter() - started))
+
+    parse_time, total_time = min(timings)
+    print(
+        f"{name:>24}: parse {parse_time * 1000:9.1f} ms, "
+        f"parse and render {total_time * 1000:9.1f} ms "
+        f"({total_time / len(anns_json) * 1000:7.2f} ms per image)"
+    )
+    return total_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, default=30, help="Images in the batch.")
+    parser.add_argument("--labels", type=int, default=2000, help="Polygons per image.")
+    parser.add_argument("--points", type=int, default=16, help="Points per polygon.")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    api = MockApi(
+        images_count=args.images,
+        labels_per_image=args.labels,
+        points_per_label=args.points,
+    )
+    project_meta = sly.ProjectMeta.from_json(api.project.get_meta(api.PROJECT_ID))
+    anns_json = api.annotation.download_json_batch(api.DATASET_ID, api.image_ids())
+
+    print(
+        f"{args.images} images, {args.labels} polygons with {args.points} points each"
+    )
+
+    full = measure(
+        "sly.Annotation.from_json",
+        sly.Annotation.from_json,
+        anns_json,
+        project_meta,
+        args.repeats,
+    )
+    lazy = measure(
+        "LazyAnnotation", LazyAnnotation, anns_json, project_meta, args.repeats
+    )
+
+    print(f"speedup: {full / lazy:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""End-to-end benchmark of the app against the in-process mock API.
+
+Drives the same functions as the UI: settings.pagination, update_current_batch_gallery
+(switching pages), tag_batch with automatic tagging of all batches and update_galleries,
+and reports images/sec, API calls per image, p50/p99 page switch latency and peak RSS.
+
+Usage:
+    python -m benchmarks.app_benchmark --images 500 --batch-size 30 --latency 0.01
+"""
+
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+# The app reads its configuration from the environment at import time.
+os.environ.update(
+    {
+        "ENV": "production",
+        "SERVER_ADDRESS": "http://localhost",
+        "API_TOKEN": "x" * 128,
+        "TEAM_ID": "1",
+        "WORKSPACE_ID": "1",
+        "PROJECT_ID": "1",
+        "DATASET_ID": "1",
+    }
+)
+os.environ.setdefault("SLY_APP_DATA_DIR", tempfile.mkdtemp(prefix="batch-tagging-"))
+
+import numpy as np
+import supervisely as sly
+
+from benchmarks.mock_api import MockApi, MockPreviewAdapter
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) * 1000 if values else 0.0
+
+
+def peak_rss_mib():
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def wait_for_jobs(tagging, timeout):
+    deadline = time.monotonic() + timeout
+    time.sleep(0.05)
+    while tagging.tagging_jobs.is_busy():
+        if time.monotonic() > deadline:
+            raise TimeoutError("Tagging jobs didn't finish in time.")
+        time.sleep(0.01)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--labels", type=int, default=0, help="Polygons per image.")
+    parser.add_argument("--page-switches", type=int, default=50)
+    parser.add_argument("--chunk-size", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--metrics", action="store_true", help="Print all metrics.")
+    args = parser.parse_args()
+
+    api = MockApi(
+        images_count=args.images,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        labels_per_image=args.labels,
+    )
+
+    import src.globals as g
+    from src.metrics import METRICS, instrument_api
+
+    g.api = instrument_api(api)
+    # Widgets send their changes as in the running app.
+    g.init_static_dir()
+    g.start_widget_sync()
+    previews = MockPreviewAdapter(args.latency)
+    g.STATE.previews.session.mount("http://localhost", previews)
+
+    import src.ui.settings as settings
+    import src.ui.tagging as tagging
+
+    g.STATE.batch_size = args.batch_size
+    g.STATE.new_tag_name = f"benchmark-{int(time.time())}"
+    g.STATE.tag_metas = [sly.TagMeta(g.STATE.new_tag_name, sly.TagValueType.NONE)]
+    g.STATE.automatic_tagging = False
+    g.STATE.write_chunk_size = args.chunk_size
+    g.STATE.write_concurrency = args.concurrency
+
+    started = time.perf_counter()
+    g.STATE.save_project_meta()
+    settings.pagination()
+    tagging.update_current_batch_gallery()
+    startup = time.perf_counter() - started
+    print(f"startup (meta, listing, first page): {startup * 1000:8.1f} ms")
+
+    page_switches = []
+    for _ in range(min(args.page_switches, len(g.STATE.pages) - 1)):
+        # Give the background prefetch the time a user needs to look at the page.
+        time.sleep(args.latency * 2)
+        started = time.perf_counter()
+        tagging.next_batch()
+        page_switches.append(time.perf_counter() - started)
+
+    print(
+        f"page switch: p50 {percentile(page_switches, 50):8.1f} ms, "
+        f"p99 {percentile(page_switches, 99):8.1f} ms ({len(page_switches)} switches)"
+    )
+
+    g.STATE.current_page_number = 1
+    tagging.update_current_batch_gallery()
+    g.STATE.automatic_tagging = True
+
+    api.calls.clear()
+    started = time.perf_counter()
+    tagging.tag_batch()
+    wait_for_jobs(tagging, args.timeout)
+    elapsed = time.perf_counter() - started
+
+    tagged = g.STATE.images.tagged_count
+    calls = sum(api.calls.values())
+    print(
+        f"tagging: {tagged} images in {elapsed:8.2f} s, "
+        f"{tagged / elapsed:8.1f} images/sec, "
+        f"{calls / max(tagged, 1):6.3f} API calls per image"
+    )
+    print("calls by endpoint: " + ", ".join(f"{k}={v}" for k, v in api.calls.items()))
+    print(
+        f"previews: {previews.requests} downloaded, "
+        f"{METRICS.total('preview_cache_requests_total'):g} lookups, "
+        f"{len(g.STATE.previews)} cached ({g.STATE.previews.size / 1024:.0f} KiB)"
+    )
+    print(f"peak RSS: {peak_rss_mib():8.1f} MiB")
+
+    if args.metrics:
+        print(METRICS.render())
+
+    tag_id = g.STATE.project_meta.get_tag_meta(g.STATE.new_tag_name).sly_id
+    duplicates = [
+        image_id for image_id in api.tags if api.tag_count(image_id, tag_id) > 1
+    ]
+    assert not duplicates, f"{len(duplicates)} images were tagged more than once."
+
+    sys.stdout.flush()
+    # Widgets of the app start background threads, which don't stop on their own.
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
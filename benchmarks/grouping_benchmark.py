@@ -0,0 +1,81 @@
+"""Compares batches in the name order with batches of similar images (src.grouping).
+
+Previews are served by the mock adapter, images are split into groups of the same colour,
+which are shuffled in the name order. Purity is the share of batches with images of only
+one group, i.e. batches, which can be tagged with "apply to all" at once. Grouping is run
+twice, the second run reads embeddings from the disk.
+
+Usage:
+    python -m benchmarks.grouping_benchmark --images 3000 --groups 20 --batch-size 30
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from collections import Counter
+
+os.environ.update(
+    {"ENV": "production", "SERVER_ADDRESS": "http://localhost", "API_TOKEN": "x" * 128}
+)
+
+import supervisely as sly
+
+from benchmarks.mock_api import MockApi, MockPreviewAdapter
+from src.previews import PreviewCache
+import src.pipeline as pipeline
+
+
+def purity(pages, adapter):
+    pure = 0
+    for page_number in pages.keys():
+        groups = {adapter.group_of(image.preview_url) for image in pages[page_number]}
+        pure += len(groups) == 1
+    return pure / len(pages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, default=3000)
+    parser.add_argument("--groups", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="batch-tagging-")
+    api = MockApi(images_count=args.images)
+    adapter = MockPreviewAdapter(args.latency, groups=args.groups)
+    previews = PreviewCache(os.path.join(data_dir, "previews"), "static/previews")
+    previews.session.mount("http://localhost", adapter)
+    project_meta = sly.ProjectMeta.from_json(api.project.get_meta(api.PROJECT_ID))
+
+    pages = pipeline.list_images(api, [api.DATASET_ID], args.batch_size, project_meta)
+    pages.cursor.load_all()
+    print(
+        f"{args.images} images in {args.groups} groups, {len(pages)} batches "
+        f"of {args.batch_size} images"
+    )
+
+    # Groups have different sizes, so some batches have images of two groups anyway.
+    sizes = Counter(
+        adapter.group_of(image.preview_url)
+        for image in pages.table.get_rows(range(len(pages.table)))
+    )
+    best = sum(size // args.batch_size for size in sizes.values()) / len(pages)
+    print(f"{'best possible':>16}: purity {best:6.1%}")
+    print(f"{'name order':>16}: purity {purity(pages, adapter):6.1%}")
+
+    for run in ("first run", "cached run"):
+        started = time.perf_counter()
+        pipeline.group_similar_images(api, data_dir, pages, previews)
+        elapsed = time.perf_counter() - started
+        print(
+            f"{run:>16}: purity {purity(pages, adapter):6.1%}, "
+            f"{elapsed * 1000:9.1f} ms ({args.images / elapsed:9.0f} images/s)"
+        )
+
+    print(f"previews downloaded: {adapter.requests}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Measures memory per image for the old list-based state and the ImageTable.
+
+The old state kept a sorted list of ImageInfo objects, the same objects sliced into pages
+and the list of tagged ImageInfo objects. The benchmark builds both structures for a
+synthetic dataset and measures allocated memory with tracemalloc.
+
+Usage:
+    python -m benchmarks.image_table_memory --images 1000000 --batch-size 30
+"""
+
+import argparse
+import gc
+import os
+import time
+import tracemalloc
+
+# ImageInfo.preview_url needs the server address to build the URL.
+os.environ.setdefault("SERVER_ADDRESS", "https://app.supervise.ly")
+
+import supervisely as sly
+
+from src.image_table import ImageTable
+
+
+def synthetic_image_infos(count):
+    empty = {field: None for field in sly.ImageInfo._fields}
+    for index in range(count):
+        yield sly.ImageInfo(
+            **{
+                **empty,
+                "id": 10_000_000 + index,
+                "name": f"image_{index:07d}.jpg",
+                "full_storage_url": f"https://app.supervise.ly/h5un6l2bnaz1vj8a9qgms4-public/images/original/{index:07d}.jpg",
+            }
+        )
+
+
+def build_lists(count, batch_size):
+    image_infos = sorted(synthetic_image_infos(count), key=lambda x: x.name)
+    pages = {
+        page_number: image_infos[
+            batch_size * (page_number - 1) : batch_size * page_number
+        ]
+        for page_number in range(1, (count + batch_size - 1) // batch_size + 1)
+    }
+    tagged_images = image_infos[: count // 2]
+    return image_infos, pages, tagged_images
+
+
+def build_table(count, batch_size):
+    table = ImageTable(count, batch_size)
+    infos = []
+    for index, image_info in enumerate(synthetic_image_infos(count)):
+        infos.append(image_info)
+        if len(infos) == batch_size:
+            table.set_rows(index + 1 - batch_size, infos)
+            infos = []
+    if infos:
+        table.set_rows(count - len(infos), infos)
+    table.mark_tagged(range(count // 2))
+    return table
+
+
+def measure(name, build, count, batch_size):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = build(count, batch_size)
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(
+        f"{name:<6} resident: {current / 2**20:9.1f} MiB ({current / count:7.1f} B/image), "
+        f"peak: {peak / 2**20:9.1f} MiB, build time: {elapsed:6.2f}s"
+    )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, default=1_000_000)
+    parser.add_argument("--batch-size", type=int, default=30)
+    args = parser.parse_args()
+
+    lists = measure("lists", build_lists, args.images, args.batch_size)
+    del lists
+    table = measure("table", build_table, args.images, args.batch_size)
+
+    started = time.perf_counter()
+    image_ids = range(10_000_000, 10_000_000 + args.images, 997)
+    rows = table.rows_by_ids(image_ids)
+    assert len(rows) == len(image_ids)
+    print(
+        f"{len(image_ids)} id lookups: {time.perf_counter() - started:.4f}s "
+        "(including the index build)"
+    )
+
+    started = time.perf_counter()
+    assert table.row_by_name("image_0123456.jpg") == 123456
+    print(
+        f"name lookup: {time.perf_counter() - started:.4f}s (including the index build)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,482 @@
+"""In-process fake of the Supervisely API used by the benchmarks.
+
+MockApi is a subclass of sly.Api, which answers requests from memory instead of sending
+them to the server, so all SDK methods used by the app (api.image.get_list, add_tag,
+api.annotation.download_json_batch, api.project.get_meta/update_meta, ...) work without
+a Supervisely instance. Images are generated on the fly from their index, only tags and
+metadata are stored, so datasets with millions of images are cheap.
+
+Requests go through the retry loop of sly.Api.post and sly.Api.get, only the transport is
+replaced: requests to the address of the MockApi instance are answered by its handlers.
+Each request sleeps for the configured latency, is answered with 503 with the configured
+error rate and with 429 when more than capacity requests are in flight, requests to tag
+images from failing_ids are answered with 400. MockPreviewAdapter serves previews of images
+for sessions of requests.
+"""
+
+import itertools
+import json
+import random
+import re
+import sys
+import threading
+import time
+import weakref
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import requests
+import supervisely as sly
+from supervisely.api.module_api import ApiField
+
+FIRST_IMAGE_ID = 10_000_000
+
+
+class MockResponse(requests.Response):
+    def __init__(self, method: str, data, status_code: int = 200, reason: str = "OK"):
+        super().__init__()
+        self.status_code = status_code
+        self.reason = reason
+        self._content = json.dumps(data).encode("utf-8")
+        self.headers["Content-Length"] = str(len(self._content))
+        self.url = f"mock://{method}"
+
+
+class MockPreviewAdapter(requests.adapters.BaseAdapter):
+    """Transport adapter of requests, which answers any GET request with a JPEG preview
+    after the latency, mount it to the session with the server address. Previews are black,
+    or, if groups is set, images are split into groups of the same colour by the index
+    in the URL, groups are shuffled in the name order.
+    """
+
+    def __init__(
+        self, latency: float = 0.0, width: int = 300, height: int = 225, groups: int = 0
+    ):
+        super().__init__()
+        self.latency = latency
+        self.groups = groups
+        self.requests = 0
+
+        rng = np.random.default_rng(0)
+        colors = (
+            rng.integers(0, 256, size=(max(groups, 1), 3)) if groups else [(0,) * 3]
+        )
+        self._contents = [
+            sly.image.write_bytes(
+                np.full((height, width, 3), color, dtype=np.uint8), ".jpg"
+            )
+            for color in colors
+        ]
+
+    def group_of(self, url: str) -> int:
+        """Returns the group of the image with the preview URL."""
+        if not self.groups:
+            return 0
+        index = int(re.findall(r"(\d+)\.jpg", url)[-1])
+        return index * 2654435761 % 4294967296 % self.groups
+
+    def send(self, request, **kwargs):
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        response = requests.Response()
+        response.status_code = 200
+        response._content = self._contents[self.group_of(request.url)]
+        response.headers["Content-Type"] = "image/jpeg"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class _MockTransport:
+    """Replaces the requests module in the module of sly.Api: requests to addresses of MockApi
+    instances are answered by them, everything else is taken from requests.
+    """
+
+    def __init__(self):
+        self.apis = weakref.WeakValueDictionary()
+
+    @classmethod
+    def install(cls) -> "_MockTransport":
+        module = sys.modules[sly.Api.__module__]
+        if not isinstance(module.requests, cls):
+            module.requests = cls()
+        return module.requests
+
+    def __getattr__(self, name):
+        return getattr(requests, name)
+
+    def post(self, url, data=None, json=None, **kwargs):
+        api, method = self._resolve(url)
+        if api is None:
+            return requests.post(url, data=data, json=json, **kwargs)
+        return api._respond(method, json if json is not None else data)
+
+    def get(self, url, params=None, **kwargs):
+        api, method = self._resolve(url)
+        if api is None:
+            return requests.get(url, params=params, **kwargs)
+        return api._respond(method, params)
+
+    def _resolve(self, url):
+        for address, api in list(self.apis.items()):
+            if url.startswith(address + "/"):
+                method = url[len(address) + 1 :]
+                return api, method.replace("public/api/v3/", "", 1)
+        return None, None
+
+
+class MockApi(sly.Api):
+    """Fake API with one project and one dataset with images_count images.
+
+    :param images_count: number of images in the dataset.
+    :param latency: delay of each request in seconds.
+    :param error_rate: probability of 503 response to any request.
+    :param capacity: maximum number of requests in flight before 429 responses.
+    :param failing_ids: ids of images which can't be tagged.
+    :param labels_per_image: number of polygons in the annotation of each image.
+    :param points_per_label: number of points in each polygon.
+    :param seed: seed of the random errors.
+    :param retry_count: number of attempts of each request made by sly.Api.
+    :param retry_sleep_sec: base delay of sly.Api between attempts in seconds.
+    """
+
+    PROJECT_ID = 1
+    DATASET_ID = 1
+
+    _addresses = itertools.count(1)
+
+    def __init__(
+        self,
+        images_count: int = 1000,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        capacity: Optional[int] = None,
+        failing_ids: Optional[Iterable[int]] = None,
+        labels_per_image: int = 0,
+        points_per_label: int = 8,
+        seed: int = 0,
+        retry_count: int = 10,
+        retry_sleep_sec: Optional[float] = None,
+    ):
+        # Each instance has its own address, so requests are answered by the instance
+        # which sent them, even if they are sent by its copies.
+        super().__init__(
+            f"http://localhost/mock-{next(self._addresses)}",
+            "x" * 128,
+            retry_count=retry_count,
+            retry_sleep_sec=retry_sleep_sec,
+            ignore_task_id=True,
+        )
+        _MockTransport.install().apis[self.server_address] = self
+
+        self.images_count = images_count
+        self.latency = latency
+        self.error_rate = error_rate
+        self.capacity = capacity
+        self.failing_ids = set(failing_ids or [])
+        self.labels_per_image = labels_per_image
+        self.points_per_label = points_per_label
+
+        self.calls = Counter()
+        self.throttled = 0
+        self.in_flight = 0
+        self.tags: Dict[int, List[dict]] = {}
+        self.metas: Dict[int, dict] = {}
+
+        self.project_meta = {
+            "classes": [
+                {
+                    "id": 1,
+                    "title": "object",
+                    "shape": "polygon",
+                    "color": "#FF0000",
+                    "hotkey": "",
+                }
+            ],
+            "tags": [],
+            "projectType": "images",
+        }
+
+        self._next_tag_id = 1
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def image_ids(self) -> List[int]:
+        return list(range(FIRST_IMAGE_ID, FIRST_IMAGE_ID + self.images_count))
+
+    def tag_count(self, image_id: int, tag_id: int) -> int:
+        return sum(tag["tagId"] == tag_id for tag in self.tags.get(image_id, []))
+
+    def _respond(self, method, data) -> MockResponse:
+        with self._lock:
+            self.calls[method] += 1
+            self.in_flight += 1
+            overloaded = self.capacity is not None and self.in_flight > self.capacity
+            if overloaded:
+                self.throttled += 1
+            failed = self._random.random() < self.error_rate
+
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+
+            if overloaded:
+                return self._error(method, 429, "Too Many Requests")
+            if failed:
+                return self._error(method, 503, "Service Unavailable")
+
+            handler = getattr(self, "_" + method.replace(".", "_").replace("-", "_"))
+            try:
+                return MockResponse(method, handler(data))
+            except requests.exceptions.HTTPError as e:
+                return e.response
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _raise(self, method, status_code, message):
+        raise requests.exceptions.HTTPError(
+            message, response=self._error(method, status_code, message)
+        )
+
+    def _error(self, method, status_code, message) -> MockResponse:
+        return MockResponse(method, {"error": message}, status_code, message)
+
+    def _image_json(self, image_id: int) -> dict:
+        index = image_id - FIRST_IMAGE_ID
+        return {
+            "id": image_id,
+            "name": f"image_{index:07d}.jpg",
+            "link": None,
+            "hash": f"hash{index}",
+            "mime": "image/jpeg",
+            "ext": "jpeg",
+            "size": 100_000,
+            "width": 640,
+            "height": 480,
+            "labelsCount": self.labels_per_image,
+            "datasetId": self.DATASET_ID,
+            "createdAt": "2023-01-01T00:00:00.000Z",
+            "updatedAt": "2023-01-01T00:00:00.000Z",
+            "meta": self.metas.get(image_id, {}),
+            "pathOriginal": f"/images/original/{index:07d}.jpg",
+            "fullStorageUrl": f"/images/original/{index:07d}.jpg",
+            "tags": list(self.tags.get(image_id, [])),
+        }
+
+    def _filtered_ids(self, data) -> List[int]:
+        image_ids = self.image_ids()
+
+        for condition in data.get(ApiField.FILTER, []):
+            field, value = condition["field"], condition["value"]
+            if field == ApiField.ID:
+                value = set(value)
+                image_ids = [image_id for image_id in image_ids if image_id in value]
+            elif field == ApiField.NAME:
+                image_ids = [
+                    image_id
+                    for image_id in image_ids
+                    if self._image_json(image_id)["name"] == value
+                ]
+
+        for condition in data.get(ApiField.FILTERS, []):
+            if condition["type"] == "images_filename":
+                value = condition["data"]["value"]
+                image_ids = [
+                    image_id
+                    for image_id in image_ids
+                    if value in self._image_json(image_id)["name"]
+                ]
+            elif condition["type"] == "images_tag":
+                tag_id = condition["data"]["tagId"]
+                include = condition["data"].get("include", True)
+                image_ids = [
+                    image_id
+                    for image_id in image_ids
+                    if (self.tag_count(image_id, tag_id) > 0) == include
+                ]
+
+        return image_ids
+
+    # Handlers of the endpoints, named after the methods of the API.
+
+    def _images_list(self, data):
+        if data.get(ApiField.FILTER) or data.get(ApiField.FILTERS):
+            image_ids = self._filtered_ids(data)
+        else:
+            image_ids = self.image_ids()
+
+        per_page = data.get("per_page", 500)
+        page = data.get("page", 1)
+        page_ids = image_ids[(page - 1) * per_page : page * per_page]
+
+        return {
+            "total": len(image_ids),
+            "perPage": per_page,
+            "pagesCount": (len(image_ids) + per_page - 1) // per_page,
+            "entities": [self._image_json(image_id) for image_id in page_ids],
+        }
+
+    def _images_info(self, data):
+        return self._image_json(data[ApiField.ID])
+
+    def _images_editInfo(self, data):
+        image_id = data[ApiField.ID]
+        if image_id in self.failing_ids:
+            self._raise("images.editInfo", 400, f"Can't edit {image_id}")
+
+        if ApiField.META in data:
+            with self._lock:
+                self.metas[image_id] = json.loads(json.dumps(data[ApiField.META]))
+        return self._image_json(image_id)
+
+    def _image_tags_bulk_add_to_image(self, data):
+        image_ids = data[ApiField.IDS]
+
+        failing = self.failing_ids.intersection(image_ids)
+        if failing:
+            self._raise("image-tags.bulk.add-to-image", 400, f"Can't tag {failing}")
+
+        with self._lock:
+            for image_id in image_ids:
+                tags = self.tags.setdefault(image_id, [])
+                tags.append(
+                    {
+                        "tagId": data[ApiField.TAG_ID],
+                        "id": len(tags) + 1,
+                        "value": data.get(ApiField.VALUE),
+                    }
+                )
+        return {"success": True}
+
+    def _image_tags_bulk_remove_from_images(self, data):
+        image_ids = data[ApiField.IDS]
+
+        failing = self.failing_ids.intersection(image_ids)
+        if failing:
+            self._raise(
+                "image-tags.bulk.remove-from-images", 400, f"Can't untag {failing}"
+            )
+
+        tag_ids = set(data[ApiField.TAG_IDS])
+        with self._lock:
+            for image_id in image_ids:
+                self.tags[image_id] = [
+                    tag
+                    for tag in self.tags.get(image_id, [])
+                    if tag["tagId"] not in tag_ids
+                ]
+        return {"success": True}
+
+    def _annotations_bulk_info(self, data):
+        tag_names = {tag["id"]: tag["name"] for tag in self.project_meta["tags"]}
+        return [
+            {
+                "imageId": image_id,
+                "imageName": self._image_json(image_id)["name"],
+                "datasetId": self.DATASET_ID,
+                "createdAt": None,
+                "updatedAt": None,
+                "annotation": self._annotation_json(image_id, tag_names),
+            }
+            for image_id in data[ApiField.IMAGE_IDS]
+        ]
+
+    def _annotation_json(self, image_id, tag_names):
+        rng = random.Random(image_id)
+        objects = []
+        for index in range(self.labels_per_image):
+            x, y = rng.randint(0, 600), rng.randint(0, 440)
+            points = [
+                [x + rng.randint(0, 40), y + rng.randint(0, 40)]
+                for _ in range(self.points_per_label)
+            ]
+            objects.append(
+                {
+                    "id": image_id * 1000 + index,
+                    "classId": 1,
+                    "classTitle": "object",
+                    "description": "",
+                    "tags": [],
+                    "geometryType": "polygon",
+                    "points": {"exterior": points, "interior": []},
+                }
+            )
+
+        return {
+            "description": "",
+            "size": {"height": 480, "width": 640},
+            "tags": [
+                {
+                    "name": tag_names[tag["tagId"]],
+                    "value": tag["value"],
+                    "id": tag["id"],
+                }
+                for tag in self.tags.get(image_id, [])
+                if tag["tagId"] in tag_names
+            ],
+            "objects": objects,
+        }
+
+    def _projects_meta(self, data):
+        return json.loads(json.dumps(self.project_meta))
+
+    def _projects_meta_update(self, data):
+        meta = json.loads(json.dumps(data[ApiField.META]))
+        with self._lock:
+            for tag in meta.get("tags", []):
+                if tag.get("id") is None:
+                    tag["id"] = self._next_tag_id
+                    self._next_tag_id += 1
+            self.project_meta = meta
+        return {"success": True}
+
+    def _projects_info(self, data):
+        return {
+            "id": self.PROJECT_ID,
+            "name": "Benchmark project",
+            "description": "",
+            "size": 0,
+            "readme": "",
+            "workspaceId": 1,
+            "teamId": 1,
+            "imagesCount": self.images_count,
+            "datasetsCount": 1,
+            "createdAt": None,
+            "updatedAt": None,
+            "type": "images",
+            "customData": {},
+        }
+
+    def _workspaces_info(self, data):
+        return {
+            "id": data[ApiField.ID],
+            "name": "Benchmark workspace",
+            "description": "",
+            "teamId": 1,
+            "createdAt": None,
+            "updatedAt": None,
+        }
+
+    def _datasets_info(self, data):
+        return {
+            "id": self.DATASET_ID,
+            "name": "Benchmark dataset",
+            "description": "",
+            "size": 0,
+            "projectId": self.PROJECT_ID,
+            "imagesCount": self.images_count,
+            "itemsCount": self.images_count,
+            "teamId": 1,
+            "workspaceId": 1,
+            "createdAt": None,
+            "updatedAt": None,
+            "parentId": None,
+            "referenceImageUrl": "/previews/q/ext:jpeg/resize:fill:300:0:0/q:70/plain/image.jpg",
+        }
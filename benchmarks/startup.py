@@ -0,0 +1,122 @@
+"""Import-time profile of the app, i.e. the cold start before the server is created.
+
+The UI modules are imported in a fresh interpreter with -X importtime for each start mode
+of the app: from the ecosystem (no project and dataset in the environment) and from
+a dataset. The server is unreachable, so the start must not wait for the API, and the cache
+of previews has --previews files, so the start must not wait for the disk. The report has
+the import time of the app, the self time of top level packages and the slowest modules.
+
+Usage:
+    python -m benchmarks.startup --previews 5000 --top 15
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    "ecosystem": {},
+    "dataset": {"PROJECT_ID": "1", "DATASET_ID": "1"},
+}
+
+# Prints the time of the import, the process is stopped at once, so background threads
+# (e.g. the dataset thumbnail retrying the unreachable server) don't delay the exit.
+SCRIPT = """
+import os, time
+started = time.perf_counter()
+import src.ui.input, src.ui.settings, src.ui.tagging
+print(time.perf_counter() - started, flush=True)
+os._exit(0)
+"""
+
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def fill_previews(data_dir: str, count: int):
+    directory = os.path.join(data_dir, "static", "previews")
+    os.makedirs(directory, exist_ok=True)
+    for index in range(count):
+        with open(os.path.join(directory, f"{index}_0000000000000000.jpg"), "wb") as f:
+            f.write(b"\xff" * 1024)
+
+
+def profile(mode: str, data_dir: str, timeout: float):
+    env = {
+        **os.environ,
+        "ENV": "production",
+        # Nothing listens on the discard port, so requests to the API fail.
+        "SERVER_ADDRESS": "http://127.0.0.1:9",
+        "API_TOKEN": "x" * 128,
+        "TEAM_ID": "1",
+        "WORKSPACE_ID": "1",
+        "SLY_APP_DATA_DIR": data_dir,
+        **MODES[mode],
+    }
+    for key in ("PROJECT_ID", "DATASET_ID"):
+        if key not in MODES[mode]:
+            env.pop(key, None)
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", SCRIPT],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=timeout,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Import of the app failed:\n{result.stderr[-2000:]}")
+
+    modules = []
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, _, name = match.groups()
+            modules.append((name, int(self_us) / 1000, int(cumulative_us) / 1000))
+
+    return float(result.stdout.split()[-1]), modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--previews", type=int, default=5000)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="batch-tagging-")
+    fill_previews(data_dir, args.previews)
+
+    for mode in MODES:
+        elapsed, modules = profile(mode, data_dir, args.timeout)
+
+        packages = defaultdict(float)
+        for name, self_ms, _ in modules:
+            packages[name.split(".")[0]] += self_ms
+
+        print(f"{mode}: import of the app {elapsed * 1000:8.1f} ms")
+        print(
+            "  self time of packages: "
+            + ", ".join(
+                f"{package} {ms:.0f} ms"
+                for package, ms in sorted(packages.items(), key=lambda p: -p[1])[
+                    : args.top
+                ]
+            )
+        )
+        print(f"  app modules: {packages['src']:.1f} ms")
+        print("  slowest modules (self time):")
+        for name, self_ms, cumulative_ms in sorted(modules, key=lambda m: -m[1])[
+            : args.top
+        ]:
+            print(f"    {self_ms:8.1f} ms {cumulative_ms:8.1f} ms cumulative  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Compares the old per-image tagging loop with the bulk tag-write engine.
+
+The benchmark uses the in-process mock API (benchmarks.mock_api) which simulates the network
+round-trip with a fixed latency per request and answers with 429 when more than --capacity
+requests are in flight, so no Supervisely instance is needed.
+
+Usage:
+    python -m benchmarks.tag_writer_benchmark --images 1000 --latency 0.02 --chunk-size 50
+"""
+
+import argparse
+import time
+
+from benchmarks.mock_api import MockApi
+from src.tag_writer import write_tags
+
+
+def run_loop(api, image_ids, tag_id):
+    """The original implementation of tagging: one request per image."""
+    tagged = []
+    errors = []
+    for image_id in image_ids:
+        try:
+            api.image.add_tag(image_id, tag_id)
+            tagged.append(image_id)
+        except Exception:
+            errors.append(image_id)
+    return tagged, errors
+
+
+def run_bulk(api, image_ids, tag_id, chunk_size, concurrency):
+    result = write_tags(api, image_ids, tag_id, chunk_size, concurrency=concurrency)
+    return result.tagged, list(result.errors)
+
+
+def report(name, api, started, tagged, errors):
+    elapsed = time.perf_counter() - started
+    print(
+        f"{name:<8} tagged: {len(tagged):>6}, errors: {len(errors):>4}, "
+        f"requests: {sum(api.calls.values()):>6}, throttled: {api.throttled:>4}, "
+        f"time: {elapsed:8.3f}s, "
+        f"images/sec: {len(tagged) / elapsed:10.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--chunk-size", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--capacity", type=int, default=None)
+    parser.add_argument("--failing", type=int, default=3)
+    args = parser.parse_args()
+
+    def create_api():
+        return MockApi(
+            args.images,
+            latency=args.latency,
+            capacity=args.capacity,
+            failing_ids=failing_ids,
+        )
+
+    image_ids = MockApi(args.images).image_ids()
+    step = max(len(image_ids) // max(args.failing, 1), 1)
+    failing_ids = image_ids[::step][: args.failing]
+
+    api = create_api()
+    started = time.perf_counter()
+    tagged, errors = run_loop(api, image_ids, tag_id=1)
+    report("loop", api, started, tagged, errors)
+
+    for concurrency in sorted({1, args.concurrency}):
+        api = create_api()
+        started = time.perf_counter()
+        tagged, errors = run_bulk(
+            api, image_ids, 1, chunk_size=args.chunk_size, concurrency=concurrency
+        )
+        report(f"bulk x{concurrency}", api, started, tagged, errors)
+
+        assert sorted(errors) == sorted(
+            failing_ids
+        ), "Errors were attributed incorrectly."
+        assert all(len(tags) == 1 for tags in api.tags.values()), "Duplicate tags."
+
+
+if __name__ == "__main__":
+    main()
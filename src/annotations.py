@@ -0,0 +1,295 @@
+import threading
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
+import supervisely as sly
+
+from src.image_table import ImageRow
+from src.metrics import stage
+
+
+class LazyLabel:
+    """Label of the annotation, which keeps the JSON as it was downloaded. The gallery only
+    needs the class and the JSON of the label, so the geometry is built on the first access
+    to the label attribute.
+
+    :param label_json: JSON of the label (object) from the annotation.
+    :param obj_class: class of the label from the project meta.
+    :param project_meta: project meta used to build the label.
+    """
+
+    __slots__ = ("obj_class", "_json", "_project_meta", "_label")
+
+    def __init__(
+        self, label_json: dict, obj_class: sly.ObjClass, project_meta: sly.ProjectMeta
+    ):
+        # Labels serialized by the SDK have both keys, the downloaded ones can miss one.
+        if "shape" not in label_json or "geometryType" not in label_json:
+            shape = label_json.get("geometryType", label_json.get("shape"))
+            label_json = {**label_json, "shape": shape, "geometryType": shape}
+
+        self.obj_class = obj_class
+        self._json = label_json
+        self._project_meta = project_meta
+        self._label = None
+
+    @property
+    def label(self) -> sly.Label:
+        if self._label is None:
+            self._label = sly.Label.from_json(self._json, self._project_meta)
+        return self._label
+
+    @property
+    def geometry(self):
+        return self.label.geometry
+
+    def to_json(self) -> dict:
+        return self._json
+
+
+class LazyAnnotation:
+    """Read-only view of the annotation JSON, which can be passed to the gallery instead of
+    sly.Annotation. Labels are created without parsing their geometry and return the
+    downloaded JSON, the full annotation is built only by to_annotation().
+
+    :param ann_json: JSON of the annotation.
+    :param project_meta: project meta of the annotation.
+    """
+
+    def __init__(self, ann_json: dict, project_meta: sly.ProjectMeta):
+        self._json = ann_json
+        self._project_meta = project_meta
+        self._labels: Optional[List[LazyLabel]] = None
+
+    @property
+    def img_size(self):
+        size = self._json["size"]
+        return size["height"], size["width"]
+
+    @property
+    def labels(self) -> List[LazyLabel]:
+        if self._labels is None:
+            labels = []
+            for label_json in self._json.get("objects", []):
+                obj_class = self._project_meta.get_obj_class(label_json["classTitle"])
+                if obj_class is None:
+                    raise RuntimeError(
+                        f"Class {label_json['classTitle']} of the label is not found "
+                        "in the project meta."
+                    )
+                labels.append(LazyLabel(label_json, obj_class, self._project_meta))
+            self._labels = labels
+        return self._labels
+
+    @property
+    def img_tags(self) -> sly.TagCollection:
+        return sly.TagCollection.from_json(
+            self._json.get("tags", []), self._project_meta.tag_metas
+        )
+
+    def add_tag(self, tag: sly.Tag) -> "LazyAnnotation":
+        """Returns the copy of the annotation with the image tag, labels are shared."""
+        ann_json = {**self._json, "tags": self._json.get("tags", []) + [tag.to_json()]}
+        ann = LazyAnnotation(ann_json, self._project_meta)
+        ann._labels = self._labels
+        return ann
+
+    def clone(self) -> "LazyAnnotation":
+        # The view is never changed in place, so it's shared instead of copied.
+        return self
+
+    def to_json(self) -> dict:
+        return self._json
+
+    def to_annotation(self) -> sly.Annotation:
+        return sly.Annotation.from_json(self._json, self._project_meta)
+
+
+class AnnotationCache:
+    """Bounded LRU cache of annotations keyed by image id.
+    Annotations are downloaded only for images, which are not in the cache, and can be
+    prefetched in the background thread (e.g. for the next and previous pages), so switching
+    between pages doesn't need any requests. If the image is requested while it's being
+    prefetched, the request waits for the prefetch instead of downloading it again.
+
+    :param maxsize: maximum number of annotations in the cache.
+    """
+
+    def __init__(self, maxsize: int = 1000):
+        self.maxsize = maxsize
+
+        self._annotations = OrderedDict()
+        # Number of invalidations for each image, used to drop results of downloads
+        # which were started before the image was invalidated.
+        self._versions = {}
+        # Number of cache clears, results of downloads started before the clear are dropped.
+        self._epoch = 0
+        self._loading = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="prefetch"
+        )
+
+    def get_many(
+        self,
+        api: sly.Api,
+        images: List[ImageRow],
+        project_meta: sly.ProjectMeta,
+    ) -> List[LazyAnnotation]:
+        """Returns annotations for images in the same order, downloading and parsing only
+        annotations which are not in the cache.
+        """
+        image_ids = [image.id for image in images]
+        with self._lock:
+            loading = {
+                self._loading[image_id]
+                for image_id in image_ids
+                if image_id not in self._annotations and image_id in self._loading
+            }
+
+        if loading:
+            sly.logger.debug(f"Waiting for {len(loading)} prefetch requests to finish.")
+            wait(loading)
+
+        with self._lock:
+            found = {}
+            for image_id in image_ids:
+                ann = self._annotations.get(image_id)
+                if ann is not None:
+                    self._annotations.move_to_end(image_id)
+                    found[image_id] = ann
+
+        missing = [image for image in images if image.id not in found]
+
+        sly.logger.debug(
+            f"Found {len(found)} annotations in cache, {len(missing)} will be downloaded."
+        )
+
+        if missing:
+            found.update(self._load(api, missing, project_meta))
+
+        return [found[image_id] for image_id in image_ids]
+
+    def prefetch(
+        self,
+        api: sly.Api,
+        images: List[ImageRow],
+        project_meta: sly.ProjectMeta,
+    ):
+        """Downloads annotations for images in the background thread."""
+        with self._lock:
+            missing = [
+                image
+                for image in images
+                if image.id not in self._annotations and image.id not in self._loading
+            ]
+
+            if not missing:
+                return
+
+            future = Future()
+            for image in missing:
+                self._loading[image.id] = future
+
+        sly.logger.debug(f"Prefetching annotations for {len(missing)} images.")
+
+        def load():
+            try:
+                self._load(api, missing, project_meta)
+            except Exception as e:
+                sly.logger.warning(f"Failed to prefetch annotations: {e}")
+            finally:
+                with self._lock:
+                    for image in missing:
+                        if self._loading.get(image.id) is future:
+                            del self._loading[image.id]
+                future.set_result(None)
+
+        self._executor.submit(load)
+
+    def invalidate(self, image_ids: List[int]) -> Dict[int, LazyAnnotation]:
+        """Removes annotations of images from the cache (e.g. after they were tagged)
+        and returns the removed annotations.
+        """
+        removed = {}
+        with self._lock:
+            for image_id in image_ids:
+                self._versions[image_id] = self._versions.get(image_id, 0) + 1
+                ann = self._annotations.pop(image_id, None)
+                if ann is not None:
+                    removed[image_id] = ann
+
+        sly.logger.debug(
+            f"Invalidated {len(image_ids)} annotations, {len(removed)} were in cache."
+        )
+
+        return removed
+
+    def update(self, anns: Dict[int, LazyAnnotation]):
+        """Puts annotations to the cache, e.g. local copies of annotations with the new tag."""
+        with self._lock:
+            for image_id, ann in anns.items():
+                self._annotations[image_id] = ann
+                self._annotations.move_to_end(image_id)
+
+            while len(self._annotations) > self.maxsize:
+                self._annotations.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._annotations.clear()
+            self._versions.clear()
+            self._epoch += 1
+
+    def _load(
+        self,
+        api: sly.Api,
+        images: List[ImageRow],
+        project_meta: sly.ProjectMeta,
+    ) -> Dict[int, LazyAnnotation]:
+        with self._lock:
+            epoch = self._epoch
+            versions = {image.id: self._versions.get(image.id) for image in images}
+
+        # Annotations are downloaded with one request for images of each dataset.
+        image_ids_by_dataset = defaultdict(list)
+        for image in images:
+            image_ids_by_dataset[image.dataset_id].append(image.id)
+
+        anns_json = {}
+        for dataset_id, image_ids in image_ids_by_dataset.items():
+            anns_json.update(
+                zip(
+                    image_ids, api.annotation.download_json_batch(dataset_id, image_ids)
+                )
+            )
+
+        sly.logger.debug(
+            f"Downloaded {len(anns_json)} annotations of {len(image_ids_by_dataset)} "
+            "datasets in JSON format."
+        )
+
+        with stage("annotation_parse"):
+            anns = {
+                image_id: LazyAnnotation(ann_json, project_meta)
+                for image_id, ann_json in anns_json.items()
+            }
+
+        with self._lock:
+            if epoch != self._epoch:
+                sly.logger.debug("Cache was cleared while annotations were downloaded.")
+                return anns
+
+            for image_id, ann in anns.items():
+                if self._versions.get(image_id) != versions[image_id]:
+                    # The image was changed while the annotation was downloaded.
+                    continue
+
+                self._annotations[image_id] = ann
+                self._annotations.move_to_end(image_id)
+
+            while len(self._annotations) > self.maxsize:
+                self._annotations.popitem(last=False)
+
+        return anns
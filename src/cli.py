@@ -0,0 +1,360 @@
+"""Headless entry point for unattended tagging, e.g. in nightly jobs.
+
+Tags all images of the datasets or the whole project (or images matching the filter) batch
+by batch without the app widgets and the web server. Progress is written to stdout as text
+or JSON lines, the run is recorded in the same journal as in the app, so it can be continued
+after a restart. Batches are claimed in the same lease table as in the app, so several runs
+(and annotators in the app) can tag the datasets at the same time without tagging the same
+batches. Exits with code 1 if some images failed and 130 if it was interrupted.
+
+Usage:
+    python -m src.cli --dataset 123 --tag reviewed --name "frame_*.jpg" --json
+    python -m src.cli --dataset 123 124 --tag reviewed
+    python -m src.cli --project 45 --tag reviewed
+    python -m src.cli --dataset 123 --tag "reviewed, quality: good|bad" --value quality=good
+    python -m src.cli --dataset 123 --tag reviewed --name "frame_*.jpg" --remove
+"""
+
+import argparse
+import json
+import os
+import signal
+import sys
+import time
+
+import supervisely as sly
+from dotenv import load_dotenv
+
+from src.filters import ImageFilter
+from src.leases import LeaseTable, session_id
+from src.tag_specs import parse_tag_metas, parse_value, run_tag_name
+import src.pipeline as pipeline
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--dataset", type=int, nargs="+", help="Dataset ids.")
+    source.add_argument(
+        "--project", type=int, help="Project id, tags all its datasets."
+    )
+    parser.add_argument(
+        "--tag",
+        required=True,
+        help=(
+            "Name of the tag to add or several tags separated with commas, tags with "
+            'values are defined as "name: value1|value2", "name: number" or '
+            '"name: text".'
+        ),
+    )
+    parser.add_argument(
+        "--value",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="Value of the tag with values, can be repeated for several tags.",
+    )
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--chunk-size", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--json", action="store_true", help="Write JSON lines.")
+    parser.add_argument(
+        "--remove",
+        action="store_true",
+        help="Remove the tags from all images matching the filter instead of adding them.",
+    )
+    parser.add_argument(
+        "--save-status",
+        action="store_true",
+        help="Save the status of tagging in the metadata of images.",
+    )
+
+    filters = parser.add_argument_group("filter")
+    filters.add_argument("--name", help="Image name or glob pattern.")
+    filters.add_argument("--with-tag", help="Only images with this tag.")
+    filters.add_argument("--without-tag", help="Only images without this tag.")
+    filters.add_argument("--meta-key", help="Key in the image metadata.")
+    filters.add_argument("--meta-value", help="Value of the metadata key.")
+    filters.add_argument("--created", nargs=2, metavar=("FROM", "TO"))
+    filters.add_argument("--updated", nargs=2, metavar=("FROM", "TO"))
+
+    return parser.parse_args(argv)
+
+
+class Reporter:
+    """Writes progress events to stdout as text lines or JSON lines."""
+
+    def __init__(self, as_json: bool):
+        self.as_json = as_json
+
+    def __call__(self, event: str, message: str, **data):
+        if self.as_json:
+            line = json.dumps({"event": event, "time": time.time(), **data})
+        else:
+            line = message
+        print(line, flush=True)
+
+
+def parse_tags(args):
+    """Returns tag metas defined with --tag and values of tags by their names from --value."""
+    try:
+        tag_metas = parse_tag_metas(args.tag)
+    except ValueError as e:
+        raise SystemExit(f"Invalid --tag: {e}")
+
+    texts = {}
+    for assignment in args.value:
+        name, separator, text = assignment.partition("=")
+        if not separator:
+            raise SystemExit(f"Invalid --value {assignment!r}, expected NAME=VALUE.")
+        texts[name.strip()] = text
+
+    if args.remove:
+        # Tags are removed regardless of their values.
+        return tag_metas, {}
+
+    try:
+        values = {
+            tag_meta.name: parse_value(tag_meta, texts.get(tag_meta.name))
+            for tag_meta in tag_metas
+        }
+    except ValueError as e:
+        raise SystemExit(f"Invalid --value: {e}")
+
+    return tag_metas, values
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    report = Reporter(args.json)
+    tag_metas, values = parse_tags(args)
+    run_name = run_tag_name(tag_metas)
+
+    if sly.is_development():
+        load_dotenv("local.env")
+        load_dotenv(os.path.expanduser("~/supervisely.env"))
+
+    api = sly.Api.from_env()
+
+    image_filter = ImageFilter(
+        name_pattern=args.name,
+        with_tag=args.with_tag,
+        without_tag=args.without_tag,
+        meta_key=args.meta_key,
+        meta_value=args.meta_value,
+        created_range=args.created,
+        updated_range=args.updated,
+    )
+
+    if args.project is not None:
+        project_id = args.project
+        dataset_ids = [dataset.id for dataset in api.dataset.get_list(project_id)]
+    else:
+        project_id = api.dataset.get_info_by_id(args.dataset[0]).project_id
+        dataset_ids = args.dataset
+    project_meta = sly.ProjectMeta.from_json(api.project.get_meta(project_id))
+
+    pages = pipeline.list_images(
+        api, dataset_ids, args.batch_size, project_meta, image_filter
+    )
+    journal, _ = pipeline.resume_run(
+        api,
+        sly.app.get_data_dir(),
+        dataset_ids,
+        run_name,
+        pages,
+        project_meta,
+        tag_names=[tag_meta.name for tag_meta in tag_metas],
+    )
+
+    if args.remove:
+        try:
+            return remove(args, api, journal, pages, run_name, report)
+        finally:
+            journal.close()
+
+    tag_metas, project_meta = pipeline.get_tag_metas(
+        api, project_id, project_meta, tag_metas
+    )
+    tag_ids = sorted(tag_meta.sly_id for tag_meta in tag_metas)
+    if pages.table.run_tag_ids != tag_ids:
+        # Tag metas were created for this run.
+        pages.table.set_run_tag_ids(tag_ids)
+
+    tags = [(tag_meta, values[tag_meta.name]) for tag_meta in tag_metas]
+
+    leases = LeaseTable.for_run(
+        sly.app.get_data_dir(),
+        dataset_ids,
+        run_name,
+        args.batch_size,
+        image_filter,
+        session=session_id(),
+    )
+
+    images_count = len(pages.table)
+    report(
+        "start",
+        f"Tagging {images_count} images of {len(dataset_ids)} datasets with tag "
+        f"{run_name}, {pages.table.tagged_count} are already tagged.",
+        datasets=dataset_ids,
+        tag=run_name,
+        images=images_count,
+        tagged=pages.table.tagged_count,
+        filter=repr(image_filter),
+    )
+
+    stop_requested = False
+
+    def request_stop(signum, frame):
+        nonlocal stop_requested
+        stop_requested = True
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    started = time.perf_counter()
+    tagged_count = 0
+    errors = {}
+
+    for page_number in pages.keys():
+        if stop_requested:
+            break
+
+        image_ids = [image.id for image in pages[page_number]]
+        if not image_ids:
+            continue
+
+        if not leases.claim(page_number):
+            report(
+                "skip",
+                f"Batch {page_number}/{len(pages)} is claimed by another session.",
+                page=page_number,
+            )
+            continue
+
+        try:
+            result = pipeline.tag_images(
+                api,
+                journal,
+                pipeline.assign_tags(image_ids, tags),
+                chunk_size=args.chunk_size,
+                concurrency=args.concurrency,
+                # The lease is renewed while the batch is tagged.
+                on_chunk=lambda tagged_chunk: leases.claim(page_number),
+                should_continue=lambda: not stop_requested,
+                page_number=page_number,
+            )
+            if args.save_status:
+                pipeline.save_statuses(
+                    api,
+                    pages,
+                    run_name,
+                    page_number,
+                    image_ids,
+                    result,
+                    concurrency=args.concurrency,
+                )
+        finally:
+            leases.release(page_number)
+
+        pages.table.mark_tagged(pages.table.rows_by_ids(result.tagged))
+        tagged_count += len(result.tagged)
+        errors.update(result.errors)
+
+        report(
+            "batch",
+            f"Batch {page_number}/{len(pages)}: tagged {len(result.tagged)}, "
+            f"failed {len(result.errors)}, "
+            f"overall {pages.table.tagged_count}/{images_count}.",
+            page=page_number,
+            pages=len(pages),
+            tagged=len(result.tagged),
+            failed=len(result.errors),
+            overall=pages.table.tagged_count,
+        )
+
+    journal.close()
+
+    elapsed = time.perf_counter() - started
+    report(
+        "summary",
+        f"Tagged {tagged_count} images in {elapsed:.1f}s "
+        f"({tagged_count / max(elapsed, 1e-9):.1f} images/s), failed {len(errors)}"
+        + (", interrupted." if stop_requested else "."),
+        tagged=tagged_count,
+        failed=len(errors),
+        failed_ids=list(errors),
+        elapsed=elapsed,
+        throughput=tagged_count / max(elapsed, 1e-9),
+        interrupted=stop_requested,
+    )
+
+    if stop_requested:
+        return 130
+    return 1 if errors else 0
+
+
+def remove(args, api, journal, pages, run_name, report) -> int:
+    """Removes tags of the run from all images matching the filter."""
+    tag_ids = pages.table.run_tag_ids
+    if not tag_ids:
+        report("summary", f"Tags {run_name} don't exist in the project.", removed=0)
+        return 0
+
+    # Tagged images are known only after all images are listed.
+    pages.cursor.load_all()
+    image_ids = pages.table.ids[pages.table.tagged].tolist()
+
+    report(
+        "start",
+        f"Removing tags {run_name} from {len(image_ids)} images.",
+        tag=run_name,
+        images=len(image_ids),
+    )
+
+    stop_requested = False
+
+    def request_stop(signum, frame):
+        nonlocal stop_requested
+        stop_requested = True
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    started = time.perf_counter()
+    result = pipeline.untag_images(
+        api,
+        journal,
+        dict.fromkeys(image_ids, tag_ids),
+        chunk_size=args.chunk_size,
+        concurrency=args.concurrency,
+        should_continue=lambda: not stop_requested,
+    )
+    if args.save_status:
+        pipeline.reset_statuses(
+            api, pages, run_name, result.tagged, concurrency=args.concurrency
+        )
+
+    elapsed = time.perf_counter() - started
+    report(
+        "summary",
+        f"Removed tags from {len(result.tagged)} images in {elapsed:.1f}s, "
+        f"failed {len(result.errors)}" + (", interrupted." if stop_requested else "."),
+        removed=len(result.tagged),
+        failed=len(result.errors),
+        failed_ids=list(result.errors),
+        elapsed=elapsed,
+        interrupted=stop_requested,
+    )
+
+    if stop_requested:
+        return 130
+    return 1 if result.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
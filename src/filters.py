@@ -0,0 +1,211 @@
+import datetime
+import fnmatch
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import supervisely as sly
+from supervisely.api.module_api import ApiField
+
+# Characters, which make the name pattern a glob pattern instead of the exact name.
+GLOB_CHARACTERS = "*?["
+
+
+class ImageFilter:
+    """Set of predicates, which select images from the dataset for tagging.
+    Predicates supported by the server (created/updated range, exact name, name substring
+    and tags) are sent with the listing request, so the server returns only matching images.
+    Predicates which can't be sent to the server (glob name patterns and image metadata)
+    are applied locally to each page of the listing with NumPy masks, in this case the
+    dataset is scanned once and only matching images are stored.
+
+    :param name_pattern: exact name of the image or glob pattern, e.g. "frame_*.jpg".
+    :param with_tag: name of the tag, which images must have.
+    :param without_tag: name of the tag, which images must not have.
+    :param meta_key: key, which must be in the image metadata.
+    :param meta_value: optional value of meta_key, compared as a string.
+    :param created_range: pair of ISO dates or datetimes, images created between them are
+        selected, the end date without time (or at midnight) includes the whole day.
+    :param updated_range: pair of ISO dates or datetimes, images updated between them are
+        selected, like the created_range.
+    """
+
+    def __init__(
+        self,
+        name_pattern: Optional[str] = None,
+        with_tag: Optional[str] = None,
+        without_tag: Optional[str] = None,
+        meta_key: Optional[str] = None,
+        meta_value: Optional[Any] = None,
+        created_range: Optional[List[str]] = None,
+        updated_range: Optional[List[str]] = None,
+    ):
+        self.name_pattern = name_pattern or None
+        self.with_tag = with_tag or None
+        self.without_tag = without_tag or None
+        self.meta_key = meta_key or None
+        self.meta_value = meta_value
+        self.created_range = created_range
+        self.updated_range = updated_range
+
+        self._name_regex = None
+        if self.is_glob:
+            self._name_regex = re.compile(fnmatch.translate(self.name_pattern))
+
+    @property
+    def is_glob(self) -> bool:
+        return self.name_pattern is not None and any(
+            character in self.name_pattern for character in GLOB_CHARACTERS
+        )
+
+    @property
+    def is_empty(self) -> bool:
+        return not any(
+            [
+                self.name_pattern,
+                self.with_tag,
+                self.without_tag,
+                self.meta_key,
+                self.created_range,
+                self.updated_range,
+            ]
+        )
+
+    @property
+    def needs_local_scan(self) -> bool:
+        """Checks if some predicates can't be applied on the server."""
+        return self.is_glob or self.meta_key is not None
+
+    def server_params(self, project_meta: sly.ProjectMeta) -> Optional[Dict]:
+        """Returns filters for the "images.list" request or None, if the filter can't
+        match any image (e.g. the required tag doesn't exist in the project).
+        """
+        field_filters = []
+        typed_filters = []
+
+        for field, date_range in (
+            (ApiField.CREATED_AT, self.created_range),
+            (ApiField.UPDATED_AT, self.updated_range),
+        ):
+            if date_range:
+                end_operator, end = _range_end(date_range[1])
+                field_filters.append(
+                    {"field": field, "operator": ">=", "value": date_range[0]}
+                )
+                field_filters.append(
+                    {"field": field, "operator": end_operator, "value": end}
+                )
+
+        if self.name_pattern is not None and not self.is_glob:
+            field_filters.append(
+                {"field": ApiField.NAME, "operator": "=", "value": self.name_pattern}
+            )
+        elif self.is_glob:
+            # The longest literal part of the pattern narrows the listing on the server,
+            # the pattern itself is checked locally.
+            literal = max(re.split(r"[*?]|\[.*?\]", self.name_pattern), key=len)
+            if literal:
+                typed_filters.append(
+                    {"type": "images_filename", "data": {"value": literal}}
+                )
+
+        for tag_name, include in ((self.with_tag, True), (self.without_tag, False)):
+            if tag_name is None:
+                continue
+
+            tag_meta = project_meta.get_tag_meta(tag_name)
+            if tag_meta is None:
+                if include:
+                    sly.logger.warning(
+                        f"Tag {tag_name} doesn't exist in the project, no images match the filter."
+                    )
+                    return None
+                continue
+
+            typed_filters.append(
+                {
+                    "type": "images_tag",
+                    "data": {"tagId": tag_meta.sly_id, "include": include},
+                }
+            )
+
+        params = {}
+        if field_filters:
+            params[ApiField.FILTER] = field_filters
+        if typed_filters:
+            params[ApiField.FILTERS] = typed_filters
+
+        sly.logger.debug(f"Server filters for listing: {params}.")
+
+        return params
+
+    def local_mask(self, image_infos: List[sly.ImageInfo]) -> np.ndarray:
+        """Returns the boolean mask of images matching predicates, which are not applied
+        on the server.
+        """
+        mask = np.ones(len(image_infos), dtype=np.bool_)
+
+        if self.is_glob:
+            mask &= np.fromiter(
+                (
+                    self._name_regex.match(image_info.name) is not None
+                    for image_info in image_infos
+                ),
+                dtype=np.bool_,
+                count=len(image_infos),
+            )
+
+        if self.meta_key is not None and self.meta_value is None:
+            mask &= np.fromiter(
+                (
+                    self.meta_key in (image_info.meta or {})
+                    for image_info in image_infos
+                ),
+                dtype=np.bool_,
+                count=len(image_infos),
+            )
+        elif self.meta_key is not None:
+            # Images without the key don't match any value, even the "None" string.
+            meta_value = str(self.meta_value)
+            mask &= np.fromiter(
+                (
+                    self.meta_key in (image_info.meta or {})
+                    and str(image_info.meta[self.meta_key]) == meta_value
+                    for image_info in image_infos
+                ),
+                dtype=np.bool_,
+                count=len(image_infos),
+            )
+
+        return mask
+
+    def __repr__(self):
+        predicates = {
+            key: value
+            for key, value in vars(self).items()
+            if not key.startswith("_") and value is not None
+        }
+        return f"ImageFilter({predicates})"
+
+
+def _range_end(value: str) -> Tuple[str, str]:
+    """Returns the operator and the value for the end of the date range. Date pickers and
+    users give the end as the date or its midnight, so the end is moved to the start of the
+    next day and compared with "<" to include images of the whole end day. Other datetimes
+    are compared with "<=".
+    """
+    try:
+        if len(value) == 10:
+            end = datetime.date.fromisoformat(value)
+            return "<", (end + datetime.timedelta(days=1)).isoformat()
+
+        end = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return "<=", value
+
+    if end.time() != datetime.time():
+        return "<=", value
+
+    # Only the date is replaced to keep the format of the time and the timezone.
+    next_day = end.date() + datetime.timedelta(days=1)
+    return "<", next_day.isoformat() + value[10:]
@@ -1,21 +1,114 @@
 import os
+import threading
+from array import array
 
 import supervisely as sly
 
 from dotenv import load_dotenv
+from supervisely.app import DataJson, StateJson
+
+from src.annotations import AnnotationCache
+from src.info_cache import InfoCache
+from src.leases import session_id
+from src.metrics import instrument_api
+from src.previews import PreviewCache
 
 if sly.is_development():
     load_dotenv("local.env")
     load_dotenv(os.path.expanduser("~/supervisely.env"))
 
-api: sly.Api = sly.Api.from_env()
+# The API and the static directory are created on the first use, not at import, so the app
+# starts without waiting for them: g.api is created by get_api on the first access (see
+# __getattr__) and the static directory is created by init_static_dir with the app.
+api: sly.Api
+_api_lock = threading.Lock()
+
+
+def get_api() -> sly.Api:
+    """Returns the API of the app and creates it on the first call. Calls of the API are
+    recorded in src.metrics.METRICS, which are exposed on /metrics.
+    """
+    with _api_lock:
+        if "api" not in globals():
+            globals()["api"] = instrument_api(sly.Api.from_env())
+            sly.logger.debug("Created the API of the app.")
+        return globals()["api"]
+
+
+def __getattr__(name: str):
+    # Called only for names, which aren't set yet, g.api = ... replaces the lazy API.
+    if name == "api":
+        return get_api()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Syncs of widgets are queued until the app is created, see serialize_widget_sync.
+_widget_sync_lock = threading.Lock()
+_widget_sync_started = False
+_queued_syncs = []
+
+
+def serialize_widget_sync():
+    """Makes changes of widgets to be sent to the browser by one thread at a time.
+    Widgets are updated by the tagging jobs and the background listing, while the SDK
+    guards the sync with an asyncio lock, which is bound to the event loop of the first
+    sync, so concurrent syncs from different threads fail or hang. The SDK has no hook for
+    it, so send_changes of the shared DataJson and StateJson is wrapped.
+
+    Syncs requested while the UI modules are imported are queued, since no browser is
+    connected yet and each sync runs its own event loop in a new thread: each content is
+    synced once by start_widget_sync. Changes are computed as the difference with the last
+    sent content, so one queued sync sends all changes made before it.
+    """
+    for content in (DataJson(), StateJson()):
+
+        def send_changes(send_changes=content.send_changes):
+            with _widget_sync_lock:
+                if not _widget_sync_started:
+                    if send_changes not in _queued_syncs:
+                        _queued_syncs.append(send_changes)
+                    return
+                send_changes()
+
+        content.send_changes = send_changes
+
+
+def start_widget_sync():
+    """Sends the queued syncs of widgets and starts sending changes to the browser at once,
+    called when the app is created.
+    """
+    global _widget_sync_started
+
+    with _widget_sync_lock:
+        _widget_sync_started = True
+        queued = _queued_syncs[:]
+        _queued_syncs.clear()
+
+        for send_changes in queued:
+            send_changes()
+
+    sly.logger.debug(f"Started syncs of widgets, sent {len(queued)} queued syncs.")
+
+
+serialize_widget_sync()
 
 SLY_APP_DATA_DIR = sly.app.get_data_dir()
 ABSOLUTE_PATH = os.path.dirname(__file__)
 
-# Defining the path to the directory where the images will be saved and creating it if it doesn't exist.
+# Defining the path to the directory where the images will be saved, see init_static_dir.
 STATIC_DIR = os.path.join(SLY_APP_DATA_DIR, "static")
-os.makedirs(STATIC_DIR, exist_ok=True)
+
+# Resized previews of images shown in the galleries, the static directory is served on /static.
+PREVIEWS_DIR = os.path.join(STATIC_DIR, "previews")
+
+
+def init_static_dir() -> str:
+    """Creates the static directory served on /static and starts restoring the cache
+    of previews in it, called when the app is created.
+    """
+    os.makedirs(STATIC_DIR, exist_ok=True)
+    STATE.previews.start()
+    return STATIC_DIR
 
 
 class State:
@@ -24,30 +117,86 @@ class State:
         self.selected_workspace = sly.io.env.workspace_id()
         self.selected_project = sly.io.env.project_id(raise_not_found=False)
         self.selected_dataset = sly.io.env.dataset_id(raise_not_found=False)
+        # Datasets tagged in one run, the first one is selected_dataset.
+        self.selected_datasets = (
+            [self.selected_dataset] if self.selected_dataset is not None else []
+        )
 
         self.batch_size = None
+        # Name of the run, the name of the tag if the run adds one tag.
         self.new_tag_name = None
+        # Tags, which are added to images, see src.tag_specs.
+        self.tag_metas = []
         self.automatic_tagging = None
+        # If True, batches are groups of similar images, see src.grouping.
+        self.group_similar = None
+        # If True, statuses of images are saved in their metadata, see src.status.
+        self.save_status = None
+        self.write_chunk_size = None
+        self.write_concurrency = None
+
+        # Filter of images to tag, see src.filters.ImageFilter.
+        self.image_filter = None
 
-        self.image_infos = []
+        self.images_count = 0
+
+        # Compact table with all listed images of the datasets, see src.image_table.ImageTable.
+        self.images = None
 
         self.project_meta = None
 
-        self.pages = {}
+        # Infos of the selected team, workspace, project and datasets and the project meta,
+        # shared by all widgets, see src.info_cache.InfoCache.
+        self.infos = InfoCache(ttl=60)
+
+        # Annotations of images, which were recently shown or prefetched, they are kept
+        # as lazy views, see src.annotations.LazyAnnotation.
+        self.annotations = AnnotationCache(maxsize=1000)
+
+        # Previews of images shown in the galleries, stored in the static directory.
+        self.previews = PreviewCache(PREVIEWS_DIR, static_url="static/previews")
+
+        # Lazy view of the dataset split into batches, see src.listing.Pages.
+        self.pages = None
 
         self.current_page_number = None
 
-        self.tagged_images = []
+        # Page of the processed images gallery, which shows batch_size tagged images.
+        self.processed_page_number = 1
+
+        # Rows of the images table in the order of tagging.
+        self.tagged_images = array("q")
+        # Rows of images, which were skipped or failed, from their statuses in the metadata.
+        self.skipped_images = set()
+        self.error_images = set()
+
+        # On-disk journal of the tagging run, see src.journal.TaggingJournal.
+        self.journal = None
+
+        # Widgets are shared by all users of the app, so each annotator runs its own session
+        # of the app, sessions claim pages in the shared table, see src.leases.LeaseTable.
+        self.session_id = session_id()
+        self.leases = None
+
+        # Images of the current batch, which is topped up with the next images when its
+        # images are tagged, see src.listing.WorkQueue.
+        self.batch = None
+        # Tags assigned to images of the current batch, which aren't written yet: names and
+        # values of tags by image ids.
+        self.assignments = {}
 
-        self.continue_tagging = True
+        # Guards pages and tagged images, which are changed by the background tagging jobs
+        # while the user navigates between pages.
+        self.lock = threading.RLock()
 
     def save_project_meta(self):
         sly.logger.debug(
             f"Trying to receive project meta from the API for project ID {self.selected_project}."
         )
 
-        project_meta_json = api.project.get_meta(self.selected_project)
-        self.project_meta = sly.ProjectMeta.from_json(project_meta_json)
+        # The meta is requested only if it isn't in the cache, e.g. when settings are saved
+        # again without changes of the project.
+        self.project_meta = self.infos.project_meta(get_api(), self.selected_project)
 
         sly.logger.debug("Readed project meta and saved it in the global state.")
 
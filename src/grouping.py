@@ -0,0 +1,240 @@
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+import numpy as np
+import supervisely as sly
+from PIL import Image
+
+from src.image_table import ImageRow, ImageTable
+from src.metrics import stage
+from src.previews import PreviewCache
+
+# Embeddings are colour histograms with HISTOGRAM_BINS bins per channel and the layout of
+# brightness on the LAYOUT_SIZE x LAYOUT_SIZE grid, computed from the downscaled preview.
+HISTOGRAM_BINS = 4
+LAYOUT_SIZE = 4
+LAYOUT_WEIGHT = 0.5
+EMBEDDING_SIZE = HISTOGRAM_BINS**3 + LAYOUT_SIZE**2
+
+# Size of the image the embedding is computed from, JPEG previews are decoded at a reduced
+# scale close to it.
+EMBEDDING_IMAGE_SIZE = 32
+
+
+def embed_image(content: bytes) -> np.ndarray:
+    """Returns the embedding of the encoded image: square roots of the joint RGB histogram,
+    so the Euclidean distance between embeddings is the Hellinger distance of histograms,
+    and the coarse brightness layout, which separates images with the same colours.
+    """
+    image = Image.open(io.BytesIO(content))
+    image.draft("RGB", (EMBEDDING_IMAGE_SIZE * 2, EMBEDDING_IMAGE_SIZE * 2))
+    image = image.convert("RGB").resize(
+        (EMBEDDING_IMAGE_SIZE, EMBEDDING_IMAGE_SIZE), Image.BILINEAR
+    )
+    pixels = np.asarray(image, dtype=np.uint8)
+
+    quantized = (pixels // (256 // HISTOGRAM_BINS)).astype(np.int64)
+    codes = (
+        quantized[..., 0] * HISTOGRAM_BINS + quantized[..., 1]
+    ) * HISTOGRAM_BINS + quantized[..., 2]
+    histogram = np.bincount(codes.ravel(), minlength=HISTOGRAM_BINS**3) / codes.size
+
+    cell = EMBEDDING_IMAGE_SIZE // LAYOUT_SIZE
+    layout = (
+        pixels.mean(axis=2)
+        .reshape(LAYOUT_SIZE, cell, LAYOUT_SIZE, cell)
+        .mean(axis=(1, 3))
+        / 255
+    )
+
+    return np.concatenate([np.sqrt(histogram), layout.ravel() * LAYOUT_WEIGHT]).astype(
+        np.float32
+    )
+
+
+class EmbeddingStore:
+    """Embeddings of images on the disk, one file per dataset in the app data directory,
+    so images are embedded once and grouping is repeated without downloading previews.
+    Embeddings are stored with ids and hashes of images, the embedding is computed again
+    if the image was changed.
+
+    :param directory: directory for the files of embeddings.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def lookup(
+        self, dataset_id: int, images: List[ImageRow]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns embeddings of images and the mask of images, which were found."""
+        vectors = np.zeros((len(images), EMBEDDING_SIZE), dtype=np.float32)
+        found = np.zeros(len(images), dtype=np.bool_)
+
+        ids, hashes, stored = self._read(dataset_id)
+        if len(ids) == 0 or len(images) == 0:
+            return vectors, found
+
+        image_ids = np.array([image.id for image in images], dtype=np.int64)
+        positions = np.minimum(np.searchsorted(ids, image_ids), len(ids) - 1)
+        image_hashes = np.array([image.hash or "" for image in images])
+        found = (ids[positions] == image_ids) & (hashes[positions] == image_hashes)
+        vectors[found] = stored[positions[found]]
+
+        return vectors, found
+
+    def save(self, dataset_id: int, images: List[ImageRow], vectors: np.ndarray):
+        """Adds embeddings of images to the file of the dataset."""
+        ids, hashes, stored = self._read(dataset_id)
+
+        new_ids = np.array([image.id for image in images], dtype=np.int64)
+        keep = ~np.isin(ids, new_ids)
+        ids = np.concatenate([ids[keep], new_ids])
+        hashes = np.concatenate(
+            [hashes[keep], np.array([image.hash or "" for image in images])]
+        )
+        stored = np.concatenate([stored[keep], vectors.astype(np.float32)])
+
+        order = np.argsort(ids, kind="stable")
+
+        path = self._path(dataset_id)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, ids=ids[order], hashes=hashes[order], vectors=stored[order])
+        os.replace(tmp_path, path)
+
+        sly.logger.debug(
+            f"Saved {len(images)} embeddings, {len(ids)} embeddings of dataset "
+            f"{dataset_id} are stored."
+        )
+
+    def _read(self, dataset_id: int):
+        try:
+            with np.load(self._path(dataset_id)) as data:
+                return data["ids"], data["hashes"], data["vectors"]
+        except (FileNotFoundError, ValueError, KeyError):
+            return (
+                np.zeros(0, dtype=np.int64),
+                np.zeros(0, dtype="<U1"),
+                np.zeros((0, EMBEDDING_SIZE), dtype=np.float32),
+            )
+
+    def _path(self, dataset_id: int) -> str:
+        return os.path.join(self.directory, f"dataset_{dataset_id}.npz")
+
+
+def compute_embeddings(
+    api: sly.Api,
+    previews: PreviewCache,
+    images: List[ImageRow],
+    max_workers: int = 8,
+) -> np.ndarray:
+    """Downloads previews of images (or reads them from the cache) and embeds them, images,
+    which failed to download or decode, get zero embeddings and are grouped together.
+    """
+
+    def embed(image: ImageRow) -> np.ndarray:
+        try:
+            return embed_image(previews.read(api, image))
+        except Exception as e:
+            sly.logger.warning(f"Failed to embed image {image.id}: {e}")
+            return np.zeros(EMBEDDING_SIZE, dtype=np.float32)
+
+    with stage("embedding"):
+        with ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="embedding"
+        ) as executor:
+            vectors = list(executor.map(embed, images))
+
+    return np.stack(vectors) if vectors else np.zeros((0, EMBEDDING_SIZE), np.float32)
+
+
+def order_by_similarity(
+    vectors: np.ndarray, per_page: int, iterations: int = 8, seed: int = 0
+) -> np.ndarray:
+    """Returns the order of vectors, in which each page of per_page vectors is a cluster of
+    similar vectors. Vectors are split with bisecting 2-means until parts fit one page,
+    the boundary of each split is moved to the nearest page boundary, so clusters are never
+    split between pages, and parts are ordered depth-first, so neighbour pages are similar.
+    Each step is vectorised over all vectors of the part, so it scales to large datasets
+    unlike k-means with a cluster per page. The order is deterministic, so all sessions
+    of the app get the same pages.
+    """
+    rng = np.random.default_rng(seed)
+    order = []
+    parts = [np.arange(len(vectors))]
+
+    while parts:
+        indexes = parts.pop()
+        if len(indexes) <= per_page:
+            order.append(indexes)
+            continue
+
+        part = vectors[indexes]
+
+        # The first centre is the farthest vector from a random one, the second is the
+        # farthest vector from the first one.
+        first = part[np.argmax(((part - part[rng.integers(len(part))]) ** 2).sum(1))]
+        second = part[np.argmax(((part - first) ** 2).sum(1))]
+
+        for _ in range(iterations):
+            # Difference of squared distances to the centres, negative if the vector is
+            # closer to the first centre.
+            score = part @ (2 * (second - first)) + (first @ first - second @ second)
+            closer = score < 0
+            if closer.all() or not closer.any():
+                break
+            first, second = part[closer].mean(0), part[~closer].mean(0)
+
+        score = part @ (2 * (second - first)) + (first @ first - second @ second)
+        sorted_indexes = indexes[np.argsort(score, kind="stable")]
+
+        pages = (len(indexes) + per_page - 1) // per_page
+        first_pages = min(
+            max(int(round(np.count_nonzero(score < 0) / per_page)), 1), pages - 1
+        )
+        split = first_pages * per_page
+
+        # The second part is popped after the first one is ordered.
+        parts.append(sorted_indexes[split:])
+        parts.append(sorted_indexes[:split])
+
+    return np.concatenate(order) if order else np.zeros(0, dtype=np.int64)
+
+
+def group_table(
+    api: sly.Api,
+    table: ImageTable,
+    previews: PreviewCache,
+    store: EmbeddingStore,
+    max_workers: int = 8,
+):
+    """Orders rows of each dataset in the table by similarity of their previews, so pages
+    of the table are groups of similar images. All rows must be loaded to the table.
+    """
+    segment_ends = np.append(table.segment_starts[1:], len(table))
+    order = np.arange(len(table), dtype=np.int64)
+
+    for dataset_id, start, end in zip(
+        table.segment_dataset_ids, table.segment_starts, segment_ends
+    ):
+        images = table.get_rows(range(start, end))
+
+        vectors, found = store.lookup(int(dataset_id), images)
+        missing = [image for image, is_found in zip(images, found) if not is_found]
+
+        sly.logger.info(
+            f"Grouping {len(images)} images of dataset {dataset_id}, "
+            f"{len(missing)} of them will be embedded."
+        )
+
+        if missing:
+            vectors[~found] = compute_embeddings(api, previews, missing, max_workers)
+            store.save(int(dataset_id), missing, vectors[~found])
+
+        with stage("grouping"):
+            order[start:end] = start + order_by_similarity(vectors, table.per_page)
+
+    table.set_order(order)
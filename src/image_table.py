@@ -0,0 +1,572 @@
+import json
+import threading
+from collections import namedtuple
+from itertools import chain
+from typing import Callable, Iterable, List, Optional
+
+import numpy as np
+import supervisely as sly
+
+from src.previews import thumbnail_url
+
+# Lightweight view of one row of the table, created only for images on the visible page.
+ImageRow = namedtuple(
+    "ImageRow", ["row", "id", "name", "preview_url", "hash", "dataset_id"]
+)
+
+
+class StringColumn:
+    """Column of strings stored as UTF-8 bytes in one contiguous buffer with offsets
+    and lengths of each row in NumPy arrays, so a string costs its length plus 12 bytes
+    instead of a separate Python object and a list slot for each row.
+    """
+
+    def __init__(self, capacity: int):
+        self._buffer = bytearray()
+        self.offsets = np.zeros(capacity, dtype=np.int64)
+        self.lengths = np.full(capacity, -1, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, row: int) -> Optional[str]:
+        length = self.lengths[row]
+        if length < 0:
+            return None
+
+        offset = self.offsets[row]
+        return self._buffer[offset : offset + length].decode("utf-8")
+
+    def set_many(self, start: int, values: List[Optional[str]]):
+        encoded = [b"" if value is None else value.encode("utf-8") for value in values]
+        lengths = np.fromiter((len(value) for value in encoded), dtype=np.int32)
+
+        end = start + len(encoded)
+        self.offsets[start:end] = len(self._buffer) + np.concatenate(
+            ([0], np.cumsum(lengths[:-1], dtype=np.int64))
+        )
+        self.lengths[start:end] = [
+            -1 if value is None else length for value, length in zip(values, lengths)
+        ]
+        self._buffer += b"".join(encoded)
+
+    def copy_from(self, source: "StringColumn", start: int):
+        """Copies all rows of the source column to rows from start."""
+        end = start + len(source)
+        self.lengths[start:end] = source.lengths
+        self.offsets[start:end] = len(self._buffer) + source.offsets
+        self._buffer += source._buffer
+
+    def resize(self, capacity: int):
+        extra = max(capacity - len(self), 0)
+        self.offsets = np.concatenate(
+            [self.offsets[:capacity], np.zeros(extra, dtype=np.int64)]
+        )
+        self.lengths = np.concatenate(
+            [self.lengths[:capacity], np.full(extra, -1, dtype=np.int32)]
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._buffer) + self.offsets.nbytes + self.lengths.nbytes
+
+
+class IdListColumn:
+    """Column of short lists of integer ids (e.g. ids of tags of the image) stored in one
+    flat NumPy buffer with offsets and lengths of each row, like the StringColumn.
+    """
+
+    def __init__(self, capacity: int):
+        # The buffer is grown by doubling, only the first _size values are used.
+        self._values = np.zeros(16, dtype=np.int64)
+        self._size = 0
+        self.offsets = np.zeros(capacity, dtype=np.int64)
+        self.lengths = np.zeros(capacity, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, row: int) -> List[int]:
+        offset = self.offsets[row]
+        return self._values[offset : offset + self.lengths[row]].tolist()
+
+    def set_many(self, start: int, values: List[List[int]]):
+        lengths = np.fromiter((len(ids) for ids in values), dtype=np.int32)
+
+        end = start + len(values)
+        self.lengths[start:end] = lengths
+        self.offsets[start:end] = self._size + np.concatenate(
+            ([0], np.cumsum(lengths[:-1], dtype=np.int64))
+        )
+
+        flat = np.fromiter(chain.from_iterable(values), dtype=np.int64)
+        size = self._size + len(flat)
+        if size > len(self._values):
+            self._values = np.resize(self._values, max(size, 2 * len(self._values)))
+
+        self._values[self._size : size] = flat
+        self._size = size
+
+    def copy_from(self, source: "IdListColumn", start: int):
+        """Copies all rows of the source column to rows from start."""
+        end = start + len(source)
+        self.lengths[start:end] = source.lengths
+        self.offsets[start:end] = self._size + source.offsets
+
+        size = self._size + source._size
+        if size > len(self._values):
+            self._values = np.resize(self._values, max(size, 2 * len(self._values)))
+
+        self._values[self._size : size] = source._values[: source._size]
+        self._size = size
+
+    def rows_containing(
+        self, values: List[int], start: int = 0, end: Optional[int] = None
+    ) -> np.ndarray:
+        """Returns rows between start and end, which lists contain any of the values."""
+        end = len(self) if end is None else end
+        lengths = self.lengths[start:end].astype(np.int64)
+
+        # Position of each value of the rows in the flat buffer and the row it belongs to.
+        rows = np.repeat(np.arange(start, end), lengths)
+        first_positions = np.cumsum(lengths) - lengths
+        positions = np.repeat(self.offsets[start:end] - first_positions, lengths)
+        positions += np.arange(len(positions))
+
+        return np.unique(rows[np.isin(self._values[positions], values)])
+
+    def resize(self, capacity: int):
+        extra = max(capacity - len(self), 0)
+        self.offsets = np.concatenate(
+            [self.offsets[:capacity], np.zeros(extra, dtype=np.int64)]
+        )
+        self.lengths = np.concatenate(
+            [self.lengths[:capacity], np.zeros(extra, dtype=np.int32)]
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return self._values.nbytes + self.offsets.nbytes + self.lengths.nbytes
+
+
+class ImageTable:
+    """Array-backed table with compact metadata of all images in the dataset.
+    Rows are stored in the listing order (sorted by name), so the row of the image is its
+    position in the dataset and the page of the image is computed from its row. Ids and
+    tagged flags are stored in NumPy columns, names, hashes and URLs of previews resized to
+    the gallery column (see src.previews) in string columns. Metadata of images is stored
+    as JSON only for images, which have it (e.g. statuses of tagging, see src.status).
+
+    Lookups by id and by name use sorted NumPy indexes (ids and hashes of names) with
+    binary search, which are rebuilt lazily after new rows were loaded, so they cost 16
+    bytes per image instead of two dictionary entries with boxed integers. Rows are filled
+    lazily, when the page of the listing with them is fetched from the server.
+
+    Images of several datasets are stored one dataset after another, the table is split
+    into segments of datasets with set_segments. Pages don't cross the segments, so the
+    annotations of the page are downloaded and its images are tagged within one dataset.
+    Pages are consecutive rows by default, set_order replaces it with the order of rows,
+    e.g. with similar images on the same page (see src.grouping).
+
+    :param capacity: number of images in the dataset.
+    :param per_page: number of images on one page.
+    :param dataset_id: id of the dataset of images, if the table has one segment.
+    """
+
+    def __init__(self, capacity: int, per_page: int, dataset_id: Optional[int] = None):
+        self.per_page = per_page
+
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.tagged = np.zeros(capacity, dtype=np.bool_)
+        self.loaded = np.zeros(capacity, dtype=np.bool_)
+
+        self.names = StringColumn(capacity)
+        self.preview_urls = StringColumn(capacity)
+        self.hashes = StringColumn(capacity)
+        self.metas = StringColumn(capacity)
+        self._name_hashes = np.zeros(capacity, dtype=np.int64)
+
+        # Pairs of loaded rows sorted by the indexed column and the sorted column values.
+        self._id_index = (None, None)
+        self._name_index = (None, None)
+
+        # Sorted ids of images known to be tagged (e.g. from the journal), which are not
+        # loaded to the table yet, they are marked as tagged when their rows are loaded.
+        self._pending_tagged = np.zeros(0, dtype=np.int64)
+
+        # Ids of tags, which are added to images, images with any of them are skipped.
+        self.run_tag_ids = []
+        self.tag_ids = IdListColumn(capacity)
+        # Optional callback, called with rows of images found tagged while rows are loaded.
+        self.on_tagged: Optional[Callable[[List[int]], None]] = None
+
+        # First rows of the datasets and their ids, pages are computed lazily from them.
+        self.segment_starts = np.zeros(1, dtype=np.int64)
+        self.segment_dataset_ids = np.array([dataset_id or 0], dtype=np.int64)
+        self._page_bounds = None
+
+        # Optional order of rows on pages and the position of each row in the order.
+        self.order: Optional[np.ndarray] = None
+        self._positions: Optional[np.ndarray] = None
+
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def pages_count(self) -> int:
+        return len(self._get_page_bounds()[0])
+
+    def set_segments(self, dataset_ids: List[int], sizes: List[int]):
+        """Splits rows of the table into consecutive datasets with sizes images."""
+        with self._lock:
+            self.segment_dataset_ids = np.array(dataset_ids, dtype=np.int64)
+            self.segment_starts = np.concatenate(
+                ([0], np.cumsum(sizes[:-1], dtype=np.int64))
+            ).astype(np.int64)
+            self._page_bounds = None
+
+    def dataset_of(self, rows) -> np.ndarray:
+        """Returns ids of datasets of the rows."""
+        segments = np.searchsorted(self.segment_starts, rows, side="right") - 1
+        return self.segment_dataset_ids[segments]
+
+    @property
+    def tagged_count(self) -> int:
+        return int(np.count_nonzero(self.tagged)) + len(self._pending_tagged)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the columns and indexes of the table."""
+        indexes = sum(
+            rows.nbytes + values.nbytes
+            for rows, values in (self._id_index, self._name_index)
+            if rows is not None
+        )
+        return (
+            self.ids.nbytes
+            + self.tagged.nbytes
+            + self.loaded.nbytes
+            + self._name_hashes.nbytes
+            + self.names.nbytes
+            + self.preview_urls.nbytes
+            + self.hashes.nbytes
+            + self.metas.nbytes
+            + self.tag_ids.nbytes
+            + indexes
+            + (
+                self.order.nbytes + self._positions.nbytes
+                if self.order is not None
+                else 0
+            )
+        )
+
+    def set_rows(self, start: int, image_infos: List[sly.ImageInfo]):
+        """Fills rows starting from start with the data of images from the listing.
+        Images, which already have any tag of run_tag_ids or are known to be tagged, are marked
+        as tagged and their rows are passed to on_tagged.
+        """
+        if not image_infos:
+            return
+
+        with self._lock:
+            end = start + len(image_infos)
+            if end > len(self):
+                # New images were added to the dataset after the first page was listed.
+                self._resize(end)
+
+            names = [image_info.name for image_info in image_infos]
+
+            self.ids[start:end] = [image_info.id for image_info in image_infos]
+            self._name_hashes[start:end] = [hash(name) for name in names]
+            self.names.set_many(start, names)
+            self.preview_urls.set_many(
+                start, [thumbnail_url(image_info) for image_info in image_infos]
+            )
+            self.hashes.set_many(
+                start, [image_info.hash or "" for image_info in image_infos]
+            )
+            self.metas.set_many(
+                start,
+                [
+                    json.dumps(image_info.meta) if image_info.meta else None
+                    for image_info in image_infos
+                ],
+            )
+            self.tag_ids.set_many(
+                start,
+                [
+                    [tag["tagId"] for tag in image_info.tags or []]
+                    for image_info in image_infos
+                ],
+            )
+            self.loaded[start:end] = True
+
+            was_tagged = self.tagged[start:end].copy()
+
+            if self.run_tag_ids:
+                self.tagged[
+                    self.tag_ids.rows_containing(self.run_tag_ids, start, end)
+                ] = True
+
+            if len(self._pending_tagged) > 0:
+                pending = np.isin(self.ids[start:end], self._pending_tagged)
+                self.tagged[start:end] |= pending
+                self._pending_tagged = np.setdiff1d(
+                    self._pending_tagged, self.ids[start:end][pending]
+                )
+
+            tagged_rows = start + np.flatnonzero(self.tagged[start:end] & ~was_tagged)
+
+            self._id_index = (None, None)
+            self._name_index = (None, None)
+
+        if len(tagged_rows) > 0 and self.on_tagged is not None:
+            self.on_tagged(tagged_rows.tolist())
+
+    def set_run_tag_ids(self, tag_ids: List[int]) -> List[int]:
+        """Sets ids of tags, which are added to images. Loaded images, which already have
+        any of these tags, are marked as tagged and their rows are returned, images which
+        are loaded later are marked in set_rows.
+        """
+        with self._lock:
+            self.run_tag_ids = sorted(tag_ids)
+
+            rows = self.tag_ids.rows_containing(self.run_tag_ids)
+            rows = rows[self.loaded[rows] & ~self.tagged[rows]]
+            self.tagged[rows] = True
+
+        sly.logger.debug(f"Found {len(rows)} loaded images with tag ids {tag_ids}.")
+
+        return rows.tolist()
+
+    def row_by_id(self, image_id: int) -> Optional[int]:
+        rows = self.rows_by_ids([image_id])
+        return rows[0] if rows else None
+
+    def row_by_name(self, name: str, dataset_id: Optional[int] = None) -> Optional[int]:
+        """Returns the row of the image with the name, names are unique only within a
+        dataset, so the first match is returned unless the dataset_id is given.
+        """
+        with self._lock:
+            if self._name_index[0] is None:
+                self._name_index = self._build_index(self._name_hashes)
+            index, sorted_hashes = self._name_index
+
+        name_hash = hash(name)
+        position = np.searchsorted(sorted_hashes, name_hash)
+
+        # Checking all rows with the same hash, collisions are possible.
+        while position < len(index) and sorted_hashes[position] == name_hash:
+            row = int(index[position])
+            if self.names[row] == name and (
+                dataset_id is None or self.dataset_of(row) == dataset_id
+            ):
+                return row
+            position += 1
+
+        return None
+
+    def rows_by_ids(self, image_ids: Iterable[int]) -> List[int]:
+        """Returns rows of images in the same order, unknown ids are skipped."""
+        with self._lock:
+            if self._id_index[0] is None:
+                self._id_index = self._build_index(self.ids)
+            index, sorted_ids = self._id_index
+
+        image_ids = np.fromiter(image_ids, dtype=np.int64)
+        if len(index) == 0 or len(image_ids) == 0:
+            return []
+
+        positions = np.searchsorted(sorted_ids, image_ids)
+        positions = np.minimum(positions, len(index) - 1)
+        found = sorted_ids[positions] == image_ids
+
+        return index[positions[found]].tolist()
+
+    def set_tagged_ids(self, image_ids: Iterable[int]) -> List[int]:
+        """Marks images as tagged by their ids, images which are not loaded yet are marked
+        when their rows are loaded. Returns rows of the loaded images.
+        """
+        image_ids = np.unique(np.fromiter(image_ids, dtype=np.int64))
+        with self._lock:
+            rows = self.rows_by_ids(image_ids)
+            self.tagged[rows] = True
+            self._pending_tagged = np.union1d(
+                self._pending_tagged, np.setdiff1d(image_ids, self.ids[rows])
+            )
+
+        return rows
+
+    def set_order(self, order: Optional[np.ndarray]):
+        """Sets the order of rows on pages, rows must stay within their datasets.
+        None restores the listing order.
+        """
+        with self._lock:
+            if order is None:
+                self.order = None
+                self._positions = None
+                return
+
+            positions = np.empty(len(order), dtype=np.int64)
+            positions[order] = np.arange(len(order), dtype=np.int64)
+            self.order = np.asarray(order, dtype=np.int64)
+            self._positions = positions
+
+    def page_of(self, row: int) -> int:
+        starts, _ = self._get_page_bounds()
+        if self._positions is not None:
+            row = self._positions[row]
+        return int(np.searchsorted(starts, row, side="right"))
+
+    def page_rows(self, page_number: int) -> np.ndarray:
+        """Returns rows of not tagged images on the page."""
+        starts, ends = self._get_page_bounds()
+        start, end = starts[page_number - 1], ends[page_number - 1]
+
+        if self.order is not None:
+            rows = self.order[start:end]
+            return rows[~self.tagged[rows]]
+
+        return start + np.flatnonzero(~self.tagged[start:end])
+
+    def _get_page_bounds(self):
+        """Returns the first rows and the rows after the last of all pages."""
+        with self._lock:
+            if self._page_bounds is None:
+                segment_ends = np.append(self.segment_starts[1:], len(self))
+                starts = np.concatenate(
+                    [
+                        np.arange(start, end, self.per_page, dtype=np.int64)
+                        for start, end in zip(self.segment_starts, segment_ends)
+                    ]
+                )
+                ends = np.minimum(
+                    starts + self.per_page,
+                    segment_ends[
+                        np.searchsorted(self.segment_starts, starts, side="right") - 1
+                    ],
+                )
+                self._page_bounds = (starts, ends)
+
+            return self._page_bounds
+
+    def mark_tagged(self, rows: Iterable[int], tagged: bool = True):
+        self.tagged[np.fromiter(rows, dtype=np.int64)] = tagged
+
+    def unmark_tagged(self, image_ids: List[int]) -> List[int]:
+        """Marks images as not tagged after tags of the run were removed from them, so they
+        are shown in pages again. Tags of the run are removed from the tag ids of images,
+        so they aren't found tagged again by set_run_tag_ids. Returns rows of loaded images,
+        which were marked as tagged.
+        """
+        rows = np.array(self.rows_by_ids(image_ids), dtype=np.int64)
+
+        with self._lock:
+            rows = rows[self.tagged[rows]]
+            self.tagged[rows] = False
+            self._pending_tagged = np.setdiff1d(self._pending_tagged, image_ids)
+
+            for row in rows.tolist():
+                tag_ids = self.tag_ids[row]
+                kept = [tag_id for tag_id in tag_ids if tag_id not in self.run_tag_ids]
+                if len(kept) != len(tag_ids):
+                    self.tag_ids.set_many(row, [kept])
+
+        sly.logger.debug(f"Marked {len(rows)} images as not tagged.")
+
+        return rows.tolist()
+
+    def get_row(self, row: int) -> ImageRow:
+        return ImageRow(
+            int(row),
+            int(self.ids[row]),
+            self.names[row],
+            self.preview_urls[row],
+            self.hashes[row],
+            int(self.dataset_of(row)),
+        )
+
+    def get_rows(self, rows: Iterable[int]) -> List[ImageRow]:
+        return [self.get_row(row) for row in rows]
+
+    def meta_of(self, row: int) -> dict:
+        """Returns the metadata of the image in the row, empty if the image has none."""
+        meta = self.metas[row]
+        return json.loads(meta) if meta is not None else {}
+
+    def set_metas(self, rows: List[int], metas: List[dict]):
+        """Replaces the metadata of images in the rows, e.g. after it was written.
+        The column only grows, the old values stay in the buffer until the table is rebuilt.
+        """
+        with self._lock:
+            for row, meta in zip(rows, metas):
+                self.metas.set_many(row, [json.dumps(meta) if meta else None])
+
+    def _build_index(self, column: np.ndarray):
+        """Returns loaded rows sorted by the values of the column and the sorted values."""
+        rows = np.flatnonzero(self.loaded)
+        rows = rows[np.argsort(column[rows], kind="stable")]
+        return rows, column[rows]
+
+    def copy_rows(self, source: "ImageTable", start: int):
+        """Copies all rows of the source table to rows from start, used to merge tables
+        of datasets, which were listed separately.
+        """
+        with self._lock:
+            end = start + len(source)
+            self.ids[start:end] = source.ids
+            self.tagged[start:end] = source.tagged
+            self.loaded[start:end] = source.loaded
+            self._name_hashes[start:end] = source._name_hashes
+
+            self.names.copy_from(source.names, start)
+            self.preview_urls.copy_from(source.preview_urls, start)
+            self.hashes.copy_from(source.hashes, start)
+            self.metas.copy_from(source.metas, start)
+            self.tag_ids.copy_from(source.tag_ids, start)
+
+            self._pending_tagged = np.union1d(
+                self._pending_tagged, source._pending_tagged
+            )
+
+            self._id_index = (None, None)
+            self._name_index = (None, None)
+
+    def truncate(self, size: int):
+        """Removes rows after size, used when the number of images is known after listing."""
+        with self._lock:
+            self._resize(size)
+
+            self._id_index = (None, None)
+            self._name_index = (None, None)
+
+    def _resize(self, capacity: int):
+        size = len(self)
+        extra = max(capacity - size, 0)
+
+        sly.logger.debug(f"Resizing image table from {size} to {capacity} rows.")
+
+        self.ids = np.concatenate(
+            [self.ids[:capacity], np.zeros(extra, dtype=np.int64)]
+        )
+        self.tagged = np.concatenate(
+            [self.tagged[:capacity], np.zeros(extra, dtype=np.bool_)]
+        )
+        self.loaded = np.concatenate(
+            [self.loaded[:capacity], np.zeros(extra, dtype=np.bool_)]
+        )
+        self._name_hashes = np.concatenate(
+            [self._name_hashes[:capacity], np.zeros(extra, dtype=np.int64)]
+        )
+
+        self.names.resize(capacity)
+        self.preview_urls.resize(capacity)
+        self.hashes.resize(capacity)
+        self.metas.resize(capacity)
+        self.tag_ids.resize(capacity)
+
+        self._page_bounds = None
+        self.order = None
+        self._positions = None
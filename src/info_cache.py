@@ -0,0 +1,115 @@
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Tuple
+
+import supervisely as sly
+
+from src.metrics import METRICS
+
+
+class InfoCache:
+    """Cache of infos of teams, workspaces, projects and datasets and of project metas, which
+    are requested by several widgets while handling one click (e.g. the dataset, its project
+    and the thumbnail of both). Entries live for ttl seconds, so they are shared by the
+    handlers of one request and the following ones, but changes made on the server outside
+    of the app are seen after ttl. The project meta, which is changed by the app, is put to
+    the cache, so it isn't requested again. Concurrent lookups of the info, which isn't in
+    the cache, wait for the request sent by the first of them, so it is sent once.
+
+    :param ttl: time in seconds, for which the entry is used without requests.
+    """
+
+    def __init__(self, ttl: float = 60.0):
+        self.ttl = ttl
+
+        self._entries: Dict[Tuple[str, int], Tuple[float, Any]] = {}
+        # Requests in flight by keys of entries.
+        self._requests: Dict[Tuple[str, int], Future] = {}
+        self._lock = threading.Lock()
+
+    def team(self, api: sly.Api, team_id: int) -> sly.api.team_api.TeamInfo:
+        return self._get("team", team_id, lambda: api.team.get_info_by_id(team_id))
+
+    def workspace(
+        self, api: sly.Api, workspace_id: int
+    ) -> sly.api.workspace_api.WorkspaceInfo:
+        return self._get(
+            "workspace",
+            workspace_id,
+            lambda: api.workspace.get_info_by_id(workspace_id),
+        )
+
+    def project(self, api: sly.Api, project_id: int) -> sly.ProjectInfo:
+        return self._get(
+            "project", project_id, lambda: api.project.get_info_by_id(project_id)
+        )
+
+    def dataset(self, api: sly.Api, dataset_id: int) -> sly.DatasetInfo:
+        return self._get(
+            "dataset", dataset_id, lambda: api.dataset.get_info_by_id(dataset_id)
+        )
+
+    def project_meta(self, api: sly.Api, project_id: int) -> sly.ProjectMeta:
+        return self._get(
+            "project_meta",
+            project_id,
+            lambda: sly.ProjectMeta.from_json(api.project.get_meta(project_id)),
+        )
+
+    def set_project_meta(self, project_id: int, project_meta: sly.ProjectMeta):
+        """Puts the project meta, which was updated by the app, to the cache."""
+        with self._lock:
+            self._entries[("project_meta", project_id)] = (
+                time.monotonic() + self.ttl,
+                project_meta,
+            )
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _get(self, kind: str, id: int, request: Callable[[], Any]) -> Any:
+        key = (kind, id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                result = "hit"
+            elif key in self._requests:
+                result = "wait"
+                future = self._requests[key]
+            else:
+                result = "miss"
+                future = self._requests[key] = Future()
+
+        METRICS.inc(
+            "info_cache_requests_total",
+            help="Lookups of infos in the cache.",
+            kind=kind,
+            result=result,
+        )
+
+        if result == "hit":
+            return entry[1]
+        if result == "wait":
+            return future.result()
+
+        # The request is sent outside of the lock, so lookups of other infos don't wait for it.
+        try:
+            value = request()
+            if value is None:
+                raise ValueError(f"The {kind} with id {id} is not found.")
+        except Exception as e:
+            with self._lock:
+                del self._requests[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            del self._requests[key]
+        future.set_result(value)
+
+        sly.logger.debug(f"Requested info of {kind} {id} and saved it in the cache.")
+
+        return value
@@ -0,0 +1,196 @@
+import threading
+from collections import deque
+from itertools import count
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import supervisely as sly
+
+from src.journal import TaggedBatch
+
+
+class JobStatus:
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    STOPPED = "stopped"
+    FAILED = "failed"
+
+    FINISHED = (DONE, STOPPED, FAILED)
+
+
+class TagJob:
+    """Job for tagging images from one page. Stores the state of the job, which is
+    changed by the JobRunner and can be read by the UI at any moment.
+
+    :param page_number: number of the page of images.
+    :param assignments: names and values of tags for each image id.
+    :param skipped_ids: ids of images of the batch, which were left out by the user.
+    """
+
+    _ids = count(1)
+
+    def __init__(
+        self,
+        page_number: int,
+        assignments: Dict[int, List[Tuple[str, Any]]],
+        skipped_ids: Optional[List[int]] = None,
+    ):
+        self.id = next(self._ids)
+        self.page_number = page_number
+        self.assignments = assignments
+        self.image_ids = list(assignments)
+        self.skipped_ids = skipped_ids or []
+
+        self.status = JobStatus.QUEUED
+        self.stop_requested = False
+
+        self.tagged_ids = []
+        self.error_ids = []
+        self.error = None
+
+    def should_continue(self) -> bool:
+        """Returns False if the job was stopped, used as a stop flag for writing tags."""
+        return not self.stop_requested
+
+    def __repr__(self):
+        return (
+            f"TagJob(id={self.id}, page={self.page_number}, images={len(self.image_ids)}, "
+            f"status={self.status})"
+        )
+
+
+class UntagJob(TagJob):
+    """Job for removing tags from images: undo of tagged batches or removal of tags from all
+    tagged images matching the filter of the run.
+
+    :param image_tag_ids: ids of tag metas to remove from each image, None to remove tag_ids
+        from all tagged images.
+    :param tag_ids: ids of tag metas to remove from all tagged images.
+    :param batch: tagged batch from the journal, which is undone by this job.
+    """
+
+    def __init__(
+        self,
+        image_tag_ids: Optional[Dict[int, List[int]]],
+        tag_ids: Optional[List[int]] = None,
+        batch: Optional[TaggedBatch] = None,
+    ):
+        super().__init__(None, {})
+        self.image_tag_ids = image_tag_ids
+        self.image_ids = None if image_tag_ids is None else list(image_tag_ids)
+        self.tag_ids = tag_ids
+        self.batch = batch
+
+    def __repr__(self):
+        images = "all tagged" if self.image_ids is None else len(self.image_ids)
+        return f"UntagJob(id={self.id}, images={images}, status={self.status})"
+
+
+class JobRunner:
+    """Runs tagging jobs one by one in a background thread, so the click handlers only
+    submit jobs and return immediately. The handler is called for each job and can return
+    the next job, which is put to the front of the queue (used for automatic tagging of the
+    next page), so long runs are processed iteratively without growing the stack.
+
+    :param handler: function, which processes the job, may return the next job.
+    :param on_change: optional callback, called every time the status of any job changes.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[TagJob], Optional[TagJob]],
+        on_change: Optional[Callable[[TagJob], None]] = None,
+    ):
+        self.handler = handler
+        self.on_change = on_change
+
+        self.current = None
+        self.history = deque(maxlen=100)
+
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._run, daemon=True, name="tagging-jobs"
+        )
+        self._thread.start()
+
+    def submit(self, job: TagJob) -> TagJob:
+        with self._condition:
+            self._queue.append(job)
+            self._condition.notify()
+
+        sly.logger.debug(f"Submitted {job}, jobs in queue: {len(self._queue)}.")
+        self._notify(job)
+
+        return job
+
+    def stop(self):
+        """Stops the running job after the requests in flight and drops all queued jobs."""
+        with self._condition:
+            stopped = list(self._queue)
+            self._queue.clear()
+
+            if self.current is not None:
+                self.current.stop_requested = True
+
+        for job in stopped:
+            job.status = JobStatus.STOPPED
+            self.history.append(job)
+            self._notify(job)
+
+        sly.logger.info(f"Stop was requested, {len(stopped)} queued jobs were dropped.")
+
+    def is_busy(self) -> bool:
+        with self._condition:
+            return self.current is not None or len(self._queue) > 0
+
+    def is_page_scheduled(self, page_number: int) -> bool:
+        """Checks if there's a running or queued job for the page."""
+        with self._condition:
+            jobs = list(self._queue)
+            if self.current is not None:
+                jobs.append(self.current)
+
+        return any(job.page_number == page_number for job in jobs)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+
+                job = self._queue.popleft()
+                self.current = job
+
+            job.status = JobStatus.RUNNING
+            self._notify(job)
+
+            next_job = None
+            try:
+                next_job = self.handler(job)
+            except Exception as e:
+                sly.logger.error(f"{job} failed: {e}", exc_info=True)
+                job.error = str(e)
+                job.status = JobStatus.FAILED
+            else:
+                job.status = JobStatus.STOPPED if job.stop_requested else JobStatus.DONE
+
+            with self._condition:
+                self.current = None
+                self.history.append(job)
+
+                if next_job is not None and not job.stop_requested:
+                    self._queue.appendleft(next_job)
+
+            self._notify(job)
+            if next_job is not None and not job.stop_requested:
+                self._notify(next_job)
+
+    def _notify(self, job: TagJob):
+        if self.on_change is None:
+            return
+
+        try:
+            self.on_change(job)
+        except Exception as e:
+            sly.logger.warning(f"Failed to report the status of {job}: {e}")
@@ -0,0 +1,391 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from itertools import chain
+from typing import Dict, Iterable, List, Optional
+
+import supervisely as sly
+from supervisely.api.module_api import ApiField
+
+# Operations of the journal records.
+SNAPSHOT = "snapshot"
+INTENT = "intent"
+ACK = "ack"
+FORGET = "forget"
+PAGE = "page"
+
+# Number of the last tagged batches, which are kept in the journal and can be undone.
+MAX_BATCHES = 100
+
+
+def run_name(dataset_ids: List[int], tag_name: str) -> str:
+    """Returns the name of the tagging run for file names, e.g. dataset_1_reviewed."""
+    safe_tag_name = re.sub(r"[^\w.-]", "_", tag_name)
+    if len(dataset_ids) == 1:
+        return f"dataset_{dataset_ids[0]}_{safe_tag_name}"
+
+    # Names of runs over many datasets would be too long with all ids.
+    ids = ",".join(map(str, sorted(dataset_ids)))
+    return f"datasets_{hashlib.sha1(ids.encode()).hexdigest()[:8]}_{safe_tag_name}"
+
+
+class TaggedBatch:
+    """Images tagged by one batch of the run with ids of tags, which each image got from it,
+    so undo of the batch removes only these tags. Images from the intent are pending until
+    their ack, images, which tags were removed, are dropped from the batch.
+
+    :param page_number: number of the page of the batch, None if it isn't known.
+    """
+
+    def __init__(self, page_number: Optional[int] = None):
+        self.page_number = page_number
+        self.pending: Dict[int, List[int]] = {}
+        self.tags: Dict[int, List[int]] = {}
+        # Set when the undo of the batch is submitted, so it isn't undone twice.
+        self.undoing = False
+
+    def __repr__(self):
+        return (
+            f"TaggedBatch(page={self.page_number}, tagged={len(self.tags)}, "
+            f"pending={len(self.pending)})"
+        )
+
+
+class JournalState:
+    """State of the tagging run restored from the journal: ids of images with acknowledged
+    tags in the order of tagging, ids of images which were sent to the server, but the
+    response wasn't recorded (e.g. the app was killed mid-batch), the last shown page and
+    the last tagged batches with tags of each image, which can be undone.
+    """
+
+    def __init__(self):
+        # Ids of tag metas, which were written by the run.
+        self.tag_ids = []
+        self.tagged_ids = {}
+        self.unconfirmed_ids = {}
+        self.page_number = None
+        self.batches: List[TaggedBatch] = []
+        self._batch_of: Dict[int, TaggedBatch] = {}
+
+    def add_batch(
+        self,
+        batch: TaggedBatch,
+        pending: Dict[int, List[int]],
+        tagged: Optional[Dict[int, List[int]]] = None,
+    ):
+        """Adds the batch with ids of tags of its pending and tagged images, the images are
+        removed from their previous batches and the oldest batches are dropped.
+        """
+        tagged = tagged or {}
+        for image_id in chain(pending, tagged):
+            self.drop(image_id)
+        batch.pending.update(pending)
+        batch.tags.update(tagged)
+        self._batch_of.update(dict.fromkeys(chain(pending, tagged), batch))
+        self.batches.append(batch)
+
+        for dropped in self.batches[:-MAX_BATCHES]:
+            for image_id in chain(dropped.pending, dropped.tags):
+                self._batch_of.pop(image_id, None)
+        del self.batches[:-MAX_BATCHES]
+
+    def acknowledge(self, image_id: int):
+        """Moves the pending image to tagged images of its batch."""
+        batch = self._batch_of.get(image_id)
+        if batch is not None and image_id in batch.pending:
+            batch.tags[image_id] = batch.pending.pop(image_id)
+
+    def drop(self, image_id: int):
+        """Removes the image from its batch, e.g. after its tags were removed."""
+        batch = self._batch_of.pop(image_id, None)
+        if batch is not None:
+            batch.pending.pop(image_id, None)
+            batch.tags.pop(image_id, None)
+
+    def __repr__(self):
+        return (
+            f"JournalState(tag_ids={self.tag_ids}, tagged={len(self.tagged_ids)}, "
+            f"unconfirmed={len(self.unconfirmed_ids)}, page={self.page_number}, "
+            f"batches={len(self.batches)})"
+        )
+
+
+class TaggingJournal:
+    """Append-only journal of the tagging run, stored as JSON lines in the app data directory,
+    one file per datasets and tag name, so the run can be continued after the app restart.
+
+    Before the request for the batch is sent, its image ids (with the page and ids of tags of
+    each image) are written as the intent record and after each successful request the tagged
+    ids are written as the ack record. Both are
+    flushed to the disk with fsync, so acknowledged writes are never lost. If the app is killed
+    mid-batch, images from the intent without ack are checked on the server on the next start,
+    which prevents tagging them twice. The last MAX_BATCHES batches are kept with tags of each
+    image, so they can be undone after the restart too.
+
+    The journal is replayed in one pass over the file and is compacted to one snapshot record
+    (written to a temporary file and atomically replaced), when the number of appended records
+    exceeds compact_every, so the replay time stays proportional to the number of tagged images.
+
+    :param path: path to the journal file.
+    :param compact_every: number of appended records after which the journal is compacted.
+    """
+
+    def __init__(self, path: str, compact_every: int = 1000):
+        self.path = path
+        self.compact_every = compact_every
+
+        self.state = JournalState()
+
+        self._records = 0
+        self._file = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_run(cls, data_dir: str, dataset_ids: List[int], tag_name: str, **kwargs):
+        """Returns the journal for tagging the datasets with the tag."""
+        directory = os.path.join(data_dir, "journals")
+        os.makedirs(directory, exist_ok=True)
+
+        return cls(
+            os.path.join(directory, f"{run_name(dataset_ids, tag_name)}.jsonl"),
+            **kwargs,
+        )
+
+    def replay(self) -> JournalState:
+        """Reads the journal file and restores the state of the run from it."""
+        state = JournalState()
+        records = 0
+
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # The last record is incomplete if the app was killed while writing it.
+                        sly.logger.warning(
+                            f"Skipping incomplete record in journal {self.path}."
+                        )
+                        continue
+
+                    self._apply(state, record)
+                    records += 1
+
+        with self._lock:
+            self.state = state
+            self._records = records
+
+        sly.logger.info(f"Replayed {records} records from journal: {state}.")
+
+        return state
+
+    def confirm(self, api: sly.Api, dataset_ids: List[int], tag_ids: List[int]):
+        """Checks images from intents without acks on the server: images which have any of
+        the tags are recorded as tagged, others are forgotten. If tags on the server are not
+        the ones from the journal (e.g. the tag meta was recreated), the journal is reset.
+        """
+        state = self.state
+
+        if not set(state.tag_ids).issubset(tag_ids):
+            sly.logger.warning(
+                f"Tag ids in journal {state.tag_ids} don't match tag ids {tag_ids} on "
+                "server, the journal will be reset."
+            )
+            self.state = JournalState()
+            self.compact()
+            return
+
+        unconfirmed_ids = list(state.unconfirmed_ids)
+        state.unconfirmed_ids = {}
+
+        confirmed_ids = set()
+        if unconfirmed_ids and tag_ids:
+            sly.logger.info(
+                f"Checking {len(unconfirmed_ids)} images from unfinished batches on server."
+            )
+
+            # Images are listed by datasets, the dataset of each image isn't known here.
+            for dataset_id in dataset_ids:
+                for image_info in get_infos_by_ids(api, dataset_id, unconfirmed_ids):
+                    if any(
+                        tag.get("tagId") in tag_ids for tag in image_info.tags or []
+                    ):
+                        state.tagged_ids[image_info.id] = None
+                        confirmed_ids.add(image_info.id)
+
+        for image_id in unconfirmed_ids:
+            if image_id in confirmed_ids:
+                state.acknowledge(image_id)
+            else:
+                state.drop(image_id)
+
+        self.compact()
+
+    def undoable_batches(self, count: int) -> List[TaggedBatch]:
+        """Returns up to count last batches with tagged images, which aren't being undone,
+        the most recent first.
+        """
+        with self._lock:
+            batches = [
+                batch
+                for batch in reversed(self.state.batches)
+                if batch.tags and not batch.undoing
+            ]
+        return batches[:count]
+
+    def intent(
+        self,
+        tag_ids: List[int],
+        image_ids: List[int],
+        page_number: Optional[int] = None,
+        image_tag_ids: Optional[Dict[int, List[int]]] = None,
+    ):
+        """Records the batch of images before its tags are sent.
+
+        :param tag_ids: ids of tag metas written by the batch.
+        :param page_number: number of the page of the batch.
+        :param image_tag_ids: ids of tag metas written to each image, if images get different
+            tags, all images get tag_ids otherwise.
+        """
+        record = {"op": INTENT, "tag_ids": tag_ids, "ids": image_ids}
+        if page_number is not None:
+            record["page"] = page_number
+        if image_tag_ids is not None and any(
+            image_tag_ids[image_id] != tag_ids for image_id in image_ids
+        ):
+            record["tags"] = [image_tag_ids[image_id] for image_id in image_ids]
+
+        self._append(record, sync=True)
+
+    def ack(self, image_ids: List[int]):
+        self._append({"op": ACK, "ids": image_ids}, sync=True)
+
+    def forget(self, image_ids: List[int]):
+        """Records that tags are removed from images, e.g. when tagged batches are undone.
+        The record is written before the requests are sent: if the run is stopped before
+        they are sent, images still have the tag and are found tagged in the listing.
+        """
+        self._append({"op": FORGET, "ids": image_ids}, sync=True)
+
+    def page(self, page_number: int):
+        # Losing the last page number is harmless, so it's not synced to the disk.
+        self._append({"op": PAGE, "page": page_number}, sync=False)
+
+    def compact(self):
+        """Rewrites the journal as one snapshot record with the current state."""
+        with self._lock:
+            self._close()
+
+            state = self.state
+            snapshot = {
+                "op": SNAPSHOT,
+                "tag_ids": state.tag_ids,
+                "tagged": list(state.tagged_ids),
+                "unconfirmed": list(state.unconfirmed_ids),
+                "page": state.page_number,
+                "batches": [
+                    {
+                        "page": batch.page_number,
+                        "tags": list(batch.tags.items()),
+                        "pending": list(batch.pending.items()),
+                    }
+                    for batch in state.batches
+                    if batch.tags or batch.pending
+                ],
+            }
+
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as file:
+                file.write(json.dumps(snapshot) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+
+            os.replace(temp_path, self.path)
+            self._records = 1
+
+        sly.logger.debug(f"Compacted journal {self.path}: {state}.")
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _append(self, record: dict, sync: bool):
+        with self._lock:
+            self._apply(self.state, record)
+
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+            if sync:
+                os.fsync(self._file.fileno())
+
+            self._records += 1
+            compact = self._records > self.compact_every
+
+        if compact:
+            self.compact()
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @staticmethod
+    def _apply(state: JournalState, record: dict):
+        # Dictionaries are used as ordered sets to keep the order of tagging.
+        op = record.get("op")
+        if op == SNAPSHOT:
+            state.tag_ids = record["tag_ids"]
+            state.tagged_ids = dict.fromkeys(record.get("tagged", []))
+            state.unconfirmed_ids = dict.fromkeys(record.get("unconfirmed", []))
+            state.page_number = record.get("page")
+            for batch in record.get("batches", []):
+                state.add_batch(
+                    TaggedBatch(batch["page"]),
+                    dict(batch["pending"]),
+                    dict(batch["tags"]),
+                )
+        elif op == INTENT:
+            tag_ids = record["tag_ids"]
+            state.tag_ids = sorted(set(state.tag_ids).union(tag_ids))
+            state.unconfirmed_ids.update(dict.fromkeys(record["ids"]))
+            # Records without tags of each image add tag_ids to all images.
+            image_tag_ids = record.get("tags", [tag_ids] * len(record["ids"]))
+            state.add_batch(
+                TaggedBatch(record.get("page")), dict(zip(record["ids"], image_tag_ids))
+            )
+        elif op == ACK:
+            for image_id in record["ids"]:
+                state.unconfirmed_ids.pop(image_id, None)
+                state.tagged_ids[image_id] = None
+                state.acknowledge(image_id)
+        elif op == FORGET:
+            for image_id in record["ids"]:
+                state.unconfirmed_ids.pop(image_id, None)
+                state.tagged_ids.pop(image_id, None)
+                state.drop(image_id)
+        elif op == PAGE:
+            state.page_number = record["page"]
+
+
+def get_infos_by_ids(
+    api: sly.Api, dataset_id: int, image_ids: Iterable[int], batch_size: int = 500
+) -> List[sly.ImageInfo]:
+    """Returns infos of images of the dataset with the ids, unknown ids are skipped."""
+    image_ids = list(image_ids)
+    image_infos = []
+    for i in range(0, len(image_ids), batch_size):
+        filters = [
+            {
+                "field": ApiField.ID,
+                "operator": "in",
+                "value": image_ids[i : i + batch_size],
+            }
+        ]
+        image_infos.extend(api.image.get_list(dataset_id, filters=filters))
+
+    return image_infos
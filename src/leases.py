@@ -0,0 +1,227 @@
+import fcntl
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Set
+
+import supervisely as sly
+
+from src.journal import run_name
+
+
+def session_id() -> str:
+    """Returns the id of the app session: the task id in Supervisely, the host and the
+    process id otherwise.
+    """
+    task_id = sly.env.task_id(raise_not_found=False)
+    if task_id is not None:
+        return f"task-{task_id}"
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class LeaseTable:
+    """Table of pages claimed by sessions of the app, which tag the same dataset with the
+    same tag, so annotators don't see and tag the same batches. The session holds the lease
+    of the page while the page is shown or tagged: leases are renewed on each claim and leases
+    of held pages (see hold) are renewed in the background, leases, which weren't renewed for
+    ttl seconds (e.g. the session was closed), are expired and can be claimed again.
+
+    The table is stored as JSON in the app data directory, one file per datasets, tag name,
+    batch size, filter and grouping, since pages depend on them. Each change reads and
+    replaces the file under the exclusive lock of the lock file next to it. The lock and the
+    file coordinate only sessions on the same host (sessions of the app share its data
+    directory), sessions on other hosts don't see the leases and may tag the same batches.
+
+    Reads of the table for the UI (claimed_by_others and holder) are cached for cache_ttl
+    seconds, so refreshes of the page don't read the file each time, changes of other
+    sessions are seen after cache_ttl at most. Claims always read the file under the lock.
+
+    :param path: path to the table file.
+    :param session: id of this session.
+    :param ttl: time in seconds after which the lease expires if it isn't renewed.
+    :param cache_ttl: time in seconds, for which the read table is used for the UI.
+    """
+
+    def __init__(
+        self, path: str, session: str, ttl: float = 600.0, cache_ttl: float = 2.0
+    ):
+        self.path = path
+        self.session = session
+        self.ttl = ttl
+        self.cache_ttl = cache_ttl
+
+        self._cache = (0.0, {})
+        self._held = set()
+        self._renewal = None
+        self._closed = threading.Event()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_run(
+        cls,
+        data_dir: str,
+        dataset_ids: List[int],
+        tag_name: str,
+        batch_size: int,
+        image_filter=None,
+        grouped: bool = False,
+        **kwargs,
+    ):
+        """Returns the table of leases for tagging the datasets with the tag, grouped
+        pages (see src.grouping) have their own table.
+        """
+        filter_hash = hashlib.sha1(repr(image_filter).encode("utf-8")).hexdigest()[:8]
+        directory = os.path.join(data_dir, "leases")
+        os.makedirs(directory, exist_ok=True)
+
+        return cls(
+            os.path.join(
+                directory,
+                f"{run_name(dataset_ids, tag_name)}_{batch_size}_{filter_hash}"
+                f"{'_grouped' if grouped else ''}.json",
+            ),
+            **kwargs,
+        )
+
+    def claim(self, page_number: int) -> bool:
+        """Claims or renews the lease of the page, returns False if the page is leased by
+        another session.
+        """
+        with self._transaction() as leases:
+            lease = leases.get(str(page_number))
+            if lease is not None and lease["session"] != self.session:
+                sly.logger.debug(
+                    f"Page {page_number} is leased by session {lease['session']}."
+                )
+                return False
+
+            leases[str(page_number)] = {
+                "session": self.session,
+                "expires": time.time() + self.ttl,
+            }
+            return True
+
+    def hold(self, page_numbers: Iterable[int]):
+        """Sets pages shown by this session, their leases are renewed in the background every
+        third of ttl, so pages which are viewed for a long time don't expire. Only leases of
+        this session are renewed, pages are claimed with claim.
+        """
+        with self._lock:
+            self._held = set(page_numbers)
+            if self._renewal is None and self._held and not self._closed.is_set():
+                self._renewal = threading.Thread(
+                    target=self._renew_held, daemon=True, name="lease-renewal"
+                )
+                self._renewal.start()
+
+    def renew(self, page_numbers: Iterable[int]):
+        """Renews leases of the pages, which are held by this session."""
+        expires = time.time() + self.ttl
+        with self._transaction() as leases:
+            for page_number in map(str, page_numbers):
+                lease = leases.get(page_number)
+                if lease is not None and lease["session"] == self.session:
+                    lease["expires"] = expires
+
+    def release(self, page_number: int):
+        with self._lock:
+            self._held.discard(page_number)
+
+        with self._transaction() as leases:
+            lease = leases.get(str(page_number))
+            if lease is not None and lease["session"] == self.session:
+                del leases[str(page_number)]
+
+    def release_all(self):
+        """Releases all leases of this session and stops renewing them, e.g. when settings
+        are changed.
+        """
+        with self._lock:
+            self._held = set()
+            self._closed.set()
+
+        with self._transaction() as leases:
+            for page_number, lease in list(leases.items()):
+                if lease["session"] == self.session:
+                    del leases[page_number]
+
+    def claimed_by_others(self) -> Set[int]:
+        """Returns numbers of pages, which are leased by other sessions."""
+        now = time.time()
+        return {
+            int(page_number)
+            for page_number, lease in self._read_cached().items()
+            if lease["session"] != self.session and lease["expires"] > now
+        }
+
+    def holder(self, page_number: int) -> Optional[str]:
+        """Returns the session, which holds the lease of the page, or None."""
+        lease = self._read_cached().get(str(page_number))
+        if lease is None or lease["expires"] <= time.time():
+            return None
+        return lease["session"]
+
+    @contextmanager
+    def _transaction(self):
+        with open(f"{self.path}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                leases = self._read()
+                yield leases
+
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump({"leases": leases}, f)
+                os.replace(tmp_path, self.path)
+
+                with self._lock:
+                    self._cache = (time.monotonic(), leases)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _renew_held(self):
+        while not self._closed.wait(self.ttl / 3):
+            with self._lock:
+                page_numbers = sorted(self._held)
+
+            if not page_numbers:
+                continue
+
+            try:
+                self.renew(page_numbers)
+            except OSError as e:
+                sly.logger.warning(
+                    f"Failed to renew leases of pages {page_numbers}: {e}"
+                )
+            else:
+                sly.logger.debug(f"Renewed leases of pages {page_numbers}.")
+
+    def _read_cached(self) -> Dict[str, dict]:
+        with self._lock:
+            read_at, leases = self._cache
+
+        if time.monotonic() - read_at >= self.cache_ttl:
+            leases = self._read()
+            with self._lock:
+                self._cache = (time.monotonic(), leases)
+
+        return leases
+
+    def _read(self) -> Dict[str, dict]:
+        """Reads the table, expired leases are dropped."""
+        try:
+            with open(self.path) as f:
+                leases = json.load(f)["leases"]
+        except (FileNotFoundError, ValueError, KeyError):
+            return {}
+
+        now = time.time()
+        return {
+            page_number: lease
+            for page_number, lease in leases.items()
+            if lease["expires"] > now
+        }
@@ -0,0 +1,427 @@
+import threading
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional, Union
+
+import supervisely as sly
+from supervisely.api.module_api import ApiField
+
+from src.filters import ImageFilter
+from src.image_table import ImageRow, ImageTable
+from src.metrics import stage
+
+
+class ImageCursor:
+    """Paged cursor over the list of images in the dataset on the server.
+    Images are sorted on the server and fetched page by page on demand, the data of fetched
+    images is stored in the compact ImageTable instead of keeping ImageInfo objects. The total
+    number of images is received with the first page, so it's known without listing the
+    whole dataset.
+
+    :param api: Supervisely API instance.
+    :param dataset_id: id of the dataset to list images from.
+    :param per_page: number of images in one page of the server listing.
+    :param sort: field to sort images by on the server.
+    :param sort_order: "asc" or "desc".
+    :param image_filter: optional filter, predicates supported by the server are sent with
+        each request, if the filter has local predicates, the dataset is scanned once and
+        only matching images are stored in the table.
+    :param project_meta: project meta, required to resolve tag names of the filter.
+    """
+
+    def __init__(
+        self,
+        api: sly.Api,
+        dataset_id: int,
+        per_page: int,
+        sort: str = "name",
+        sort_order: str = "asc",
+        image_filter: Optional[ImageFilter] = None,
+        project_meta: Optional[sly.ProjectMeta] = None,
+    ):
+        self.api = api
+        self.dataset_id = dataset_id
+        self.per_page = per_page
+        self.sort = sort
+        self.sort_order = sort_order
+        self.image_filter = image_filter
+
+        # Rows of the cursor start from offset in the table, which is shared by cursors of
+        # several datasets after attach, size is the number of images in the dataset then.
+        self.offset = 0
+        self.size = None
+
+        self._lock = threading.Lock()
+        self._server_filters = {}
+
+        if image_filter is not None and not image_filter.is_empty:
+            self._server_filters = image_filter.server_params(project_meta)
+
+        if self._server_filters is None:
+            # The filter can't match any image, so nothing is requested.
+            self.table = ImageTable(0, per_page, dataset_id)
+            self._loaded_pages = set()
+        elif image_filter is not None and image_filter.needs_local_scan:
+            self._scan()
+        else:
+            image_infos, total = self._fetch(0)
+
+            self.table = ImageTable(total, per_page, dataset_id)
+            self.table.set_rows(0, image_infos)
+            self._loaded_pages = {0}
+
+        sly.logger.debug(
+            f"Created cursor over {len(self.table)} images in dataset {dataset_id} "
+            f"with {self.pages_count} pages of {per_page} images."
+        )
+
+    @property
+    def pages_count(self) -> int:
+        return (len(self) + self.per_page - 1) // self.per_page
+
+    def __len__(self):
+        return len(self.table) if self.size is None else self.size
+
+    def attach(self, table: ImageTable, offset: int):
+        """Moves rows of the cursor to the table shared by several datasets, starting
+        from the offset, pages are fetched to this table after that.
+        """
+        with self._lock:
+            table.copy_rows(self.table, offset)
+            self.size = len(self.table)
+            self.table = table
+            self.offset = offset
+
+    def _set_rows(self, start: int, image_infos: List[sly.ImageInfo]):
+        if self.size is not None:
+            # Images added to the dataset after it was listed don't fit the shared table.
+            image_infos = image_infos[: max(self.size - start, 0)]
+        self.table.set_rows(self.offset + start, image_infos)
+
+    def load_page(self, index: int):
+        """Fetches the page with zero-based index to the table if it's not loaded yet."""
+        with self._lock:
+            if index in self._loaded_pages or index >= self.pages_count:
+                return
+
+            image_infos, _ = self._fetch(index)
+
+            self._set_rows(index * self.per_page, image_infos)
+            self._loaded_pages.add(index)
+
+    def load_all(self, per_request: int = 500):
+        """Fetches all pages, which are not loaded yet, to the table. Several pages are
+        fetched with one request, so the whole dataset is listed with few requests.
+        """
+        pages_per_request = max(per_request // self.per_page, 1)
+        requests_count = (self.pages_count + pages_per_request - 1) // pages_per_request
+
+        sly.logger.debug(
+            f"Loading all pages with {requests_count} requests of {pages_per_request} pages."
+        )
+
+        for request_index in range(requests_count):
+            indexes = set(
+                range(
+                    request_index * pages_per_request,
+                    min((request_index + 1) * pages_per_request, self.pages_count),
+                )
+            )
+
+            with self._lock:
+                if indexes <= self._loaded_pages:
+                    continue
+
+                image_infos, _ = self._fetch(
+                    request_index, self.per_page * pages_per_request
+                )
+
+                self._set_rows(
+                    request_index * pages_per_request * self.per_page, image_infos
+                )
+                self._loaded_pages.update(indexes)
+
+    def _scan(self, per_request: int = 500):
+        """Lists all images matching the server filters with large requests and stores
+        only images matching the local predicates of the filter, so pages of the cursor
+        contain only matching images.
+        """
+        image_infos, total = self._fetch(0, per_request)
+        self.table = ImageTable(total, self.per_page, self.dataset_id)
+
+        size = 0
+        index = 0
+        while image_infos:
+            mask = self.image_filter.local_mask(image_infos)
+            matched = [
+                image_info for image_info, match in zip(image_infos, mask) if match
+            ]
+
+            self.table.set_rows(size, matched)
+            size += len(matched)
+
+            index += 1
+            if index * per_request >= total:
+                break
+
+            image_infos, _ = self._fetch(index, per_request)
+
+        self.table.truncate(size)
+        self._loaded_pages = set(range(self.pages_count))
+
+        sly.logger.info(
+            f"Scanned {total} images in dataset {self.dataset_id}, {size} of them match "
+            f"the filter {self.image_filter}."
+        )
+
+    def _fetch(self, index: int, per_page: Optional[int] = None):
+        """Fetches the page with zero-based index. api.image.get_list can't fetch a page
+        by its index, so the request is sent directly, with the same fields as get_list:
+        the server sends width, height and metadata of images added by links only when
+        they are forced.
+        """
+        per_page = per_page or self.per_page
+        with stage("listing"):
+            response = self.api.post(
+                "images.list",
+                {
+                    ApiField.DATASET_ID: self.dataset_id,
+                    ApiField.FILTER: [],
+                    ApiField.SORT: self.sort,
+                    ApiField.SORT_ORDER: self.sort_order,
+                    ApiField.FORCE_METADATA_FOR_LINKS: True,
+                    "page": index + 1,
+                    "per_page": per_page,
+                    **self._server_filters,
+                },
+            ).json()
+
+        # Entities are converted as in get_list, the SDK has no public converter.
+        image_infos = [
+            self.api.image._convert_json_info(entity) for entity in response["entities"]
+        ]
+
+        sly.logger.debug(
+            f"Fetched page {index + 1} with {len(image_infos)} images from the server."
+        )
+
+        return image_infos, response["total"]
+
+
+class ProjectCursor:
+    """Cursor over images of several datasets (e.g. all datasets of the project) as one
+    list. Each dataset is listed by its own ImageCursor, datasets are listed concurrently
+    and their rows follow each other in one shared table. Pages don't cross datasets, so
+    each page is fetched, annotated and tagged within one dataset.
+
+    :param api: Supervisely API instance.
+    :param dataset_ids: ids of datasets in the order of the listing.
+    :param per_page: number of images in one page of the server listing.
+    :param max_workers: number of datasets listed at the same time.
+    :param kwargs: parameters of ImageCursor of each dataset (sort, image_filter, ...).
+    """
+
+    def __init__(
+        self,
+        api: sly.Api,
+        dataset_ids: List[int],
+        per_page: int,
+        max_workers: int = 8,
+        **kwargs,
+    ):
+        self.dataset_ids = list(dataset_ids)
+        self.per_page = per_page
+        self.max_workers = max_workers
+
+        with stage("listing_datasets"):
+            with ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="listing-datasets"
+            ) as executor:
+                self.cursors = list(
+                    executor.map(
+                        lambda dataset_id: ImageCursor(
+                            api, dataset_id, per_page, **kwargs
+                        ),
+                        self.dataset_ids,
+                    )
+                )
+
+        sizes = [len(cursor) for cursor in self.cursors]
+        self.table = ImageTable(sum(sizes), per_page)
+        self.table.set_segments(self.dataset_ids, sizes)
+
+        # Index of the first page of each dataset in the pages of all datasets.
+        self._first_pages = []
+        offset = 0
+        first_page = 0
+        for cursor in self.cursors:
+            cursor.attach(self.table, offset)
+            self._first_pages.append(first_page)
+            offset += len(cursor)
+            first_page += cursor.pages_count
+
+        sly.logger.debug(
+            f"Created cursor over {len(self.table)} images in {len(self.cursors)} "
+            f"datasets with {self.pages_count} pages of {per_page} images."
+        )
+
+    @property
+    def pages_count(self) -> int:
+        return self.table.pages_count
+
+    def __len__(self):
+        return len(self.table)
+
+    def load_page(self, index: int):
+        """Fetches the page with zero-based index from the cursor of its dataset."""
+        # Datasets without pages have the same first page as the next dataset.
+        position = bisect_right(self._first_pages, index) - 1
+        self.cursors[position].load_page(index - self._first_pages[position])
+
+    def load_all(self, per_request: int = 500):
+        """Fetches all pages of all datasets, datasets are listed concurrently."""
+        with ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="listing-datasets"
+        ) as executor:
+            list(
+                executor.map(lambda cursor: cursor.load_all(per_request), self.cursors)
+            )
+
+
+class Pages:
+    """Dictionary-like view of the dataset split into pages (batches) with page numbers
+    starting from 1. Pages are fetched lazily from the cursor, each page contains rows of
+    the images from the table, which are not tagged yet.
+
+    :param cursor: cursor over the server listing (ImageCursor or ProjectCursor), one cursor
+        page is one page of the view.
+    """
+
+    def __init__(self, cursor: Union[ImageCursor, ProjectCursor]):
+        self.cursor = cursor
+        self.table = cursor.table
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="listing")
+
+    def __len__(self):
+        return max(self.cursor.pages_count, 1)
+
+    def __contains__(self, page_number):
+        return isinstance(page_number, int) and 1 <= page_number <= len(self)
+
+    def __getitem__(self, page_number: int) -> List[ImageRow]:
+        if page_number not in self:
+            raise KeyError(page_number)
+
+        self.cursor.load_page(page_number - 1)
+
+        return self.table.get_rows(self.table.page_rows(page_number))
+
+    def keys(self):
+        return range(1, len(self) + 1)
+
+    def prefetch(
+        self,
+        page_number: int,
+        on_loaded: Optional[Callable[[List[ImageRow]], None]] = None,
+    ):
+        """Fetches the page in the background thread and calls on_loaded with its images."""
+
+        def load():
+            try:
+                images = self[page_number]
+                if on_loaded is not None:
+                    on_loaded(images)
+            except Exception as e:
+                sly.logger.warning(f"Failed to prefetch page {page_number}: {e}")
+
+        self._executor.submit(load)
+
+    def load_all_in_background(self, on_loaded: Optional[Callable[[], None]] = None):
+        """Lists the whole dataset in the background thread and calls on_loaded after it."""
+
+        def load():
+            try:
+                self.cursor.load_all()
+                if on_loaded is not None:
+                    on_loaded()
+            except Exception as e:
+                sly.logger.warning(f"Failed to list all images in background: {e}")
+
+        # Separate thread, so prefetching of neighbour pages doesn't wait for the listing.
+        threading.Thread(target=load, daemon=True, name="listing-all").start()
+
+
+class WorkQueue:
+    """Current batch of not tagged images, which starts with the images of the page and is
+    topped up to the batch size with the next not tagged images in the order of pages, when
+    images of the batch are tagged. So the images, which were left in the batch, come to
+    the beginning and new images appear after them, instead of the page getting smaller.
+    Pages, which can't be claimed (e.g. they are tagged by another annotator), are skipped.
+
+    :param pages: pages of the run.
+    :param page_number: number of the first page of the batch.
+    :param size: number of images in the batch.
+    :param claim: optional callback, which claims the following page before its images are
+        drawn and returns False if the page is claimed by another session.
+    """
+
+    def __init__(
+        self,
+        pages: Pages,
+        page_number: int,
+        size: int,
+        claim: Optional[Callable[[int], bool]] = None,
+    ):
+        self.pages = pages
+        self.page_number = page_number
+        self.size = size
+        self.images: List[ImageRow] = []
+        # Pages, which images were drawn to the batch, the first page is always drawn.
+        self.drawn_pages: List[int] = []
+
+        self._claim = claim
+        self._next_page = page_number
+        self._pending = deque()
+
+    def fill(self) -> List[ImageRow]:
+        """Tops up the batch to its size and returns the added images."""
+        added = []
+        while len(self.images) < self.size:
+            if not self._pending:
+                page_number = self._next_page
+                if page_number not in self.pages:
+                    break
+                self._next_page += 1
+
+                if page_number != self.page_number and self._claim is not None:
+                    if not self._claim(page_number):
+                        continue
+
+                self._pending.extend(self.pages[page_number])
+                self.drawn_pages.append(page_number)
+                continue
+
+            image = self._pending.popleft()
+            if self.pages.table.tagged[image.row]:
+                # The image was tagged after its page was drawn.
+                continue
+
+            self.images.append(image)
+            added.append(image)
+
+        if added:
+            sly.logger.debug(
+                f"Added {len(added)} images to the batch from pages {self.drawn_pages}."
+            )
+
+        return added
+
+    def remove(self, rows: Iterable[int]) -> List[ImageRow]:
+        """Removes images with the rows from the batch (e.g. tagged) and returns them."""
+        rows = set(rows)
+        removed = [image for image in self.images if image.row in rows]
+        if removed:
+            self.images = [image for image in self.images if image.row not in rows]
+        return removed
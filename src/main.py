@@ -1,13 +1,26 @@
 import supervisely as sly
 
+from fastapi.responses import PlainTextResponse
 from supervisely.app.widgets import Container
 
 import src.globals as g
+# Cards of all steps are in the layout of the app, so the UI modules are imported at once,
+# they don't send requests or wait for the disk at import, see benchmarks/startup.py.
 import src.ui.input as input
 import src.ui.settings as settings
 import src.ui.tagging as tagging
+from src.metrics import METRICS
 
 
 layout = Container(widgets=[input.card, settings.card, tagging.card])
 
-app = sly.Application(layout=layout, static_dir=g.STATIC_DIR)
+app = sly.Application(layout=layout, static_dir=g.init_static_dir())
+g.start_widget_sync()
+
+server = app.get_server()
+
+
+@server.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    # Prometheus-style metrics of the API calls and the app stages.
+    return METRICS.render()
@@ -0,0 +1,237 @@
+import copy
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Tuple
+
+import supervisely as sly
+
+# Upper bounds of the latency histogram buckets in seconds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative histogram in the Prometheus format: counts of observations less than or
+    equal to each bucket bound, sum and count of all observations.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Registry of counters and histograms with labels, rendered in the Prometheus text
+    format. Metrics are created on the first use, so there is no need to declare them.
+    """
+
+    def __init__(self):
+        self._counters: Dict[str, Dict[tuple, float]] = defaultdict(
+            lambda: defaultdict(float)
+        )
+        self._histograms: Dict[str, Dict[tuple, Histogram]] = defaultdict(dict)
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, help: str = "", **labels):
+        with self._lock:
+            self._help.setdefault(name, help)
+            self._counters[name][tuple(sorted(labels.items()))] += value
+
+    def observe(self, name: str, value: float, help: str = "", **labels):
+        with self._lock:
+            self._help.setdefault(name, help)
+            key = tuple(sorted(labels.items()))
+            histogram = self._histograms[name].get(key)
+            if histogram is None:
+                histogram = self._histograms[name][key] = Histogram()
+            histogram.observe(value)
+
+    def total(self, name: str) -> float:
+        """Returns the sum of the counter (or the count of the histogram) for all labels."""
+        with self._lock:
+            if name in self._histograms:
+                return sum(h.count for h in self._histograms[name].values())
+            return sum(self._counters.get(name, {}).values())
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# HELP {name} {self._help.get(name, '')}")
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(labels)} {value:g}")
+
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# HELP {name} {self._help.get(name, '')}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(
+                        histogram.buckets + (float("inf"),), histogram.counts
+                    ):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                        bucket_labels = _format_labels(labels + (("le", le),))
+                        lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                    lines.append(
+                        f"{name}_sum{_format_labels(labels)} {histogram.sum:g}"
+                    )
+                    lines.append(
+                        f"{name}_count{_format_labels(labels)} {histogram.count}"
+                    )
+
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    formatted = (f'{key}="{_escape(value)}"' for key, value in labels)
+    return "{" + ",".join(formatted) + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+METRICS = Metrics()
+
+
+@contextmanager
+def stage(name: str):
+    """Measures the duration of the stage of the app (e.g. listing or gallery fill)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        METRICS.observe(
+            "app_stage_seconds",
+            time.perf_counter() - started,
+            help="Duration of the app stages.",
+            stage=name,
+        )
+
+
+class _RetryCountingLogger:
+    """Proxy of the API logger, which counts retries reported by sly.Api."""
+
+    def __init__(self, logger):
+        self._logger = logger
+
+    def __getattr__(self, name):
+        return getattr(self._logger, name)
+
+    def warn(self, msg, *args, **kwargs):
+        self._count_retry(msg, kwargs.get("extra"))
+        return self._logger.warning(msg, *args, **kwargs)
+
+    def warning(self, msg, *args, **kwargs):
+        self._count_retry(msg, kwargs.get("extra"))
+        return self._logger.warning(msg, *args, **kwargs)
+
+    @staticmethod
+    def _count_retry(msg, extra):
+        if "Retrying" in str(msg):
+            METRICS.inc(
+                "api_retries_total",
+                help="Requests retried by the API client.",
+                endpoint=(extra or {}).get("method", "unknown"),
+            )
+
+
+def instrument_api(api: sly.Api) -> sly.Api:
+    """Wraps post and get methods of the API instance to record the number of calls,
+    latency, received bytes and errors for each endpoint, and counts retries.
+    """
+    if getattr(api, "_instrumented", False):
+        return api
+
+    def wrap(request):
+        def instrumented(method, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                response = request(method, *args, **kwargs)
+            except Exception as e:
+                METRICS.inc(
+                    "api_errors_total",
+                    help="Failed API requests.",
+                    endpoint=method,
+                    error=type(e).__name__,
+                )
+                raise
+            finally:
+                METRICS.inc("api_calls_total", help="API requests.", endpoint=method)
+                METRICS.observe(
+                    "api_request_seconds",
+                    time.perf_counter() - started,
+                    help="Latency of API requests.",
+                    endpoint=method,
+                )
+
+            size = response.headers.get("Content-Length")
+            if size is None and not kwargs.get("stream"):
+                size = len(response.content)
+            METRICS.inc(
+                "api_received_bytes_total",
+                float(size or 0),
+                help="Bytes received from the API.",
+                endpoint=method,
+            )
+
+            return response
+
+        return instrumented
+
+    api.post = wrap(api.post)
+    api.get = wrap(api.get)
+    api.logger = _RetryCountingLogger(api.logger)
+    api._instrumented = True
+
+    sly.logger.debug("API instance is instrumented with metrics.")
+
+    return api
+
+
+def copy_api(api: sly.Api, **attributes) -> sly.Api:
+    """Returns the copy of the API instance with changed attributes, e.g. retry_count.
+    Modules of the API (api.image, api.advanced, ...) are bound to the copy and the copy
+    is instrumented, if the original instance is instrumented.
+    """
+    instrumented = getattr(api, "_instrumented", False)
+
+    client = copy.copy(api)
+    if instrumented:
+        # Wrappers of the original instance call its own methods, so they are replaced.
+        for name in ("post", "get", "_instrumented"):
+            del client.__dict__[name]
+        client.logger = api.logger._logger
+
+    for name, value in attributes.items():
+        setattr(client, name, value)
+
+    _bind_modules(client, client, api)
+
+    if instrumented:
+        instrument_api(client)
+
+    return client
+
+
+def _bind_modules(owner, client: sly.Api, api: sly.Api):
+    for name, module in list(vars(owner).items()):
+        if getattr(module, "_api", None) is api:
+            module = copy.copy(module)
+            module._api = client
+            setattr(owner, name, module)
+            _bind_modules(module, client, api)
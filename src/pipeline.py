@@ -0,0 +1,349 @@
+import os
+from itertools import chain
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import supervisely as sly
+
+from src.filters import ImageFilter
+from src.grouping import EmbeddingStore, group_table
+from src.journal import TaggingJournal
+from src.listing import ImageCursor, Pages, ProjectCursor
+from src.metrics import stage
+from src.previews import PreviewCache
+from src.status import ImageStatus, write_statuses
+from src.tag_writer import TagWriteResult, remove_tags, write_tag_assignments
+
+# Steps of the tagging run, which don't depend on the UI: they are used by the app widgets
+# and by the headless command line entry point (src.cli).
+
+
+def get_tag_meta(
+    api: sly.Api, project_id: int, project_meta: sly.ProjectMeta, tag_name: str
+) -> Tuple[sly.TagMeta, sly.ProjectMeta]:
+    """Returns the tag meta with tag_name from the project, creating it on the server if it
+    doesn't exist, and the project meta with this tag meta.
+    """
+    tag_metas, project_meta = get_tag_metas(
+        api, project_id, project_meta, [sly.TagMeta(tag_name, sly.TagValueType.NONE)]
+    )
+    return tag_metas[0], project_meta
+
+
+def get_tag_metas(
+    api: sly.Api,
+    project_id: int,
+    project_meta: sly.ProjectMeta,
+    tag_metas: List[sly.TagMeta],
+) -> Tuple[List[sly.TagMeta], sly.ProjectMeta]:
+    """Returns tag metas with names of tag_metas from the project and the project meta with
+    them. Tag metas, which don't exist, are created on the server with one request, existing
+    tag metas are used as they are, even if their values differ.
+    """
+    sly.logger.debug(
+        f"Getting tag metas for tag names: {[tag_meta.name for tag_meta in tag_metas]}"
+    )
+
+    missing = []
+    for tag_meta in tag_metas:
+        existing = project_meta.get_tag_meta(tag_meta.name)
+        if existing is None:
+            missing.append(tag_meta)
+        elif existing.value_type != tag_meta.value_type:
+            sly.logger.warning(
+                f"Tag meta {tag_meta.name} already exists with value type "
+                f"{existing.value_type}, it will be used instead of {tag_meta.value_type}."
+            )
+
+    if missing:
+        sly.logger.info(
+            f"Tag metas {[tag_meta.name for tag_meta in missing]} do not exist. "
+            "Creating them."
+        )
+
+        api.project.update_meta(project_id, project_meta.add_tag_metas(missing))
+
+        sly.logger.info("Updated project meta on server.")
+
+        # Tag metas are read back from the server to get their ids.
+        project_meta = sly.ProjectMeta.from_json(api.project.get_meta(project_id))
+
+    return [
+        project_meta.get_tag_meta(tag_meta.name) for tag_meta in tag_metas
+    ], project_meta
+
+
+def list_images(
+    api: sly.Api,
+    dataset_ids: List[int],
+    batch_size: int,
+    project_meta: sly.ProjectMeta,
+    image_filter: Optional[ImageFilter] = None,
+) -> Pages:
+    """Returns the lazy view of the datasets split into batches of batch_size images,
+    several datasets are listed as one sequence of batches.
+    """
+    # Images are sorted by name on the server and fetched page by page when they are needed,
+    # the filter is applied on the server where possible.
+    if len(dataset_ids) == 1:
+        cursor = ImageCursor(
+            api,
+            dataset_ids[0],
+            per_page=batch_size,
+            image_filter=image_filter,
+            project_meta=project_meta,
+        )
+    else:
+        cursor = ProjectCursor(
+            api,
+            dataset_ids,
+            per_page=batch_size,
+            image_filter=image_filter,
+            project_meta=project_meta,
+        )
+
+    pages = Pages(cursor)
+
+    sly.logger.debug(
+        f"Created lazy pages view over {len(cursor)} images with {len(pages)} pages."
+    )
+
+    return pages
+
+
+def group_similar_images(
+    api: sly.Api, data_dir: str, pages: Pages, previews: PreviewCache
+):
+    """Lists all images and orders them, so each batch contains visually similar images.
+    Embeddings of previews are stored in the data directory and reused by next runs.
+    """
+    with stage("listing_all"):
+        pages.cursor.load_all()
+
+    group_table(
+        api, pages.table, previews, EmbeddingStore(os.path.join(data_dir, "embeddings"))
+    )
+
+    sly.logger.debug(f"Grouped {len(pages.table)} images into {len(pages)} pages.")
+
+
+def resume_run(
+    api: sly.Api,
+    data_dir: str,
+    dataset_ids: List[int],
+    tag_name: str,
+    pages: Pages,
+    project_meta: sly.ProjectMeta,
+    on_tagged: Optional[Callable[[List[int]], None]] = None,
+    tag_names: Optional[List[str]] = None,
+) -> Tuple[TaggingJournal, List[int]]:
+    """Opens the journal of the run and restores tagged images from it and from the tags
+    returned with the listing. Returns the journal and rows of loaded tagged images,
+    images, which are loaded later, are passed to on_tagged.
+
+    :param tag_name: name of the run, the name of the tag if the run adds one tag.
+    :param tag_names: names of tags added by the run, images with any of them are tagged.
+    """
+    table = pages.table
+
+    journal = TaggingJournal.for_run(data_dir, dataset_ids, tag_name)
+    journal.replay()
+
+    tag_ids = []
+    for name in tag_names or [tag_name]:
+        tag_meta = project_meta.get_tag_meta(name)
+        if tag_meta is not None:
+            tag_ids.append(tag_meta.sly_id)
+    journal.confirm(api, dataset_ids, tag_ids)
+
+    tagged_rows = table.set_tagged_ids(journal.state.tagged_ids)
+
+    sly.logger.debug(
+        f"Restored {len(journal.state.tagged_ids)} tagged images from journal, "
+        f"{len(tagged_rows)} of them are already listed."
+    )
+
+    # Images, which already have the tag on the server, are skipped, they are found in the
+    # tags returned with the listing.
+    table.on_tagged = on_tagged
+    if tag_ids:
+        tagged_rows.extend(table.set_run_tag_ids(tag_ids))
+
+    return journal, tagged_rows
+
+
+def assign_tags(
+    image_ids: List[int], tags: List[Tuple[sly.TagMeta, Any]]
+) -> Dict[int, List[Tuple[sly.TagMeta, Any]]]:
+    """Returns assignments of the same tags and values to all images."""
+    return {image_id: list(tags) for image_id in image_ids}
+
+
+def tag_images(
+    api: sly.Api,
+    journal: TaggingJournal,
+    assignments: Dict[int, List[Tuple[sly.TagMeta, Any]]],
+    chunk_size: int,
+    concurrency: int = 1,
+    on_chunk: Optional[Callable[[List[int]], None]] = None,
+    should_continue: Optional[Callable[[], bool]] = None,
+    page_number: Optional[int] = None,
+) -> TagWriteResult:
+    """Writes tags to images and records the progress in the journal.
+
+    :param assignments: tag metas and values of tags for each image id.
+    :param page_number: number of the page of images, recorded to undo the batch.
+    """
+    image_ids = list(assignments)
+    image_tag_ids = {
+        image_id: sorted({tag_meta.sly_id for tag_meta, _ in tags})
+        for image_id, tags in assignments.items()
+    }
+    tag_ids = sorted(set(chain.from_iterable(image_tag_ids.values())))
+
+    # Ids are written to the journal before the requests are sent, so they are checked
+    # on the server if the run is stopped before the response is recorded.
+    journal.intent(tag_ids, image_ids, page_number, image_tag_ids)
+
+    def handle_chunk(tagged_chunk):
+        journal.ack(tagged_chunk)
+        if on_chunk is not None:
+            on_chunk(tagged_chunk)
+
+    with stage("tag_write"):
+        return write_tag_assignments(
+            api,
+            {
+                image_id: [(tag_meta.sly_id, value) for tag_meta, value in tags]
+                for image_id, tags in assignments.items()
+            },
+            chunk_size=chunk_size,
+            concurrency=concurrency,
+            on_chunk=handle_chunk,
+            should_continue=should_continue,
+        )
+
+
+def untag_images(
+    api: sly.Api,
+    journal: TaggingJournal,
+    image_tag_ids: Dict[int, List[int]],
+    chunk_size: int,
+    concurrency: int = 1,
+    on_chunk: Optional[Callable[[List[int]], None]] = None,
+    should_continue: Optional[Callable[[], bool]] = None,
+    page_number: Optional[int] = None,
+) -> TagWriteResult:
+    """Removes tags from images, e.g. to undo tagged batches, and forgets images in the
+    journal, so they are tagged again by the run. Images with the same tags are removed with
+    bulk requests, images, which tags weren't removed (failed or left after the stop), are
+    recorded in the journal again, so they are still tagged and can be undone again.
+
+    :param image_tag_ids: ids of tag metas to remove from each image.
+    :param page_number: number of the page of the undone batch, recorded for failed images.
+    """
+    journal.forget(list(image_tag_ids))
+
+    groups = {}
+    for image_id, tag_ids in image_tag_ids.items():
+        groups.setdefault(tuple(sorted(tag_ids)), []).append(image_id)
+
+    result = TagWriteResult()
+    with stage("tag_remove"):
+        for tag_ids, image_ids in groups.items():
+            group_result = remove_tags(
+                api,
+                image_ids,
+                list(tag_ids),
+                chunk_size=chunk_size,
+                concurrency=concurrency,
+                on_chunk=on_chunk,
+                should_continue=should_continue,
+            )
+            result.tagged.extend(group_result.tagged)
+            result.errors.update(group_result.errors)
+
+    # Failed images and images left after the stop still have their tags.
+    removed_ids = set(result.tagged)
+    kept = {
+        image_id: tag_ids
+        for image_id, tag_ids in image_tag_ids.items()
+        if image_id not in removed_ids
+    }
+    if kept:
+        journal.intent(
+            sorted(set(chain.from_iterable(kept.values()))),
+            list(kept),
+            page_number,
+            kept,
+        )
+        journal.ack(list(kept))
+
+    return result
+
+
+def save_statuses(
+    api: sly.Api,
+    pages: Pages,
+    tag_name: str,
+    page_number: int,
+    image_ids: List[int],
+    result: TagWriteResult,
+    skipped_ids: Optional[List[int]] = None,
+    concurrency: int = 1,
+) -> Dict[int, str]:
+    """Writes statuses of images of the batch to their metadata after the tag was written:
+    tagged and failed images, images of the batch, which were left out by the user, and
+    images, which weren't written because the run was stopped. Returns statuses of images
+    by their rows in the table.
+    """
+    table = pages.table
+
+    tagged_ids = set(result.tagged)
+    pending_ids = [
+        image_id
+        for image_id in image_ids
+        if image_id not in tagged_ids and image_id not in result.errors
+    ]
+
+    statuses = {}
+    for status_ids, status in (
+        (skipped_ids or [], ImageStatus.SKIPPED),
+        (pending_ids, ImageStatus.PENDING),
+        (list(result.errors), ImageStatus.ERROR),
+        (result.tagged, ImageStatus.TAGGED),
+    ):
+        for row in table.rows_by_ids(status_ids):
+            statuses[row] = status
+
+    with stage("status_write"):
+        status_result = write_statuses(
+            api, table, tag_name, statuses, page_number, concurrency=concurrency
+        )
+
+    if status_result.errors:
+        sly.logger.warning(
+            f"Failed to save statuses of {len(status_result.errors)} images of batch "
+            f"{page_number}: {list(status_result.errors)}."
+        )
+
+    return statuses
+
+
+def reset_statuses(
+    api: sly.Api,
+    pages: Pages,
+    tag_name: str,
+    image_ids: List[int],
+    concurrency: int = 1,
+) -> Dict[int, str]:
+    """Writes the pending status to images, which tags were removed. Returns statuses of
+    images by their rows in the table.
+    """
+    statuses = {row: ImageStatus.PENDING for row in pages.table.rows_by_ids(image_ids)}
+
+    with stage("status_write"):
+        write_statuses(
+            api, pages.table, tag_name, statuses, batch=None, concurrency=concurrency
+        )
+
+    return statuses
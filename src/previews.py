@@ -0,0 +1,258 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from urllib.parse import urljoin, urlparse
+
+import requests
+import supervisely as sly
+from supervisely._utils import abs_url, compress_image_url
+
+from src.metrics import METRICS, stage
+
+# Width of previews in the galleries: the card is split into 5 columns, so the column is
+# about 300 pixels wide on the full HD screen.
+THUMBNAIL_WIDTH = 300
+
+
+def thumbnail_url(image_info: sly.ImageInfo, width: int = THUMBNAIL_WIDTH) -> str:
+    """Returns the URL of the preview of the image resized to the width on the server,
+    the same as sly.ImageInfo.preview_url, but with the width of the gallery column.
+    """
+    url = image_info.full_storage_url
+    if sly.is_development():
+        url = abs_url(url)
+    return compress_image_url(url, width=width)
+
+
+class PreviewCache:
+    """Bounded cache of previews on the disk in the static directory of the app, so the
+    galleries load revisited images from the app instead of the server. Files are named
+    after the id and the hash of the image, so the preview changes with the image, and
+    the least recently used files are removed when the size of the cache exceeds max_bytes.
+    Files left from the previous start of the app are reused, they are found in the
+    background thread started by start() or by the first lookup, so the app starts without
+    waiting for the disk, and lookups wait for it.
+
+    :param directory: directory in the static directory of the app.
+    :param static_url: URL of the directory in the app.
+    :param max_bytes: maximum size of all previews in the cache.
+    :param max_workers: number of threads downloading previews.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        static_url: str,
+        max_bytes: int = 256 * 1024 * 1024,
+        max_workers: int = 4,
+    ):
+        self.directory = directory
+        self.static_url = static_url.rstrip("/")
+        self.max_bytes = max_bytes
+        # Connections to the server are reused by all downloads.
+        self.session = requests.Session()
+
+        self._files = OrderedDict()
+        self._size = 0
+        self._loading = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="previews"
+        )
+
+        self._scanned = threading.Event()
+        self._scan_thread = None
+
+    def start(self):
+        """Starts creating the directory and restoring the cache from it in the background,
+        if it isn't started yet.
+        """
+        with self._lock:
+            if self._scan_thread is None:
+                self._scan_thread = threading.Thread(
+                    target=self._scan, daemon=True, name="previews-scan"
+                )
+                self._scan_thread.start()
+
+    def _wait_scanned(self):
+        self.start()
+        self._scanned.wait()
+
+    @property
+    def size(self) -> int:
+        self._wait_scanned()
+        return self._size
+
+    def __len__(self):
+        self._wait_scanned()
+        return len(self._files)
+
+    def url(self, image_id: int, image_hash: str) -> Optional[str]:
+        """Returns the URL of the cached preview in the app or None if it's not cached."""
+        self._wait_scanned()
+        file_name = self._file_name(image_id, image_hash)
+        with self._lock:
+            cached = file_name in self._files
+            if cached:
+                self._files.move_to_end(file_name)
+
+        METRICS.inc(
+            "preview_cache_requests_total",
+            help="Lookups of previews in the local cache.",
+            result="hit" if cached else "miss",
+        )
+
+        if cached:
+            return f"{self.static_url}/{file_name}"
+
+    def urls(self, api: sly.Api, images: list) -> List[str]:
+        """Returns URLs of previews of images (ImageRow) for the gallery: cached previews
+        are loaded from the app, others from the server and are downloaded to the cache
+        in the background, so they are loaded from the app next time.
+        """
+        urls = []
+        missing = []
+        for image in images:
+            url = self.url(image.id, image.hash)
+            if url is None:
+                url = image.preview_url
+                missing.append(image)
+            urls.append(url)
+
+        if missing:
+            self.prefetch(api, missing)
+
+        return urls
+
+    def prefetch(self, api: sly.Api, images: list):
+        """Downloads previews of images (ImageRow), which are not cached, in the background."""
+        self._wait_scanned()
+        with self._lock:
+            missing = []
+            for image in images:
+                file_name = self._file_name(image.id, image.hash)
+                if file_name not in self._files and file_name not in self._loading:
+                    self._loading.add(file_name)
+                    missing.append((file_name, image.preview_url))
+
+        if not missing:
+            return
+
+        sly.logger.debug(f"Downloading {len(missing)} previews to the cache.")
+
+        for file_name, url in missing:
+            self._executor.submit(self._load, api, file_name, url)
+
+    def read(self, api: sly.Api, image) -> bytes:
+        """Returns the content of the preview of the image (ImageRow) from the cache or
+        downloads it without adding to the cache, e.g. to embed all images of the dataset
+        without evicting previews of the pages.
+        """
+        self._wait_scanned()
+        file_name = self._file_name(image.id, image.hash)
+        with self._lock:
+            cached = file_name in self._files
+
+        if cached:
+            try:
+                with open(os.path.join(self.directory, file_name), "rb") as f:
+                    return f.read()
+            except FileNotFoundError:
+                # The preview was evicted after the lookup.
+                pass
+
+        return self._download(api, image.preview_url)
+
+    def _download(self, api: sly.Api, url: str) -> bytes:
+        # Storage URLs are relative to the server in production, the token is sent only
+        # to the server itself, previews of links can be stored elsewhere.
+        url = urljoin(api.server_address, url)
+        same_host = urlparse(url).netloc == urlparse(api.server_address).netloc
+        headers = api.headers if same_host else None
+
+        with stage("preview_download"):
+            response = self.session.get(url, headers=headers, timeout=60)
+            response.raise_for_status()
+        return response.content
+
+    def _load(self, api: sly.Api, file_name: str, url: str):
+        try:
+            self._put(file_name, self._download(api, url))
+        except Exception as e:
+            sly.logger.warning(f"Failed to download preview {url}: {e}")
+        finally:
+            with self._lock:
+                self._loading.discard(file_name)
+
+    def _put(self, file_name: str, content: bytes):
+        path = os.path.join(self.directory, file_name)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._size += len(content) - self._files.pop(file_name, 0)
+            self._files[file_name] = len(content)
+            evicted = self._evict()
+
+        for evicted_name in evicted:
+            try:
+                os.remove(os.path.join(self.directory, evicted_name))
+            except FileNotFoundError:
+                pass
+
+    def _evict(self) -> List[str]:
+        evicted = []
+        while self._size > self.max_bytes and len(self._files) > 1:
+            file_name, size = self._files.popitem(last=False)
+            self._size -= size
+            evicted.append(file_name)
+
+        if evicted:
+            sly.logger.debug(
+                f"Evicted {len(evicted)} previews, cache size is {self._size} bytes."
+            )
+        return evicted
+
+    def _scan(self):
+        """Creates the directory and restores the cache from the files in it, the oldest
+        files are evicted first. Lookups wait until the scan is finished, so the cache is
+        empty if the directory can't be read.
+        """
+        try:
+            with stage("preview_scan"):
+                os.makedirs(self.directory, exist_ok=True)
+                entries = []
+                for entry in os.scandir(self.directory):
+                    if entry.name.endswith(".tmp"):
+                        os.remove(entry.path)
+                    elif entry.is_file():
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, entry.name, stat.st_size))
+
+                with self._lock:
+                    for _, file_name, size in sorted(entries):
+                        self._files[file_name] = size
+                        self._size += size
+                    evicted = self._evict()
+
+                for file_name in evicted:
+                    os.remove(os.path.join(self.directory, file_name))
+
+            sly.logger.debug(
+                f"Found {len(self._files)} previews with size {self._size} bytes in the cache."
+            )
+        except Exception as e:
+            sly.logger.warning(f"Failed to scan the cache of previews: {e}")
+        finally:
+            self._scanned.set()
+
+    @staticmethod
+    def _file_name(image_id: int, image_hash: str) -> str:
+        # Hashes of images are base64 strings, which can contain slashes.
+        digest = hashlib.sha1((image_hash or "").encode("utf-8")).hexdigest()[:16]
+        return f"{image_id}_{digest}.jpg"
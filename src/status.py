@@ -0,0 +1,162 @@
+import json
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import supervisely as sly
+
+from src.image_table import ImageTable
+from src.journal import get_infos_by_ids
+from src.tag_writer import TagWriteResult, write_chunks, write_client
+
+# Key of the image metadata with statuses of tagging, statuses are stored for each tag name:
+# {"batch_tagging": {"<tag name>": {"status": "tagged", "batch": 3, "time": "..."}}}, other
+# keys of the metadata are kept as they are.
+STATUS_KEY = "batch_tagging"
+
+
+class ImageStatus:
+    PENDING = "pending"
+    TAGGED = "tagged"
+    SKIPPED = "skipped"
+    ERROR = "error"
+
+    ALL = (PENDING, TAGGED, SKIPPED, ERROR)
+
+
+def status_of(meta: dict, tag_name: str) -> Optional[dict]:
+    """Returns the stored status of tagging with tag_name, None if there is no status."""
+    statuses = meta.get(STATUS_KEY)
+    if not isinstance(statuses, dict):
+        return None
+    return statuses.get(tag_name)
+
+
+def with_status(
+    meta: dict, tag_name: str, status: str, batch: Optional[int], time: str
+) -> dict:
+    """Returns the copy of the metadata with the status of tagging with tag_name."""
+    statuses = meta.get(STATUS_KEY)
+    statuses = dict(statuses) if isinstance(statuses, dict) else {}
+    statuses[tag_name] = {"status": status, "batch": batch, "time": time}
+    return {**meta, STATUS_KEY: statuses}
+
+
+def aggregate_statuses(table: ImageTable, tag_name: str) -> Dict[str, np.ndarray]:
+    """Returns rows of loaded images for each status of tagging with tag_name, read from the
+    metadata returned with the listing, so no annotations are downloaded. Only images with
+    metadata are parsed, images without the status are pending.
+    """
+    rows = np.flatnonzero(table.loaded & (table.metas.lengths >= 0))
+    statuses = np.full(len(rows), ImageStatus.PENDING, dtype=object)
+
+    for position, row in enumerate(rows):
+        meta = table.metas[row]
+        # Most of the metadata (e.g. EXIF) doesn't have statuses, so it isn't parsed.
+        if STATUS_KEY not in meta:
+            continue
+        status = status_of(json.loads(meta), tag_name)
+        if status is not None and status.get("status") in ImageStatus.ALL:
+            statuses[position] = status["status"]
+
+    result = {
+        status: rows[statuses == status]
+        for status in ImageStatus.ALL
+        if status != ImageStatus.PENDING
+    }
+
+    sly.logger.debug(
+        f"Aggregated statuses of {len(rows)} images with metadata: "
+        + ", ".join(f"{status}: {len(found)}" for status, found in result.items())
+    )
+
+    return result
+
+
+def write_statuses(
+    api: sly.Api,
+    table: ImageTable,
+    tag_name: str,
+    statuses: Dict[int, str],
+    batch: Optional[int],
+    concurrency: int = 1,
+    should_continue: Optional[Callable[[], bool]] = None,
+    chunk_size: int = 20,
+) -> TagWriteResult:
+    """Writes statuses of tagging with tag_name to the metadata of images.
+
+    Statuses are given for rows of the table, so each image gets one write with its latest
+    status, images, which already have the same status, are skipped. The server replaces the
+    metadata as a whole, so the metadata of each chunk of images is read again with one
+    listing request right before it's written and the status is merged into it: changes made
+    after the listing (e.g. statuses of another session) are kept. The server has no bulk
+    endpoint for writing the metadata, so the metadata of each image is written with its own
+    request, changes made between the read of the chunk and the write of the image are lost.
+    Chunks are written concurrently with the same adaptive limit as tag writes. Written
+    metadata is stored in the table, so the status of loaded images is up to date.
+
+    :param statuses: statuses of images by their rows in the table.
+    :param batch: number of the batch, which is stored with the status, None if the status
+        isn't related to a batch (e.g. tags were removed).
+    :param chunk_size: number of images, which metadata is read with one request.
+    """
+    time = datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+    # Images with the same status in the listing are skipped without requests.
+    rows = {}
+    for row, status in statuses.items():
+        stored = status_of(table.meta_of(row), tag_name)
+        if stored is None or stored.get("status") != status:
+            rows[int(table.ids[row])] = row
+
+    sly.logger.debug(
+        f"Writing statuses of {len(rows)} images of batch {batch}, "
+        f"{len(statuses) - len(rows)} images already have them."
+    )
+
+    api = write_client(api)
+
+    # Metadata of images, which was written or already had the status on the server.
+    written = {}
+
+    def write_chunk(image_ids: List[int]):
+        image_ids = [image_id for image_id in image_ids if image_id not in written]
+        dataset_of = table.dataset_of([rows[image_id] for image_id in image_ids])
+
+        metas = {}
+        for dataset_id in np.unique(dataset_of):
+            dataset_image_ids = [
+                image_id
+                for image_id, image_dataset_id in zip(image_ids, dataset_of)
+                if image_dataset_id == dataset_id
+            ]
+            for image_info in get_infos_by_ids(api, int(dataset_id), dataset_image_ids):
+                metas[image_info.id] = image_info.meta or {}
+
+        for image_id in image_ids:
+            if image_id not in metas:
+                raise ValueError(f"Image {image_id} is not found on the server.")
+
+            status = statuses[rows[image_id]]
+            stored = status_of(metas[image_id], tag_name)
+            if stored is None or stored.get("status") != status:
+                meta = with_status(metas[image_id], tag_name, status, batch, time)
+                api.image.update_meta(image_id, meta)
+                metas[image_id] = meta
+
+            written[image_id] = metas[image_id]
+
+    def handle_chunk(image_ids: List[int]):
+        table.set_metas(
+            [rows[image_id] for image_id in image_ids],
+            [written[image_id] for image_id in image_ids],
+        )
+
+    return write_chunks(
+        list(rows.keys()),
+        write_chunk,
+        chunk_size=chunk_size,
+        on_chunk=handle_chunk,
+        should_continue=should_continue,
+        concurrency=concurrency,
+    )
@@ -0,0 +1,77 @@
+from typing import Any, List, Optional
+
+import supervisely as sly
+
+# Tags of the run are defined with one string, definitions are separated with commas:
+# "reviewed" is a tag without value, "quality: good|bad" is a tag with one of the values,
+# "score: number" and "comment: text" are tags with any number or any string.
+SEPARATOR = ","
+VALUES_SEPARATOR = "|"
+NUMBER = "number"
+TEXT = "text"
+
+
+def parse_tag_metas(text: str) -> List[sly.TagMeta]:
+    """Returns tag metas defined in the text, raises ValueError if the text is invalid."""
+    tag_metas = []
+    for definition in text.split(SEPARATOR):
+        name, _, values = (part.strip() for part in definition.partition(":"))
+        if not name:
+            raise ValueError(f"Tag name is empty in the definition {definition!r}.")
+
+        if not values:
+            tag_meta = sly.TagMeta(name, sly.TagValueType.NONE)
+        elif values == NUMBER:
+            tag_meta = sly.TagMeta(name, sly.TagValueType.ANY_NUMBER)
+        elif values == TEXT:
+            tag_meta = sly.TagMeta(name, sly.TagValueType.ANY_STRING)
+        else:
+            possible_values = [
+                value.strip()
+                for value in values.split(VALUES_SEPARATOR)
+                if value.strip()
+            ]
+            tag_meta = sly.TagMeta(
+                name, sly.TagValueType.ONEOF_STRING, possible_values=possible_values
+            )
+
+        if any(other.name == name for other in tag_metas):
+            raise ValueError(f"Tag {name} is defined twice.")
+
+        tag_metas.append(tag_meta)
+
+    return tag_metas
+
+
+def run_tag_name(tag_metas: List[sly.TagMeta]) -> str:
+    """Returns the name of the tagging run with these tags, used for the journal, leases
+    and statuses of images. The name of the run with one tag is the name of the tag.
+    """
+    return ", ".join(tag_meta.name for tag_meta in tag_metas)
+
+
+def parse_value(tag_meta: sly.TagMeta, text: Optional[str]) -> Any:
+    """Returns the value of the tag from the text, raises ValueError if the tag can't
+    have this value.
+    """
+    if tag_meta.value_type == sly.TagValueType.NONE:
+        return None
+
+    text = (text or "").strip()
+    if tag_meta.value_type == sly.TagValueType.ANY_NUMBER:
+        try:
+            value = float(text)
+        except ValueError:
+            raise ValueError(f"Value of tag {tag_meta.name} must be a number.")
+        return int(value) if value.is_integer() else value
+
+    if not tag_meta.is_valid_value(text) or not text:
+        raise ValueError(
+            f"Value {text!r} is not valid for tag {tag_meta.name}"
+            + (
+                f", possible values: {', '.join(tag_meta.possible_values)}."
+                if tag_meta.possible_values
+                else "."
+            )
+        )
+    return text
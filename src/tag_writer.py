@@ -0,0 +1,417 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+import supervisely as sly
+
+from src.metrics import copy_api
+
+# HTTP status codes, which mean that the server is overloaded and the request can be retried.
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TagWriteResult:
+    """Result of writing tags to a list of images: ids of successfully tagged images
+    in the order they were acknowledged and a mapping of failed image ids to error messages.
+    """
+
+    def __init__(self):
+        self.tagged = []
+        self.errors = {}
+
+    def __repr__(self):
+        return f"TagWriteResult(tagged={len(self.tagged)}, errors={len(self.errors)})"
+
+
+class AdaptiveLimiter:
+    """Limits the number of concurrent requests with additive increase / multiplicative
+    decrease: each throttled response (429 or 5xx) halves the allowed concurrency and pauses
+    new requests for an exponentially growing delay, each successful response grows the
+    concurrency back by one slot per full window of successful requests.
+    Responses to requests sent before the last decrease don't decrease it again, so a burst
+    of throttled requests which were in flight together is handled as a single signal.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        min_backoff: float = 0.2,
+        max_backoff: float = 30.0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+
+        self._backoff = min_backoff
+        self._paused_until = 0.0
+        self._decreased_at = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(
+        self, should_continue: Optional[Callable[[], bool]] = None
+    ) -> Optional[float]:
+        """Waits for a free slot and returns the time when it was taken, which must be
+        passed to release(). Returns None if should_continue returned False while waiting,
+        in this case the slot is not taken and the request must not be sent.
+        """
+        with self._condition:
+            while True:
+                if should_continue is not None and not should_continue():
+                    return None
+
+                now = time.monotonic()
+                if now >= self._paused_until and self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return now
+
+                pause = self._paused_until - now
+
+                # Waking up periodically to check the stop flag.
+                self._condition.wait(timeout=min(max(pause, 0.05), 0.5))
+
+    def release(self, acquired_at: float, throttled: bool = False):
+        with self._condition:
+            self.in_flight -= 1
+
+            if throttled and acquired_at < self._decreased_at:
+                sly.logger.debug("Request sent before the last backoff was throttled.")
+            elif throttled:
+                self._decreased_at = time.monotonic()
+                self.limit = max(1.0, self.limit / 2)
+                self._paused_until = time.monotonic() + self._backoff
+                sly.logger.warning(
+                    f"Server is throttling requests, concurrency decreased to {int(self.limit)}, "
+                    f"pausing requests for {self._backoff:.1f}s."
+                )
+                self._backoff = min(self._backoff * 2, self.max_backoff)
+            else:
+                self.limit = min(
+                    float(self.max_concurrency), self.limit + 1 / self.limit
+                )
+                self._backoff = self.min_backoff
+
+            self._condition.notify_all()
+
+
+def chunked(items: List, chunk_size: int) -> List[List]:
+    """Splits the list into chunks with chunk_size items (the last one can be smaller)."""
+    if chunk_size < 1:
+        raise ValueError(f"Chunk size must be positive, got {chunk_size}.")
+
+    return [items[i : i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+
+def write_client(api: sly.Api) -> sly.Api:
+    """Returns the copy of the API instance, which sends each request only once.
+    sly.Api retries 429/5xx responses and connection errors itself up to 10 times with
+    sleeps of up to 60 seconds, so the limiter would get the throttling signal minutes late
+    and a stopped writing would wait for the sleeping request. Writes are retried by
+    write_chunks instead, with the adaptive backoff and the stop check between attempts.
+    """
+    return copy_api(api, retry_count=1, retry_sleep_sec=0)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Checks if the error means that the server is overloaded or unavailable.
+    sly.Api raises RetryError instead of the 429/5xx response when its attempts are
+    exhausted, so it's also handled as a throttling signal.
+    """
+    retryable_errors = (
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+        requests.exceptions.RetryError,
+    )
+    if isinstance(error, retryable_errors):
+        return True
+
+    response = getattr(error, "response", None)
+    status_code = getattr(response, "status_code", None)
+
+    return status_code in RETRYABLE_STATUS_CODES
+
+
+def write_tags(
+    api: sly.Api,
+    image_ids: List[int],
+    tag_id: int,
+    chunk_size: int,
+    value=None,
+    on_chunk: Optional[Callable[[List[int]], None]] = None,
+    should_continue: Optional[Callable[[], bool]] = None,
+    concurrency: int = 1,
+    max_retries: int = 10,
+) -> TagWriteResult:
+    """Adds the tag with tag_id to all images from image_ids using bulk API calls.
+    Image ids are grouped into chunks of chunk_size and chunks are written by a pool of
+    concurrency threads, one request per chunk. The number of requests in flight is adapted
+    to the server: it's decreased on 429/5xx responses and grows back when they stop.
+
+    Throttled chunks are retried up to max_retries times. If the request for the chunk fails
+    with any other error, the chunk is split in halves and each half is retried, so only the
+    images which are actually failing are reported as errors and the number of extra requests
+    stays logarithmic to the chunk size.
+
+    on_chunk is always called from the calling thread, so it can safely update progress bars.
+    should_continue is also checked by the worker threads, so it must only read a flag.
+    If it returns False, no new requests are sent, requests which are already in flight
+    are awaited and their results are reported.
+
+    :param api: Supervisely API instance.
+    :param image_ids: ids of images to tag.
+    :param tag_id: id of the tag meta on the server.
+    :param chunk_size: number of images written with one request.
+    :param value: optional value of the tag.
+    :param on_chunk: callback, called with ids of images tagged by each successful request.
+    :param should_continue: callback, checked before each request, if it returns False,
+        writing is stopped and remaining images are left untouched.
+    :param concurrency: maximum number of requests in flight.
+    :param max_retries: maximum number of retries for the throttled chunk.
+    """
+    sly.logger.debug(f"Writing tag with id {tag_id} to {len(image_ids)} images.")
+
+    return write_tag_assignments(
+        api,
+        {image_id: [(tag_id, value)] for image_id in image_ids},
+        chunk_size,
+        on_chunk=on_chunk,
+        should_continue=should_continue,
+        concurrency=concurrency,
+        max_retries=max_retries,
+    )
+
+
+def write_tag_assignments(
+    api: sly.Api,
+    assignments: Dict[int, List[Tuple[int, Any]]],
+    chunk_size: int,
+    on_chunk: Optional[Callable[[List[int]], None]] = None,
+    should_continue: Optional[Callable[[], bool]] = None,
+    concurrency: int = 1,
+    max_retries: int = 10,
+) -> TagWriteResult:
+    """Adds tags to images, each image can get its own tags and values, e.g. different tags
+    assigned in one batch. Images are written in chunks as in write_tags, tags of the chunk
+    are grouped by the tag and value, so the chunk is written with one bulk request for each
+    distinct tag and value. The image is reported as tagged, when all its tags are written.
+
+    :param assignments: pairs of the tag meta id and the value for each image id.
+    """
+    api = write_client(api)
+
+    if not hasattr(api.image, "add_tag_batch"):
+        # Without the bulk endpoint each image is written with its own request, so the
+        # errors are attributed to images directly and nothing is written twice.
+        sly.logger.warning(
+            "Bulk tagging endpoint is not available, images will be tagged one by one."
+        )
+        chunk_size = 1
+
+    # Tags, which were written, so they aren't written twice when the chunk is retried
+    # or split after one of its requests failed.
+    written = set()
+    written_lock = threading.Lock()
+
+    def write_chunk(chunk: List[int]):
+        groups = group_assignments(
+            {image_id: assignments[image_id] for image_id in chunk}
+        )
+        for (tag_id, value), image_ids in groups.items():
+            with written_lock:
+                image_ids = [
+                    image_id
+                    for image_id in image_ids
+                    if (image_id, tag_id, value) not in written
+                ]
+            if not image_ids:
+                continue
+
+            _add_tag_to_chunk(api, image_ids, tag_id, value)
+
+            with written_lock:
+                written.update((image_id, tag_id, value) for image_id in image_ids)
+
+    return write_chunks(
+        list(assignments),
+        write_chunk,
+        chunk_size,
+        on_chunk=on_chunk,
+        should_continue=should_continue,
+        concurrency=concurrency,
+        max_retries=max_retries,
+    )
+
+
+def remove_tags(
+    api: sly.Api,
+    image_ids: List[int],
+    tag_ids: List[int],
+    chunk_size: int,
+    on_chunk: Optional[Callable[[List[int]], None]] = None,
+    should_continue: Optional[Callable[[], bool]] = None,
+    concurrency: int = 1,
+    max_retries: int = 10,
+) -> TagWriteResult:
+    """Removes all tags with tag_ids from images with one bulk request per chunk, chunks are
+    written as in write_tags. Removal is idempotent, so retried chunks are safe.
+
+    :param tag_ids: ids of tag metas on the server.
+    """
+    sly.logger.debug(f"Removing tags with ids {tag_ids} from {len(image_ids)} images.")
+    api = write_client(api)
+
+    return write_chunks(
+        image_ids,
+        lambda chunk: api.advanced.remove_tags_from_images(tag_ids, chunk),
+        chunk_size,
+        on_chunk=on_chunk,
+        should_continue=should_continue,
+        concurrency=concurrency,
+        max_retries=max_retries,
+    )
+
+
+def group_assignments(
+    assignments: Dict[int, List[Tuple[int, Any]]],
+) -> Dict[Tuple[int, Any], List[int]]:
+    """Returns ids of images for each pair of the tag meta id and the value."""
+    groups = {}
+    for image_id, tags in assignments.items():
+        for tag_id, value in tags:
+            groups.setdefault((tag_id, value), []).append(image_id)
+    return groups
+
+
+def write_chunks(
+    image_ids: List[int],
+    write_chunk: Callable[[List[int]], None],
+    chunk_size: int,
+    on_chunk: Optional[Callable[[List[int]], None]] = None,
+    should_continue: Optional[Callable[[], bool]] = None,
+    concurrency: int = 1,
+    max_retries: int = 10,
+) -> TagWriteResult:
+    """Calls write_chunk for chunks of image ids with the adaptive concurrency, retries and
+    splitting of failed chunks described in write_tags, used for all writes to images.
+
+    :param image_ids: ids of images to write.
+    :param write_chunk: function, which writes the chunk of images with one request.
+    :param chunk_size: number of images written with one request.
+    """
+    result = TagWriteResult()
+
+    if should_continue is None:
+        should_continue = lambda: True
+
+    # Each pending item is a chunk of image ids and the number of retries already made.
+    pending = deque((chunk, 0) for chunk in chunked(image_ids, chunk_size))
+    limiter = AdaptiveLimiter(concurrency)
+
+    sly.logger.debug(
+        f"Writing {len(image_ids)} images in {len(pending)} chunks "
+        f"with chunk size {chunk_size} and concurrency {concurrency}."
+    )
+
+    def send(chunk):
+        acquired_at = limiter.acquire(should_continue)
+        if acquired_at is None:
+            return False
+
+        throttled = False
+        try:
+            write_chunk(chunk)
+        except Exception as e:
+            throttled = is_retryable(e)
+            raise
+        finally:
+            limiter.release(acquired_at, throttled)
+
+        return True
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        in_flight = {}
+
+        while pending or in_flight:
+            while pending and len(in_flight) < concurrency and should_continue():
+                chunk, retries = pending.popleft()
+                in_flight[executor.submit(send, chunk)] = (chunk, retries)
+
+            if not in_flight:
+                sly.logger.info("Writing was stopped, remaining chunks are skipped.")
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                chunk, retries = in_flight.pop(future)
+
+                try:
+                    sent = future.result()
+                except Exception as e:
+                    _handle_failed_chunk(
+                        e, chunk, retries, max_retries, pending, result
+                    )
+                    continue
+
+                if not sent:
+                    # The request was cancelled before it was sent.
+                    continue
+
+                result.tagged.extend(chunk)
+
+                if on_chunk is not None:
+                    on_chunk(chunk)
+
+    sly.logger.debug(f"Finished writing: {result}.")
+
+    return result
+
+
+def _handle_failed_chunk(
+    error: Exception,
+    chunk: List[int],
+    retries: int,
+    max_retries: int,
+    pending: deque,
+    result: TagWriteResult,
+):
+    """Decides what to do with the chunk after the failed request: retry it, split it
+    in halves to find the failing images or report all its images as errors.
+    Retried chunks are put to the front of the queue to keep the original order of images.
+    """
+    if is_retryable(error) and retries < max_retries:
+        sly.logger.warning(
+            f"Writing chunk of {len(chunk)} images was throttled: {error}. "
+            f"Retrying ({retries + 1}/{max_retries})."
+        )
+        pending.appendleft((chunk, retries + 1))
+        return
+
+    if len(chunk) > 1 and not is_retryable(error):
+        sly.logger.warning(
+            f"Writing chunk of {len(chunk)} images failed: {error}. "
+            "Splitting the chunk to find failing images."
+        )
+        middle = len(chunk) // 2
+        pending.appendleft((chunk[middle:], 0))
+        pending.appendleft((chunk[:middle], 0))
+        return
+
+    for image_id in chunk:
+        sly.logger.error(
+            f"There was an error while writing image with id {image_id}: {error}."
+        )
+        result.errors[image_id] = str(error)
+
+
+def _add_tag_to_chunk(api: sly.Api, image_ids: List[int], tag_id: int, value=None):
+    """Adds the tag to all images in chunk with one request."""
+    if len(image_ids) == 1:
+        api.image.add_tag(image_ids[0], tag_id, value=value)
+    else:
+        api.image.add_tag_batch(image_ids, tag_id, value=value)
@@ -1,4 +1,5 @@
 import os
+import threading
 
 import supervisely as sly
 from supervisely.app.widgets import (
@@ -26,25 +27,48 @@ no_dataset_message = Text(
 )
 no_dataset_message.hide()
 
+
+def show_dataset_thumbnail():
+    """Shows the thumbnail of the selected dataset, infos are requested only if they aren't
+    in the cache.
+    """
+    dataset_thumbnail.set(
+        g.STATE.infos.project(g.api, g.STATE.selected_project),
+        g.STATE.infos.dataset(g.api, g.STATE.selected_dataset),
+    )
+    dataset_thumbnail.show()
+
+
 if g.STATE.selected_dataset and g.STATE.selected_project:
     # If the app was loaded from a dataset.
     sly.logger.debug("App was loaded from a dataset.")
 
-    # Stting values to the widgets from environment variables.
+    # The selector is never shown, so it's created without the default dataset, which
+    # the widget would request from the API before the app starts.
     select_dataset = SelectDataset(
-        default_id=g.STATE.selected_dataset, project_id=g.STATE.selected_project
+        project_id=g.STATE.selected_project,
+        compact=True,
+        show_label=False,
+        multiselect=True,
     )
 
     # Hiding unnecessary widgets.
     select_dataset.hide()
     load_button.hide()
 
-    # Creating a dataset thumbnail to show.
-    dataset_thumbnail.set(
-        g.api.project.get_info_by_id(g.STATE.selected_project),
-        g.api.dataset.get_info_by_id(g.STATE.selected_dataset),
-    )
-    dataset_thumbnail.show()
+    # Infos for the dataset thumbnail are requested in the background thread, so the app
+    # starts serving requests without waiting for the API, the project meta is requested
+    # there too, so saving settings finds it in the cache.
+    def show_selected_dataset():
+        try:
+            show_dataset_thumbnail()
+            g.STATE.infos.project_meta(g.api, g.STATE.selected_project)
+        except Exception as e:
+            sly.logger.warning(f"Failed to show the thumbnail of the dataset: {e}")
+
+    threading.Thread(
+        target=show_selected_dataset, daemon=True, name="dataset-thumbnail"
+    ).start()
 
     settings.card.unlock()
     settings.card.uncollapse()
@@ -53,18 +77,22 @@ elif g.STATE.selected_project:
     sly.logger.debug("App was loaded from a project.")
 
     select_dataset = SelectDataset(
-        project_id=g.STATE.selected_project, compact=True, show_label=False
+        project_id=g.STATE.selected_project,
+        compact=True,
+        show_label=False,
+        multiselect=True,
+        select_all_datasets=True,
     )
 else:
     # If the app was loaded from ecosystem: showing the dataset selector in full mode.
     sly.logger.debug("App was loaded from ecosystem.")
 
-    select_dataset = SelectDataset()
+    select_dataset = SelectDataset(multiselect=True)
 
 # Input card with all widgets.
 card = Card(
     "1️⃣ Input dataset",
-    "Images from the selected dataset will be loaded.",
+    "Images from the selected datasets will be loaded and tagged in one run.",
     content=Container(
         widgets=[
             dataset_thumbnail,
@@ -84,10 +112,12 @@ def load_dataset():
     calling the API to get project, workspace and team ids (if they're not set),
     building the table with images and unlocking the rotator and output cards.
     """
-    # Reading the dataset id from SelectDataset widget.
-    dataset_id = select_dataset.get_selected_id()
+    # Reading the dataset ids from SelectDataset widget.
+    dataset_ids = [
+        dataset_id for dataset_id in select_dataset.get_selected_ids() if dataset_id
+    ]
 
-    if not dataset_id:
+    if not dataset_ids:
         # If the dataset id is empty, showing the warning message.
         no_dataset_message.show()
         return
@@ -96,7 +126,8 @@ def load_dataset():
     no_dataset_message.hide()
 
     # Changing the values of the global variables to access them from other modules.
-    g.STATE.selected_dataset = dataset_id
+    g.STATE.selected_datasets = dataset_ids
+    g.STATE.selected_dataset = dataset_ids[0]
 
     # Cleaning the static directory when the new dataset is selected.
     clean_static_dir()
@@ -109,35 +140,36 @@ def load_dataset():
     change_dataset_button.show()
 
     sly.logger.debug(
-        f"Calling API with dataset ID {dataset_id} to get project, workspace and team IDs."
+        f"Calling API with dataset IDs {dataset_ids} to get project, workspace and team IDs."
     )
 
-    g.STATE.selected_project = g.api.dataset.get_info_by_id(dataset_id).project_id
-    g.STATE.selected_workspace = g.api.project.get_info_by_id(
-        g.STATE.selected_project
-    ).workspace_id
-    g.STATE.selected_team = g.api.workspace.get_info_by_id(
-        g.STATE.selected_workspace
-    ).team_id
+    # All selected datasets belong to one project.
+    g.STATE.selected_project = g.STATE.infos.dataset(
+        g.api, g.STATE.selected_dataset
+    ).project_id
+    workspace_id = g.STATE.infos.project(g.api, g.STATE.selected_project).workspace_id
+    if workspace_id != g.STATE.selected_workspace:
+        # The team is known from the environment, if the project is in the same workspace.
+        g.STATE.selected_team = g.STATE.infos.workspace(g.api, workspace_id).team_id
+    g.STATE.selected_workspace = workspace_id
 
     sly.logger.debug(
         f"Recived IDs from the API. Selected team: {g.STATE.selected_team}, "
         f"selected workspace: {g.STATE.selected_workspace}, selected project: {g.STATE.selected_project}"
     )
 
-    dataset_thumbnail.set(
-        g.api.project.get_info_by_id(g.STATE.selected_project),
-        g.api.dataset.get_info_by_id(g.STATE.selected_dataset),
-    )
-    dataset_thumbnail.show()
+    # Infos of the project and the dataset are taken from the cache.
+    show_dataset_thumbnail()
 
     settings.card.unlock()
     settings.card.uncollapse()
 
 
 def clean_static_dir():
-    """Deletes all files from the static directory except the placeholder image."""
-    static_files = os.listdir(g.STATIC_DIR)
+    """Deletes all files from the static directory except the placeholder image.
+    The cache of previews is kept, since its files are named after ids and hashes of images.
+    """
+    static_files = [entry.name for entry in os.scandir(g.STATIC_DIR) if entry.is_file()]
 
     sly.logger.debug(
         f"Cleaning static directory. Number of files to delete: {len(static_files)}."
@@ -1,3 +1,5 @@
+from array import array
+
 import supervisely as sly
 
 from supervisely.app.widgets import (
@@ -9,9 +11,15 @@ from supervisely.app.widgets import (
     Field,
     Checkbox,
     Text,
+    DatePicker,
 )
 
 import src.globals as g
+from src.filters import ImageFilter
+from src.leases import LeaseTable
+from src.metrics import stage
+import src.pipeline as pipeline
+from src.tag_specs import parse_tag_metas, run_tag_name
 import src.ui.tagging as tagging
 
 batch_size_input = InputNumber(value=30, min=1, max=100)
@@ -28,6 +36,17 @@ new_tag_name_field = Field(
     content=new_tag_name_input,
 )
 
+several_tags_checkbox = Checkbox("Several tags")
+several_tags_field = Field(
+    title="Several tags",
+    description=(
+        "If checked, several tags separated with commas can be entered, e.g. "
+        '"cat, dog, quality: good|bad, score: number, comment: text". Tags and their '
+        "values are assigned to images in the batch and written together."
+    ),
+    content=several_tags_checkbox,
+)
+
 automatic_tagging_checkbox = Checkbox("Start next batch automatically")
 automatic_tagging_field = Field(
     title="Automatic tagging",
@@ -35,12 +54,78 @@ automatic_tagging_field = Field(
     content=automatic_tagging_checkbox,
 )
 
+group_similar_checkbox = Checkbox("Group similar images")
+group_similar_field = Field(
+    title="Batch grouping",
+    description=(
+        "If checked, batches are made of visually similar images, so the tag can be "
+        "applied to the whole batch more often. Previews of all images are downloaded "
+        "once to compare them, it can take a while for large datasets."
+    ),
+    content=group_similar_checkbox,
+)
+
+save_status_checkbox = Checkbox("Save status in image metadata")
+save_status_field = Field(
+    title="Image status",
+    description=(
+        "If checked, the status of each image (tagged, skipped or failed) and its batch "
+        "are saved in the image metadata, so the progress can be seen outside the app."
+    ),
+    content=save_status_checkbox,
+)
+
+write_chunk_size_input = InputNumber(value=50, min=1, max=100)
+write_chunk_size_field = Field(
+    title="Write chunk size",
+    description="Number of images tagged with one API request.",
+    content=write_chunk_size_input,
+)
+
+write_concurrency_input = InputNumber(value=4, min=1, max=16)
+write_concurrency_field = Field(
+    title="Concurrent requests",
+    description=(
+        "Maximum number of tagging requests sent at the same time. "
+        "It will be decreased automatically if the server is overloaded."
+    ),
+    content=write_concurrency_input,
+)
+
+name_filter_input = Input(placeholder="Image name or pattern, e.g. frame_*.jpg")
+with_tag_filter_input = Input(placeholder="Only images with this tag")
+without_tag_filter_input = Input(placeholder="Only images without this tag")
+meta_key_filter_input = Input(placeholder="Image metadata key")
+meta_value_filter_input = Input(placeholder="Image metadata value (optional)")
+created_filter_picker = DatePicker(picker_type="daterange", placeholder="Created")
+updated_filter_picker = DatePicker(picker_type="daterange", placeholder="Updated")
+
+filter_inputs = [
+    name_filter_input,
+    with_tag_filter_input,
+    without_tag_filter_input,
+    meta_key_filter_input,
+    meta_value_filter_input,
+    created_filter_picker,
+    updated_filter_picker,
+]
+filter_field = Field(
+    title="Filter images",
+    description=(
+        "Only images matching all filled filters will be listed and tagged. "
+        "Leave the fields empty to tag all images in the selected datasets."
+    ),
+    content=Container(filter_inputs),
+)
+
 save_settings_button = Button("Save settings", icon="zmdi zmdi-floppy")
 change_settins_button = Button("Change settings", icon="zmdi zmdi-settings")
 change_settins_button.hide()
 
 no_tag_name_text = Text("Enter tag name before saving settings.", status="warning")
 no_tag_name_text.hide()
+invalid_tags_text = Text(status="warning")
+invalid_tags_text.hide()
 
 
 card = Card(
@@ -50,10 +135,17 @@ card = Card(
         [
             batch_size_field,
             new_tag_name_field,
+            several_tags_field,
             automatic_tagging_field,
+            group_similar_field,
+            save_status_field,
+            write_chunk_size_field,
+            write_concurrency_field,
+            filter_field,
             save_settings_button,
             change_settins_button,
             no_tag_name_text,
+            invalid_tags_text,
         ]
     ),
     lock_message="Select the dataset on step 1️⃣.",
@@ -66,10 +158,24 @@ card.collapse()
 @save_settings_button.click
 def save_settings():
     no_tag_name_text.hide()
+    invalid_tags_text.hide()
 
     g.STATE.batch_size = batch_size_input.get_value()
     g.STATE.new_tag_name = new_tag_name_input.get_value()
     g.STATE.automatic_tagging = automatic_tagging_checkbox.is_checked()
+    g.STATE.group_similar = group_similar_checkbox.is_checked()
+    g.STATE.save_status = save_status_checkbox.is_checked()
+    g.STATE.write_chunk_size = write_chunk_size_input.get_value()
+    g.STATE.write_concurrency = write_concurrency_input.get_value()
+    g.STATE.image_filter = ImageFilter(
+        name_pattern=name_filter_input.get_value(),
+        with_tag=with_tag_filter_input.get_value(),
+        without_tag=without_tag_filter_input.get_value(),
+        meta_key=meta_key_filter_input.get_value(),
+        meta_value=meta_value_filter_input.get_value() or None,
+        created_range=created_filter_picker.get_value(),
+        updated_range=updated_filter_picker.get_value(),
+    )
 
     if not g.STATE.new_tag_name:
         sly.logger.warning(
@@ -78,23 +184,50 @@ def save_settings():
         no_tag_name_text.show()
         return
 
+    if several_tags_checkbox.is_checked():
+        try:
+            g.STATE.tag_metas = parse_tag_metas(g.STATE.new_tag_name)
+        except ValueError as e:
+            sly.logger.warning(f"Tags {g.STATE.new_tag_name!r} are invalid: {e}")
+            invalid_tags_text.text = f"Tags are invalid: {e}"
+            invalid_tags_text.show()
+            return
+        g.STATE.new_tag_name = run_tag_name(g.STATE.tag_metas)
+    else:
+        g.STATE.tag_metas = [sly.TagMeta(g.STATE.new_tag_name, sly.TagValueType.NONE)]
+
     sly.logger.debug(
         f"Preview button was clicked. Saved batch size: {g.STATE.batch_size} "
         f"and new tag name: {g.STATE.new_tag_name} in global state. "
-        f"Automatic tagging is {g.STATE.automatic_tagging}."
+        f"Automatic tagging is {g.STATE.automatic_tagging}, "
+        f"grouping of similar images is {g.STATE.group_similar}, "
+        f"saving statuses is {g.STATE.save_status}, "
+        f"write chunk size: {g.STATE.write_chunk_size}, "
+        f"write concurrency: {g.STATE.write_concurrency}, "
+        f"filter: {g.STATE.image_filter}."
     )
     card.collapse()
 
     batch_size_input.disable()
     new_tag_name_input.disable()
+    several_tags_checkbox.disable()
     automatic_tagging_checkbox.disable()
+    group_similar_checkbox.disable()
+    save_status_checkbox.disable()
+    write_chunk_size_input.disable()
+    write_concurrency_input.disable()
+    for filter_input in filter_inputs:
+        filter_input.disable()
     save_settings_button.hide()
 
-    pagination()
-
+    # Project meta is needed to check unfinished batches from the journal.
     g.STATE.save_project_meta()
 
+    pagination()
+
+    tagging.set_tag_choices()
     tagging.update_current_batch_gallery()
+    tagging.update_processed_gallery()
 
     change_settins_button.show()
 
@@ -109,7 +242,14 @@ def change_settings():
 
     batch_size_input.enable()
     new_tag_name_input.enable()
+    several_tags_checkbox.enable()
     automatic_tagging_checkbox.enable()
+    group_similar_checkbox.enable()
+    save_status_checkbox.enable()
+    write_chunk_size_input.enable()
+    write_concurrency_input.enable()
+    for filter_input in filter_inputs:
+        filter_input.enable()
     save_settings_button.show()
     change_settins_button.hide()
 
@@ -117,41 +257,85 @@ def change_settings():
     tagging.card.collapse()
 
 
+@stage("pagination")
 def pagination():
-    g.STATE.image_infos = sorted(
-        g.api.image.get_list(g.STATE.selected_dataset), key=lambda x: x.name
+    g.STATE.pages = pipeline.list_images(
+        g.api,
+        g.STATE.selected_datasets,
+        g.STATE.batch_size,
+        g.STATE.project_meta,
+        g.STATE.image_filter,
     )
+    g.STATE.images = g.STATE.pages.table
+    g.STATE.images_count = len(g.STATE.images)
+
+    if g.STATE.group_similar:
+        pipeline.group_similar_images(
+            g.api, g.SLY_APP_DATA_DIR, g.STATE.pages, g.STATE.previews
+        )
 
     sly.logger.debug(
-        f"Retreived {len(g.STATE.image_infos)} images from dataset and saved them in global state."
+        f"Created lazy pages view over {g.STATE.images_count} images from "
+        f"{len(g.STATE.selected_datasets)} datasets with {len(g.STATE.pages)} pages "
+        "and saved it in global state."
     )
 
-    g.STATE.pages.clear()
+    g.STATE.annotations.clear()
 
-    sly.logger.debug(f"Cleared pages in global state. Pages: {g.STATE.pages}.")
+    sly.logger.debug("Cleared annotations cache in global state.")
 
-    pages_number = len(g.STATE.image_infos) // g.STATE.batch_size
-    if len(g.STATE.image_infos) % g.STATE.batch_size != 0:
-        pages_number += 1
+    resume_from_journal()
 
-    sly.logger.debug(f"Calculated number of pages: {pages_number}.")
 
-    for page_number in range(1, pages_number + 1):
-        g.STATE.pages[page_number] = g.STATE.image_infos[
-            g.STATE.batch_size * (page_number - 1) : g.STATE.batch_size * page_number
-        ]
+def resume_from_journal():
+    """Restores tagged images and the current page from the journal of the previous run
+    with the same datasets and tag name, so tagging continues where it was stopped.
+    """
+    if g.STATE.journal is not None:
+        g.STATE.journal.close()
 
-    sly.logger.debug(
-        "Created pages dict and saved it in global state. "
-        f"Number of items on last page: {len(g.STATE.pages[pages_number])}."
+    g.STATE.journal, tagged_rows = pipeline.resume_run(
+        g.api,
+        g.SLY_APP_DATA_DIR,
+        g.STATE.selected_datasets,
+        g.STATE.new_tag_name,
+        g.STATE.pages,
+        g.STATE.project_meta,
+        on_tagged=tagging.add_tagged_rows,
+        tag_names=[tag_meta.name for tag_meta in g.STATE.tag_metas],
     )
+    g.STATE.tagged_images = array("q", tagged_rows)
+    g.STATE.skipped_images = set()
+    g.STATE.error_images = set()
+
+    if g.STATE.leases is not None:
+        g.STATE.leases.release_all()
+
+    g.STATE.leases = LeaseTable.for_run(
+        g.SLY_APP_DATA_DIR,
+        g.STATE.selected_datasets,
+        g.STATE.new_tag_name,
+        g.STATE.batch_size,
+        g.STATE.image_filter,
+        grouped=g.STATE.group_similar,
+        session=g.STATE.session_id,
+    )
+    g.STATE.batch = None
+    g.STATE.assignments = {}
+
+    page_number = g.STATE.journal.state.page_number
 
-    g.STATE.current_page_number = 1
+    # Pages, which are tagged by other annotators, are skipped.
+    if page_number not in g.STATE.pages or page_number in (
+        g.STATE.leases.claimed_by_others()
+    ):
+        page_number = tagging.find_free_page(1, step=1) or 1
+
+    g.STATE.current_page_number = page_number
 
     sly.logger.debug(
         f"Saved current page number: {g.STATE.current_page_number} in global state."
     )
 
-    g.STATE.tagged_images.clear()
-
-    sly.logger.debug(f"Cleared tagged images in global state.")
+    # All datasets are listed in the background to find all already tagged images.
+    g.STATE.pages.load_all_in_background(on_loaded=tagging.restore_statuses)
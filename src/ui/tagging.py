@@ -1,5 +1,11 @@
+import time
+from array import array
+from collections import Counter
+from math import ceil
 from random import choice
+from typing import Any, Dict, List, Optional, Tuple
 
+import numpy as np
 import supervisely as sly
 
 from supervisely.app.widgets import (
@@ -7,16 +13,24 @@ from supervisely.app.widgets import (
     Card,
     Button,
     RadioTabs,
-    GridGallery,
     Flexbox,
     Progress,
     Text,
     Checkbox,
-    Transfer,
     Sidebar,
+    Select,
+    Input,
+    InputNumber,
 )
 
 import src.globals as g
+from src.widgets import BatchGallery, BatchTransfer
+from src.jobs import JobRunner, JobStatus, TagJob, UntagJob
+from src.listing import WorkQueue
+from src.metrics import METRICS, stage
+import src.pipeline as pipeline
+from src.status import ImageStatus, aggregate_statuses
+from src.tag_specs import parse_value
 
 page_text = Text(status="info")
 page_text.hide()
@@ -26,7 +40,10 @@ error_text = Text(status="error")
 success_text.hide()
 error_text.hide()
 
-text_container = Container([success_text, error_text])
+job_text = Text(status="info")
+job_text.hide()
+
+text_container = Container([job_text, success_text, error_text])
 
 prev_batch_button = Button("Previous batch", icon="zmdi zmdi-arrow-left")
 next_batch_button = Button("Next batch", icon="zmdi zmdi-arrow-right")
@@ -54,26 +71,77 @@ batch_tagging_progress.hide()
 global_tagging_progress = Progress(hide_on_finish=False)
 global_tagging_progress.hide()
 
-current_batch_gallery = GridGallery(columns_number=5)
+current_batch_gallery = BatchGallery(columns_number=5)
 apply_to_all_checkbox = Checkbox("Apply tag to all images", checked=True)
 
-select_images_transfer = Transfer(
+select_images_transfer = BatchTransfer(
     filterable=True,
     filter_placeholder="Search images by name",
     titles=["Images to skip", "Images to tag"],
 )
 select_images_transfer.disable()
+
+# Tags and values are assigned to selected images, if the run adds several tags or tags
+# with values, assigned tags are written together when the batch is tagged.
+tag_select = Select(items=[], placeholder="Select tag")
+tag_value_input = Input(placeholder="Value of the tag")
+tag_value_input.hide()
+assign_tag_button = Button(
+    "Assign tag to selected images", icon="zmdi zmdi-label", button_type="info"
+)
+assignments_text = Text(status="info")
+tags_container = Container(
+    [tag_select, tag_value_input, assign_tag_button, assignments_text]
+)
+tags_container.hide()
+
 current_batch_sidebar = Sidebar(
-    left_content=Container([select_images_transfer]),
+    left_content=Container([tags_container, select_images_transfer]),
     right_content=Container([page_text, apply_to_all_checkbox, current_batch_gallery]),
     width_percent="40%",
 )
 
-processed_images_gallery = GridGallery(columns_number=5)
+processed_text = Text(status="info")
+processed_text.hide()
+processed_images_gallery = BatchGallery(columns_number=5)
+
+prev_processed_button = Button(
+    "Previous page", icon="zmdi zmdi-arrow-left", button_type="text"
+)
+next_processed_button = Button(
+    "Next page", icon="zmdi zmdi-arrow-right", button_type="text"
+)
+prev_processed_button.disable()
+next_processed_button.disable()
+
+processed_buttons_flexbox = Flexbox(
+    [prev_processed_button, next_processed_button], center_content=True
+)
+
+undo_batches_input = InputNumber(value=1, min=1, max=100)
+undo_batches_button = Button(
+    "Undo last batches", icon="zmdi zmdi-undo", button_type="warning"
+)
+remove_tags_button = Button(
+    "Remove tags from all filtered images",
+    icon="zmdi zmdi-delete",
+    button_type="danger",
+)
+undo_flexbox = Flexbox([undo_batches_input, undo_batches_button, remove_tags_button])
 
 gallery_tabs = RadioTabs(
     ["Current batch", "Processed images"],
-    contents=[current_batch_sidebar, processed_images_gallery],
+    contents=[
+        current_batch_sidebar,
+        Container(
+            [
+                processed_text,
+                processed_buttons_flexbox,
+                undo_flexbox,
+                processed_images_gallery,
+            ]
+        ),
+    ],
     descriptions=[
         "Images from the batch that will be tagged.",
         "Images that were tagged.",
@@ -100,93 +168,243 @@ card.collapse()
 
 
 def update_current_batch_gallery():
-    start_batch_button.enable()
+    # Pages can be changed by the background tagging job while the gallery is updated.
+    with g.STATE.lock:
+        page_text.hide()
+        current_batch_gallery.loading = True
 
-    page_text.hide()
-    current_batch_gallery.loading = True
+        g.STATE.journal.page(g.STATE.current_page_number)
 
-    apply_to_all_checkbox.check()
+        claimed = claim_current_page()
 
-    page_text.text = f"Showing images from batch {g.STATE.current_page_number} of {len(g.STATE.pages)}."
-    page_text.show()
+        sly.logger.debug("Trying to update current batch gallery.")
+
+        # The batch is topped up with images of the following pages only if this session
+        # holds the page, the batch of another annotator is shown as is.
+        g.STATE.batch = WorkQueue(
+            g.STATE.pages,
+            g.STATE.current_page_number,
+            g.STATE.batch_size,
+            claim=g.STATE.leases.claim if claimed else lambda page_number: False,
+        )
+        current_batch_images = g.STATE.batch.fill()
+        # Leases of the shown pages are renewed while they are shown.
+        g.STATE.leases.hold(g.STATE.batch.drawn_pages)
+
+        # Tags assigned to images of the previous batch, which weren't written, are dropped.
+        batch_ids = {image.id for image in current_batch_images}
+        g.STATE.assignments = {
+            image_id: tags
+            for image_id, tags in g.STATE.assignments.items()
+            if image_id in batch_ids
+        }
+        update_assignments_text()
+
+        enable_start_button()
+        update_page_text()
+        handle_buttons()
+
+        if len(current_batch_images) == 0:
+            sly.logger.warning(
+                f"Current batch on page {g.STATE.current_page_number} is empty."
+            )
+        else:
+            sly.logger.debug(
+                f"Readed {len(current_batch_images)} images for current batch from "
+                f"pages {g.STATE.batch.drawn_pages}."
+            )
+
+        show_batch_images(current_batch_images)
+
+        current_batch_gallery.loading = False
 
-    sly.logger.debug("Trying to update current batch gallery.")
+    prefetch_neighbour_pages()
 
-    current_batch_images = g.STATE.pages[g.STATE.current_page_number]
 
-    current_batch_gallery.clean_up()
-    handle_buttons()
+def refill_current_batch(tagged_rows):
+    """Removes tagged images from the current batch and tops it up with the next not tagged
+    images. Only cells of removed and added images are changed in the gallery, annotations
+    and previews are fetched only for the added images.
+    """
+    with g.STATE.lock:
+        if g.STATE.batch is None:
+            return
 
-    sly.logger.debug("Cleaned up current batch gallery.")
+        removed = g.STATE.batch.remove(tagged_rows)
+        if not removed:
+            return
 
-    if len(current_batch_images) == 0:
-        sly.logger.warning(
-            f"Current batch on page {g.STATE.current_page_number} is empty."
+        current_batch_gallery.loading = True
+
+        added = g.STATE.batch.fill()
+        g.STATE.leases.hold(g.STATE.batch.drawn_pages)
+
+        sly.logger.debug(
+            f"Removed {len(removed)} tagged images from current batch, "
+            f"added {len(added)} images from pages {g.STATE.batch.drawn_pages}."
         )
+
+        show_batch_images(g.STATE.batch.images)
+        update_page_text()
+        update_assignments_text()
+        enable_start_button()
+
         current_batch_gallery.loading = False
 
-        page_text.text += " All images from this batch were tagged."
 
-        start_batch_button.disable()
+def show_batch_images(images):
+    """Shows images in the current batch gallery and in the transfer."""
+    sync_gallery(current_batch_gallery, images)
+    patch_transfer(images)
 
-        select_images_transfer.set_items([])
 
-        return
+def sync_gallery(gallery: BatchGallery, images):
+    """Shows images in the gallery as the diff with the shown images: cells of images,
+    which are not shown anymore, are removed, only new images are fetched and added to
+    the freed columns, other cells are kept.
+    """
+    image_ids = {image.id for image in images}
+    shown_ids = set(gallery.image_ids)
 
-    sly.logger.debug(
-        f"Readed {len(current_batch_images)} images for current batch from "
-        f"page with number {g.STATE.current_page_number}."
+    columns = gallery.remove(
+        [image_id for image_id in gallery.image_ids if image_id not in image_ids]
     )
+    added = [image for image in images if image.id not in shown_ids]
 
-    image_ids = [image_info.id for image_info in current_batch_images]
+    if added:
+        anns = g.STATE.annotations.get_many(g.api, added, g.STATE.project_meta)
+        image_urls = g.STATE.previews.urls(g.api, added)
 
-    sly.logger.debug(f"Created list of image ids: {image_ids} for current batch.")
+        with stage("gallery_fill"):
+            gallery.add_many(
+                [
+                    (image.id, image_url, ann, image.name)
+                    for image, image_url, ann in zip(added, image_urls, anns)
+                ],
+                columns,
+            )
 
-    anns_json = g.api.annotation.download_json_batch(
-        g.STATE.selected_dataset, image_ids
+    sly.logger.debug(
+        f"Removed {len(columns)} and added {len(added)} cells of the gallery."
     )
 
-    sly.logger.debug(
-        f"Downloaded {len(anns_json)} annotations in JSON format for current batch."
+
+def patch_transfer(images):
+    """Removes items of images, which are not in the batch, and adds new items to the
+    transfer. New images are selected for tagging, the selection of other images is kept.
+    Items are keyed by ids of images, since names are unique only within a dataset, and
+    labeled with names.
+    """
+    removed, added = select_images_transfer.patch(
+        [str(image.id) for image in images], [image.name for image in images]
     )
 
-    anns = []
+    if images:
+        select_images_transfer.show()
 
-    sly.logger.debug("Trying to create annotation objects from JSON.")
+    apply_to_all = len(select_images_transfer.get_transferred_items()) == len(images)
+    if apply_to_all != apply_to_all_checkbox.is_checked():
+        if apply_to_all:
+            apply_to_all_checkbox.check()
+        else:
+            apply_to_all_checkbox.uncheck()
 
-    for ann_json in anns_json:
-        ann = sly.Annotation.from_json(ann_json, g.STATE.project_meta)
-        anns.append(ann)
+    sly.logger.debug(f"Removed {removed} and added {added} items of the transfer.")
 
-    sly.logger.debug(f"Created {len(anns)} annotation objects from JSON.")
 
-    image_urls = [image.preview_url for image in current_batch_images]
+def update_page_text():
+    page_number = g.STATE.current_page_number
 
-    sly.logger.debug(f"Created {len(image_urls)} image urls for current batch.")
+    page_text.text = f"Showing images from batch {page_number} of {len(g.STATE.pages)}."
 
-    image_names = [image.name for image in current_batch_images]
+    following_pages = g.STATE.batch.drawn_pages[1:]
+    if following_pages:
+        page_text.text += (
+            " Tagged images are replaced with images from batches "
+            f"{', '.join(map(str, following_pages))}."
+        )
 
-    select_images_transfer.set_items(image_names)
-    select_images_transfer.set_transferred_items(image_names)
-    select_images_transfer.show()
+    if page_number in g.STATE.leases.claimed_by_others():
+        page_text.text += (
+            " This batch is claimed by another annotator "
+            f"({g.STATE.leases.holder(page_number)})."
+        )
 
-    sly.logger.debug(
-        f"Created {len(image_names)} image names for current batch. "
-        "Trying to add URLS, annotations and names to current batch gallery."
-    )
+    if len(g.STATE.selected_datasets) > 1 and g.STATE.batch.images:
+        dataset_ids = sorted({image.dataset_id for image in g.STATE.batch.images})
+        page_text.text += f" Dataset IDs: {', '.join(map(str, dataset_ids))}."
+
+    if not g.STATE.batch.images:
+        page_text.text += " All images from this batch were tagged."
+
+    page_text.show()
 
-    for image_url, ann, image_name in zip(image_urls, anns, image_names):
-        current_batch_gallery.append(image_url, ann, image_name)
 
-    current_batch_gallery.loading = False
+def claim_current_page() -> bool:
+    """Claims the shown page for this session and releases pages of the previous batch,
+    unless they're being tagged. Returns False if the page is claimed by another session.
+    """
+    page_number = g.STATE.current_page_number
+
+    if g.STATE.batch is not None:
+        for previous_page_number in g.STATE.batch.drawn_pages:
+            if previous_page_number == page_number:
+                continue
+            if not tagging_jobs.is_page_scheduled(previous_page_number):
+                g.STATE.leases.release(previous_page_number)
+
+    return g.STATE.leases.claim(page_number)
+
+
+def find_free_page(start: int, step: int) -> Optional[int]:
+    """Returns the first page from start in the direction of step, which isn't claimed by
+    other sessions, or None if there is no such page.
+    """
+    claimed = g.STATE.leases.claimed_by_others()
+
+    page_number = start
+    while 1 <= page_number <= len(g.STATE.pages):
+        if page_number not in claimed:
+            return page_number
+        page_number += step
+
+
+def claim_next_page(start: int) -> Optional[int]:
+    """Claims the first free page from start for automatic tagging, returns None if all
+    the following pages are claimed by other sessions.
+    """
+    page_number = find_free_page(start, step=1)
+    while page_number is not None and not g.STATE.leases.claim(page_number):
+        # The page was claimed by another session after the table was read.
+        page_number = find_free_page(page_number + 1, step=1)
+    return page_number
+
+
+def prefetch_neighbour_pages():
+    """Starts fetching the previous and the next pages, their annotations and previews in
+    the background, so they are rendered from memory when the user switches the page.
+    """
+    for page_number in (
+        g.STATE.current_page_number + 1,
+        g.STATE.current_page_number - 1,
+    ):
+        if page_number in g.STATE.pages:
+            g.STATE.pages.prefetch(page_number, on_loaded=prefetch_images)
+
 
-    sly.logger.debug("Added URLS and annotations to current batch gallery.")
+def prefetch_images(images):
+    if images:
+        g.STATE.previews.prefetch(g.api, images)
+        g.STATE.annotations.prefetch(g.api, images, g.STATE.project_meta)
 
 
 @prev_batch_button.click
 def previous_batch():
     sly.logger.debug("Previous batch button was clicked.")
-    g.STATE.current_page_number -= 1
+    g.STATE.current_page_number = (
+        find_free_page(g.STATE.current_page_number - 1, step=-1)
+        or g.STATE.current_page_number - 1
+    )
     update_current_batch_gallery()
     hide_texts()
 
@@ -194,7 +412,10 @@ def previous_batch():
 @next_batch_button.click
 def next_batch():
     sly.logger.debug("Next batch button was clicked.")
-    g.STATE.current_page_number += 1
+    g.STATE.current_page_number = (
+        find_free_page(g.STATE.current_page_number + 1, step=1)
+        or g.STATE.current_page_number + 1
+    )
     update_current_batch_gallery()
     hide_texts()
 
@@ -202,7 +423,13 @@ def next_batch():
 @random_batch_button.click
 def random_batch():
     sly.logger.debug("Random batch button was clicked.")
-    g.STATE.current_page_number = choice(list(g.STATE.pages.keys()))
+    claimed = g.STATE.leases.claimed_by_others()
+    free_pages = [
+        page_number
+        for page_number in g.STATE.pages.keys()
+        if page_number not in claimed
+    ]
+    g.STATE.current_page_number = choice(free_pages or g.STATE.pages.keys())
     update_current_batch_gallery()
     hide_texts()
 
@@ -223,7 +450,7 @@ def handle_buttons():
         prev_batch_button.disable()
         next_batch_button.enable()
 
-    elif g.STATE.current_page_number == max(g.STATE.pages.keys()):
+    elif g.STATE.current_page_number == len(g.STATE.pages):
         sly.logger.debug("Last page is selected, disabling next batch button.")
 
         prev_batch_button.enable()
@@ -244,7 +471,7 @@ def apply_to_all_checkbox_changed(is_checked):
         select_images_transfer.set_transferred_items(
             select_images_transfer.get_items_keys()
         )
-        start_batch_button.enable()
+        enable_start_button()
 
 
 @select_images_transfer.value_changed
@@ -258,170 +485,689 @@ def select_images_transfer_changed(keys):
 
     if len(select_images_transfer.get_transferred_items()) == 0:
         start_batch_button.disable()
+    else:
+        enable_start_button()
+
+
+def enable_start_button():
+    """Enables the start button unless the current page is empty, claimed by another
+    session or already being tagged.
+    """
+    if g.STATE.batch is None or len(g.STATE.batch.images) == 0:
+        start_batch_button.disable()
+    elif g.STATE.current_page_number in g.STATE.leases.claimed_by_others():
+        sly.logger.debug(
+            f"Batch on page {g.STATE.current_page_number} is claimed by another session."
+        )
+        start_batch_button.disable()
+    elif tagging_jobs.is_page_scheduled(g.STATE.current_page_number):
+        sly.logger.debug(
+            f"Batch on page {g.STATE.current_page_number} is already scheduled for tagging."
+        )
+        start_batch_button.disable()
     else:
         start_batch_button.enable()
 
 
 @start_batch_button.click
 def tag_batch():
-    start_batch_button.hide()
-    stop_batch_button.show()
+    sly.logger.debug("Start batch button was clicked, submitting tagging job.")
 
-    g.STATE.continue_tagging = True
+    hide_texts()
+
+    page_number = g.STATE.current_page_number
+
+    batch_ids = [image.id for image in g.STATE.batch.images]
+    assigned_ids = [
+        image_id for image_id in batch_ids if image_id in g.STATE.assignments
+    ]
 
-    sly.logger.debug("Start batch button was clicked, trying to tag batch.")
+    if assigned_ids:
+        sly.logger.debug(
+            f"Tags are assigned to {len(assigned_ids)} images, will tag these images."
+        )
 
+        assignments = {
+            image_id: list(g.STATE.assignments.pop(image_id).items())
+            for image_id in assigned_ids
+        }
+
+    else:
+        try:
+            tags = selected_tags()
+        except ValueError as e:
+            error_text.text = str(e)
+            error_text.show()
+            return
+
+        assignments = {image_id: tags for image_id in selected_image_ids()}
+
+    skipped_ids = [image_id for image_id in batch_ids if image_id not in assignments]
+
+    sly.logger.info(
+        f"Created list of image ids for batch on page {page_number} with {len(assignments)} images."
+    )
+
+    start_batch_button.disable()
+    update_assignments_text()
+
+    tagging_jobs.submit(TagJob(page_number, assignments, skipped_ids))
+
+
+def selected_image_ids() -> List[int]:
+    """Returns ids of images of the current batch, which are selected in the transfer."""
     if apply_to_all_checkbox.is_checked():
         sly.logger.debug("Apply to all checkbox is checked, will tag all images.")
 
-        image_ids = [image.id for image in g.STATE.pages[g.STATE.current_page_number]]
+        return [image.id for image in g.STATE.batch.images]
+
+    sly.logger.debug(
+        "Apply to all checkbox is not checked, will tag transferred images from transfer widget."
+    )
+
+    transferred_ids = set(map(int, select_images_transfer.get_transferred_items()))
+
+    return [image.id for image in g.STATE.batch.images if image.id in transferred_ids]
+
+
+def assigns_tags() -> bool:
+    """Checks if tags are assigned to images in the batch view, i.e. the run adds several
+    tags or the tag has a value.
+    """
+    return len(g.STATE.tag_metas) > 1 or any(
+        tag_meta.value_type != sly.TagValueType.NONE for tag_meta in g.STATE.tag_metas
+    )
+
+
+def set_tag_choices():
+    """Fills the selector of tags with tags of the run, it's shown only if tags are
+    assigned to images.
+    """
+    g.STATE.assignments = {}
+
+    if not assigns_tags():
+        tags_container.hide()
+        return
+
+    tag_select.set([Select.Item(tag_meta.name) for tag_meta in g.STATE.tag_metas])
+    tag_select.set_value(g.STATE.tag_metas[0].name)
+    update_value_input()
+    tags_container.show()
+
+
+def selected_tag_meta() -> sly.TagMeta:
+    name = tag_select.get_value() if assigns_tags() else None
+    for tag_meta in g.STATE.tag_metas:
+        if tag_meta.name == name:
+            return tag_meta
+    return g.STATE.tag_metas[0]
 
+
+def selected_tags() -> List[Tuple[str, Any]]:
+    """Returns the name and the value of the selected tag, raises ValueError if the value
+    is not valid for the tag.
+    """
+    tag_meta = selected_tag_meta()
+    return [(tag_meta.name, parse_value(tag_meta, tag_value_input.get_value()))]
+
+
+@tag_select.value_changed
+def tag_selected(tag_name):
+    update_value_input()
+
+
+def update_value_input():
+    """Shows the input of the value, if the selected tag has values."""
+    tag_meta = selected_tag_meta()
+    if tag_meta.value_type == sly.TagValueType.NONE:
+        tag_value_input.hide()
     else:
-        sly.logger.debug(
-            "Apply to all checkbox is not checked, will tag transferred images from transfer widget."
-        )
+        tag_value_input.set_value("")
+        tag_value_input.show()
 
-        image_names = select_images_transfer.get_transferred_items()
 
-        image_ids = [
-            image.id
-            for image in g.STATE.pages[g.STATE.current_page_number]
-            if image.name in image_names
-        ]
+@assign_tag_button.click
+def assign_tag():
+    hide_texts()
 
-    sly.logger.info(
-        f"Created list of image ids for current batch with {len(image_ids)} images."
+    try:
+        tags = selected_tags()
+    except ValueError as e:
+        error_text.text = str(e)
+        error_text.show()
+        return
+
+    image_ids = selected_image_ids()
+    for image_id in image_ids:
+        # The tag replaces the value of the same tag assigned before.
+        g.STATE.assignments.setdefault(image_id, {}).update(tags)
+
+    sly.logger.debug(f"Assigned tags {tags} to {len(image_ids)} images.")
+
+    update_assignments_text()
+
+
+def update_assignments_text():
+    if not assigns_tags():
+        return
+
+    counts = Counter(
+        (name, value)
+        for tags in g.STATE.assignments.values()
+        for name, value in tags.items()
     )
+    if counts:
+        assignments_text.text = "Assigned tags: " + ", ".join(
+            f"{name}{'' if value is None else f' = {value}'}: {count} images"
+            for (name, value), count in counts.items()
+        )
+    else:
+        assignments_text.text = (
+            "No tags are assigned, the selected tag will be added to selected images."
+        )
+
+
+def run_tag_job(job: TagJob) -> Optional[TagJob]:
+    """Tags images from the job, called by the job runner in the background thread.
+    Returns the job for the next page if automatic tagging is enabled.
+    """
+    sly.logger.debug(f"Started {job}.")
 
-    tag_meta = get_tag_meta(g.STATE.new_tag_name)
+    started = time.perf_counter()
+    api_totals = api_metrics_totals()
+
+    if not g.STATE.leases.claim(job.page_number):
+        sly.logger.warning(
+            f"Batch on page {job.page_number} is claimed by another session."
+        )
+        error_text.text = (
+            f"Batch {job.page_number} is being tagged by another annotator, skipped."
+        )
+        error_text.show()
+        return
+
+    tag_metas = get_tag_metas()
+
+    tag_ids = sorted(tag_meta.sly_id for tag_meta in tag_metas.values())
+    if g.STATE.images.run_tag_ids != tag_ids:
+        # Tag metas were created for this run.
+        add_tagged_rows(g.STATE.images.set_run_tag_ids(tag_ids))
+
+    assignments = {
+        image_id: [(tag_metas[name], value) for name, value in tags]
+        for image_id, tags in job.assignments.items()
+    }
 
     global_tagging_progress.show()
     batch_tagging_progress.show()
 
-    image_ids_with_tags = []
-    image_ids_with_errors = []
-
     with global_tagging_progress(
-        message="Progress of tagging images in dataset...",
-        total=len(g.STATE.image_infos),
-        initial=len(g.STATE.tagged_images),
+        message="Progress of tagging images in selected datasets...",
+        total=g.STATE.images_count,
+        initial=g.STATE.images.tagged_count,
     ) as global_pbar:
         with batch_tagging_progress(
-            message="Progress of tagging images in current batch...",
-            total=len(image_ids),
+            message=f"Progress of tagging images in batch {job.page_number}...",
+            total=len(job.image_ids),
         ) as batch_pbar:
-            for image_id in image_ids:
-                if not g.STATE.continue_tagging:
-                    sly.logger.info("Stop button was clicked, stopping tagging.")
-                    break
-
-                try:
-                    g.api.image.add_tag(image_id, tag_meta.sly_id)
-                    image_ids_with_tags.append(image_id)
-
-                    batch_pbar.update(1)
-                    global_pbar.update(1)
 
-                except Exception as e:
-                    sly.logger.error(
-                        f"There was an error while tagging image with id {image_id}: {e}."
-                    )
-                    image_ids_with_errors.append(image_id)
+            def update_progress(tagged_chunk):
+                batch_pbar.update(len(tagged_chunk))
+                global_pbar.update(len(tagged_chunk))
+                # The lease is renewed while the batch is tagged.
+                g.STATE.leases.claim(job.page_number)
+
+            result = pipeline.tag_images(
+                g.api,
+                g.STATE.journal,
+                assignments,
+                chunk_size=g.STATE.write_chunk_size,
+                concurrency=g.STATE.write_concurrency,
+                on_chunk=update_progress,
+                should_continue=job.should_continue,
+                page_number=job.page_number,
+            )
+
+    job.tagged_ids = result.tagged
+    job.error_ids = list(result.errors.keys())
 
     batch_tagging_progress.hide()
 
-    stop_batch_button.hide()
-    start_batch_button.show()
-
     sly.logger.info(
-        f"Tagging of batch on page {g.STATE.current_page_number} finished. "
-        f"Succesfully tagged {len(image_ids_with_tags)} images. "
-        f"Image ids with errors: {image_ids_with_errors}."
+        f"Tagging of batch on page {job.page_number} finished. "
+        f"Succesfully tagged {len(job.tagged_ids)} images. "
+        f"Image ids with errors: {job.error_ids}."
     )
 
-    if len(image_ids_with_errors) > 0:
-        error_text.text = f"Image ids with errors: {', '.join(image_ids_with_errors)}."
+    if len(job.error_ids) > 0:
+        error_text.text = (
+            f"Image ids with errors: {', '.join(map(str, job.error_ids))}."
+        )
         error_text.show()
 
-    update_galleries(image_ids_with_tags)
+    if g.STATE.save_status:
+        save_statuses(job, result)
 
-    if g.STATE.automatic_tagging and g.STATE.current_page_number < max(
-        g.STATE.pages.keys()
-    ):
-        sly.logger.debug("Automatic tagging is enabled, will tag next batch.")
-        next_batch()
-        tag_batch()
+    update_galleries(job.page_number, job.tagged_ids, assignments)
+
+    if g.STATE.batch is None or job.page_number not in g.STATE.batch.drawn_pages:
+        g.STATE.leases.release(job.page_number)
+
+    elapsed = time.perf_counter() - started
+    calls, retries, errors = (
+        after - before for after, before in zip(api_metrics_totals(), api_totals)
+    )
 
     success_text.text = (
-        f"Successfully tagged {len(image_ids_with_tags)} images. "
-        f"Overall progress of tagging images in dataset: {len(g.STATE.tagged_images)}/{len(g.STATE.image_infos)}."
+        f"Successfully tagged {len(job.tagged_ids)} images in batch {job.page_number}. "
+        f"Overall progress of tagging images in selected datasets: {g.STATE.images.tagged_count}/{g.STATE.images_count}. "
+        f"Batch took {elapsed:.1f}s ({len(job.tagged_ids) / max(elapsed, 1e-9):.1f} images/s), "
+        f"API requests: {calls:g}, retries: {retries:g}, errors: {errors:g}."
     )
     success_text.show()
 
+    if not g.STATE.automatic_tagging or job.stop_requested:
+        return
 
-def update_galleries(image_ids_with_tags):
-    current_image_infos = g.STATE.pages[g.STATE.current_page_number]
-    updated_image_infos = [
-        image_info
-        for image_info in current_image_infos
-        if image_info.id not in image_ids_with_tags
-    ]
+    # Pages claimed by other annotators are skipped.
+    next_page_number = claim_next_page(job.page_number + 1)
+    if next_page_number is None:
+        return
 
     sly.logger.debug(
-        f"Created list of not processed images from current batch with {len(updated_image_infos)} images."
+        f"Automatic tagging is enabled, will tag batch on page {next_page_number}."
     )
 
-    tagged_image_infos = [
-        image_info
-        for image_info in current_image_infos
-        if image_info.id in image_ids_with_tags
-    ]
+    try:
+        tags = selected_tags()
+    except ValueError as e:
+        sly.logger.warning(f"Automatic tagging is stopped: {e}")
+        g.STATE.leases.release(next_page_number)
+        return
 
-    sly.logger.debug(
-        f"Created list of tagged images from current batch with {len(tagged_image_infos)} images."
+    if g.STATE.current_page_number == job.page_number:
+        # The view follows the automatic tagging only if the user didn't navigate away.
+        g.STATE.current_page_number = next_page_number
+        update_current_batch_gallery()
+        g.STATE.leases.release(job.page_number)
+
+    return TagJob(
+        next_page_number,
+        {image.id: tags for image in g.STATE.pages[next_page_number]},
+    )
+
+
+@undo_batches_button.click
+def undo_batches():
+    """Removes tags written by the last batches, undone images are shown in their pages
+    again and are removed from the processed images.
+    """
+    hide_texts()
+
+    # Batches are read from the journal, so batches tagged before the restart are undone too.
+    batches = g.STATE.journal.undoable_batches(undo_batches_input.get_value())
+    if not batches:
+        error_text.text = "There are no tagged batches to undo."
+        error_text.show()
+        return
+
+    sly.logger.info(
+        f"Undoing batches on pages {[batch.page_number for batch in batches]}."
     )
 
-    g.STATE.pages[g.STATE.current_page_number] = updated_image_infos
-    g.STATE.tagged_images.extend(tagged_image_infos)
+    for batch in batches:
+        # The batch is marked at once, so it isn't undone twice by repeated clicks.
+        batch.undoing = True
+        tagging_jobs.submit(UntagJob(dict(batch.tags), batch=batch))
+
+
+@remove_tags_button.click
+def remove_tags():
+    """Removes tags of the run from all images matching the filter of the run."""
+    hide_texts()
+
+    tag_ids = g.STATE.images.run_tag_ids
+    if not tag_ids:
+        error_text.text = "Tags of this run don't exist in the project yet."
+        error_text.show()
+        return
+
+    sly.logger.info(f"Removing tags with ids {tag_ids} from all filtered images.")
+
+    tagging_jobs.submit(UntagJob(None, tag_ids))
+
+
+def run_job(job: TagJob) -> Optional[TagJob]:
+    if isinstance(job, UntagJob):
+        return run_untag_job(job)
+    return run_tag_job(job)
+
+
+def run_untag_job(job: UntagJob):
+    """Removes tags from images of the job, called by the job runner in the background
+    thread, and returns images to the pages they belong to.
+    """
+    sly.logger.debug(f"Started {job}.")
+
+    started = time.perf_counter()
+
+    if job.image_tag_ids is None:
+        # Tagged images are known only after all images are listed.
+        with stage("listing_all"):
+            g.STATE.pages.cursor.load_all()
+        job.image_ids = g.STATE.images.ids[g.STATE.images.tagged].tolist()
+        job.image_tag_ids = dict.fromkeys(job.image_ids, job.tag_ids)
+
+    batch_tagging_progress.show()
+
+    with batch_tagging_progress(
+        message="Progress of removing tags from images...",
+        total=len(job.image_ids),
+    ) as pbar:
+        result = pipeline.untag_images(
+            g.api,
+            g.STATE.journal,
+            job.image_tag_ids,
+            chunk_size=g.STATE.write_chunk_size,
+            concurrency=g.STATE.write_concurrency,
+            on_chunk=lambda chunk: pbar.update(len(chunk)),
+            should_continue=job.should_continue,
+            page_number=None if job.batch is None else job.batch.page_number,
+        )
+
+    batch_tagging_progress.hide()
+
+    job.tagged_ids = result.tagged
+    job.error_ids = list(result.errors.keys())
+
+    remove_tagged_images(result.tagged)
+
+    if g.STATE.save_status:
+        set_statuses(
+            pipeline.reset_statuses(
+                g.api,
+                g.STATE.pages,
+                g.STATE.new_tag_name,
+                result.tagged,
+                concurrency=g.STATE.write_concurrency,
+            )
+        )
+
+    elapsed = time.perf_counter() - started
+
+    sly.logger.info(
+        f"Removed tags from {len(result.tagged)} images in {elapsed:.1f}s. "
+        f"Image ids with errors: {job.error_ids}."
+    )
+
+    if job.error_ids:
+        error_text.text = (
+            f"Failed to remove tags from images: {', '.join(map(str, job.error_ids))}."
+        )
+        error_text.show()
+
+    success_text.text = (
+        f"Removed tags from {len(result.tagged)} images. "
+        f"Overall progress of tagging images in selected datasets: {g.STATE.images.tagged_count}/{g.STATE.images_count}."
+    )
+    success_text.show()
+
+
+def remove_tagged_images(image_ids: List[int]):
+    """Marks images as not tagged, so they are shown in their pages again, and removes them
+    from the processed images.
+    """
+    with g.STATE.lock:
+        rows = g.STATE.images.unmark_tagged(image_ids)
+
+        tagged_images = np.frombuffer(g.STATE.tagged_images, dtype=np.int64)
+        kept = tagged_images[~np.isin(tagged_images, rows)]
+        g.STATE.tagged_images = array("q", kept.tobytes())
+
+        g.STATE.skipped_images.difference_update(rows)
+        g.STATE.error_images.difference_update(rows)
 
     sly.logger.debug(
-        "Updated current page data in global state. Added list of tagged images to global state. "
-        f"Now g.STATE.tagged_images has {len(g.STATE.tagged_images)} images."
+        f"Removed {len(rows)} images from tagged images, "
+        f"{len(g.STATE.tagged_images)} tagged images are left."
     )
 
+    # Annotations in the cache have removed tags, they are downloaded when shown.
+    g.STATE.annotations.invalidate(image_ids)
+
+    update_processed_gallery(g.STATE.processed_page_number)
+
+    # Undone images of the shown batch are added to the current batch.
     update_current_batch_gallery()
 
-    anns_json = g.api.annotation.download_json_batch(
-        g.STATE.selected_dataset, image_ids_with_tags
+
+def handle_job_change(job: TagJob):
+    """Updates the buttons and the status text when the status of any tagging job changes."""
+    sly.logger.debug(f"Status of {job} changed.")
+
+    if isinstance(job, UntagJob):
+        title = "Removing tags"
+    else:
+        title = f"Tagging of batch {job.page_number}"
+
+    job_text.text = f"{title}: {job.status}."
+    job_text.status = "error" if job.status == JobStatus.FAILED else "info"
+    job_text.show()
+
+    if job.status == JobStatus.FAILED:
+        error_text.text = f"{title} failed: {job.error}"
+        error_text.show()
+
+    if isinstance(job, UntagJob) and job.batch is not None:
+        if job.status in (JobStatus.STOPPED, JobStatus.FAILED):
+            # Images of the batch, which still have tags, can be undone again.
+            job.batch.undoing = False
+
+    if tagging_jobs.is_busy():
+        stop_batch_button.show()
+    else:
+        stop_batch_button.hide()
+
+    if job.page_number == g.STATE.current_page_number:
+        if job.status in JobStatus.FINISHED:
+            enable_start_button()
+        else:
+            start_batch_button.disable()
+
+
+def update_galleries(page_number, image_ids_with_tags, assignments):
+    with g.STATE.lock:
+        # The processed gallery follows new images only if its last page is shown.
+        follow_processed = g.STATE.processed_page_number >= processed_pages_count()
+
+        tagged_rows = g.STATE.images.rows_by_ids(image_ids_with_tags)
+
+        # Rows could be already marked, if their page was listed after they were tagged.
+        new_rows = [row for row in tagged_rows if not g.STATE.images.tagged[row]]
+
+        g.STATE.images.mark_tagged(tagged_rows)
+        g.STATE.tagged_images.extend(new_rows)
+
+    update_processed_text()
+
+    sly.logger.debug(
+        f"Marked {len(tagged_rows)} images from batch {page_number} as tagged in global state. "
+        f"Now g.STATE.tagged_images has {len(g.STATE.tagged_images)} images."
     )
 
+    # Tagged images are replaced with the next images in the current batch.
+    refill_current_batch(tagged_rows)
+
+    # Annotations in the cache don't have the new tag, so they are replaced with the local
+    # copies with the tag, other annotations are downloaded when they are shown.
+    cached_anns = g.STATE.annotations.invalidate(image_ids_with_tags)
+
+    for image_id, ann in cached_anns.items():
+        for tag_meta, value in assignments[image_id]:
+            ann = ann.add_tag(sly.Tag(tag_meta, value))
+        cached_anns[image_id] = ann
+
+    g.STATE.annotations.update(cached_anns)
+
     sly.logger.debug(
-        f"Downloaded {len(anns_json)} annotations in JSON format for tagged images."
+        f"Added tags to {len(cached_anns)} annotations of tagged images in cache."
     )
 
-    anns = []
+    if follow_processed:
+        update_processed_gallery()
+
+
+def processed_pages_count() -> int:
+    return max(ceil(len(g.STATE.tagged_images) / g.STATE.batch_size), 1)
 
-    sly.logger.debug("Trying to create annotation objects from JSON.")
 
-    for ann_json in anns_json:
-        ann = sly.Annotation.from_json(ann_json, g.STATE.project_meta)
-        anns.append(ann)
+def update_processed_gallery(page_number: Optional[int] = None):
+    """Shows the page of tagged images in the processed images gallery, the last page is
+    shown by default. Only images of the page are added to the widget, so its state
+    doesn't grow with the number of tagged images.
+    """
+    with g.STATE.lock:
+        if page_number is None:
+            page_number = processed_pages_count()
+        page_number = min(max(page_number, 1), processed_pages_count())
+        g.STATE.processed_page_number = page_number
+
+        start = (page_number - 1) * g.STATE.batch_size
+        rows = g.STATE.tagged_images[start : start + g.STATE.batch_size]
+        tagged_images = g.STATE.images.get_rows(rows)
+
+    update_processed_text()
 
     sly.logger.debug(
-        "Starting to updating processed images gallery with tagged images."
+        f"Showing {len(tagged_images)} tagged images on page {page_number} "
+        "of processed images gallery."
     )
 
     processed_images_gallery.loading = True
-    for tagged_image_info, ann in zip(tagged_image_infos, anns):
-        processed_images_gallery.append(
-            tagged_image_info.preview_url, ann, tagged_image_info.name
-        )
-
+    sync_gallery(processed_images_gallery, tagged_images)
     processed_images_gallery.loading = False
 
     sly.logger.debug("Updated processed image gallery.")
 
 
+@prev_processed_button.click
+def previous_processed_page():
+    update_processed_gallery(g.STATE.processed_page_number - 1)
+
+
+@next_processed_button.click
+def next_processed_page():
+    update_processed_gallery(g.STATE.processed_page_number + 1)
+
+
+def add_tagged_rows(rows):
+    """Adds rows of images, which were found tagged when their page was listed."""
+    with g.STATE.lock:
+        g.STATE.tagged_images.extend(rows)
+
+    sly.logger.debug(f"Found {len(rows)} already tagged images in the listing.")
+
+    update_processed_text()
+
+
+def save_statuses(job: TagJob, result):
+    """Saves statuses of images of the job in their metadata."""
+    statuses = pipeline.save_statuses(
+        g.api,
+        g.STATE.pages,
+        g.STATE.new_tag_name,
+        job.page_number,
+        job.image_ids,
+        result,
+        skipped_ids=job.skipped_ids,
+        concurrency=g.STATE.write_concurrency,
+    )
+    set_statuses(statuses)
+
+
+def set_statuses(statuses: Dict[int, str]):
+    """Updates skipped and failed images with statuses of images by their rows."""
+    with g.STATE.lock:
+        for row, status in statuses.items():
+            if status == ImageStatus.SKIPPED:
+                g.STATE.skipped_images.add(row)
+            else:
+                g.STATE.skipped_images.discard(row)
+
+            if status == ImageStatus.ERROR:
+                g.STATE.error_images.add(row)
+            else:
+                g.STATE.error_images.discard(row)
+
+
+def restore_statuses():
+    """Restores tagged, skipped and failed images from statuses in the metadata of images,
+    called after all images were listed.
+    """
+    if g.STATE.save_status:
+        rows_by_status = aggregate_statuses(g.STATE.images, g.STATE.new_tag_name)
+
+        # Images could be tagged by the previous run without the tag in the listing yet.
+        tagged_rows = rows_by_status[ImageStatus.TAGGED]
+        tagged_rows = tagged_rows[~g.STATE.images.tagged[tagged_rows]].tolist()
+        g.STATE.images.mark_tagged(tagged_rows)
+
+        set_statuses(
+            {
+                int(row): status
+                for status in (ImageStatus.SKIPPED, ImageStatus.ERROR)
+                for row in rows_by_status[status]
+            }
+        )
+
+        sly.logger.info(
+            f"Restored statuses from image metadata: {len(tagged_rows)} more tagged, "
+            f"{len(g.STATE.skipped_images)} skipped, {len(g.STATE.error_images)} failed."
+        )
+
+        if tagged_rows:
+            add_tagged_rows(tagged_rows)
+            return
+
+    update_processed_text()
+
+
+def update_processed_text():
+    """Updates the number of tagged images and the buttons of the processed images gallery."""
+    pages_count = processed_pages_count()
+    page_number = min(g.STATE.processed_page_number, pages_count)
+
+    processed_text.text = (
+        f"Tagged images in selected datasets: {g.STATE.images.tagged_count}/{g.STATE.images_count}. "
+        f"Showing page {page_number} of {pages_count}."
+    )
+    if g.STATE.save_status:
+        processed_text.text += (
+            f" Skipped images: {len(g.STATE.skipped_images)}, "
+            f"failed images: {len(g.STATE.error_images)}."
+        )
+    processed_text.show()
+
+    if page_number > 1:
+        prev_processed_button.enable()
+    else:
+        prev_processed_button.disable()
+
+    if page_number < pages_count:
+        next_processed_button.enable()
+    else:
+        next_processed_button.disable()
+
+
+def api_metrics_totals():
+    """Returns the total number of API requests, retries and errors for batch summaries."""
+    return (
+        METRICS.total("api_calls_total"),
+        METRICS.total("api_retries_total"),
+        METRICS.total("api_errors_total"),
+    )
+
+
 def hide_texts():
     success_text.hide()
     error_text.hide()
@@ -431,35 +1177,20 @@ def hide_texts():
 def stop_batch():
     sly.logger.debug("Stop batch button was clicked.")
 
-    g.STATE.continue_tagging = False
     stop_batch_button.hide()
-    start_batch_button.show()
+    tagging_jobs.stop()
 
 
-def get_tag_meta(tag_name) -> sly.TagMeta:
-    sly.logger.debug(f"Getting tag meta for tag name: {tag_name}")
-
-    if g.STATE.project_meta.tag_metas.get(tag_name) is not None:
-        sly.logger.info(f"Tag meta for tag name {tag_name} already exists.")
-
-        return g.STATE.project_meta.tag_metas.get(tag_name)
-
-    sly.logger.info(f"Tag meta for tag name {tag_name} does not exist. Creating it.")
-
-    tag_meta = sly.TagMeta(tag_name, sly.TagValueType.NONE)
-    tagged_project_meta = g.STATE.project_meta.add_tag_meta(tag_meta)
-
-    sly.logger.debug(
-        f"Created tag meta for tag with name {tag_name} locally. Trying to update project meta on server."
+def get_tag_metas() -> Dict[str, sly.TagMeta]:
+    """Returns tag metas of the run on the server by their names, creating missing ones."""
+    tag_metas, g.STATE.project_meta = pipeline.get_tag_metas(
+        g.api, g.STATE.selected_project, g.STATE.project_meta, g.STATE.tag_metas
     )
+    g.STATE.infos.set_project_meta(g.STATE.selected_project, g.STATE.project_meta)
 
-    g.api.project.update_meta(g.STATE.selected_project, tagged_project_meta)
-
-    sly.logger.info("Updated project meta on server.")
+    sly.logger.debug("Updated project in global state after getting tag metas.")
 
-    meta_json = g.api.project.get_meta(g.STATE.selected_project)
-    g.STATE.project_meta = sly.ProjectMeta.from_json(meta_json)
+    return {tag_meta.name: tag_meta for tag_meta in tag_metas}
 
-    sly.logger.debug("Updated project in global state after adding new tag meta.")
 
-    return g.STATE.project_meta.tag_metas.get(tag_name)
+tagging_jobs = JobRunner(run_job, on_change=handle_job_change)
@@ -0,0 +1,125 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import supervisely as sly
+from supervisely.app.content import DataJson, StateJson
+from supervisely.app.widgets import GridGallery, Transfer
+
+
+class BatchGallery(GridGallery):
+    """GridGallery, which keeps the cell of each image, so cells of single images can be
+    removed and added without rebuilding the whole gallery with clean_up().
+
+    :param columns_number: number of columns in the gallery.
+    """
+
+    def __init__(self, columns_number: int, **kwargs):
+        # Cells of images by image ids.
+        self._cells: Dict[int, dict] = {}
+        # If True, the state of the widget isn't updated after each added cell.
+        self._deferred = False
+        super().__init__(columns_number, **kwargs)
+
+    @property
+    def image_ids(self) -> List[int]:
+        return list(self._cells.keys())
+
+    def add(
+        self,
+        image_id: int,
+        image_url: str,
+        annotation=None,
+        title: str = "",
+        column_index: Optional[int] = None,
+    ):
+        """Appends the cell of the image to the column or to the next column."""
+        self.append(image_url, annotation, title, column_index=column_index)
+        self._cells[image_id] = self._data[-1]
+
+    def add_many(
+        self, cells: Iterable[Tuple[int, str, object, str]], columns: Iterable[int] = ()
+    ):
+        """Appends cells (image id, image URL, annotation, title) to the columns or to the
+        next columns, the state of the widget is updated once for all cells.
+        """
+        columns = list(columns)
+        self._deferred = True
+        try:
+            for index, (image_id, image_url, annotation, title) in enumerate(cells):
+                self.add(
+                    image_id,
+                    image_url,
+                    annotation,
+                    title,
+                    column_index=columns[index] if index < len(columns) else None,
+                )
+        finally:
+            self._deferred = False
+        self._update()
+
+    def remove(self, image_ids: Iterable[int]) -> List[int]:
+        """Removes cells of images and returns indexes of their columns, so new cells
+        can be added to the same places.
+        """
+        removed = [
+            self._cells.pop(image_id)
+            for image_id in image_ids
+            if image_id in self._cells
+        ]
+        if not removed:
+            return []
+
+        removed_uuids = {cell["cell_uuid"] for cell in removed}
+        self._data = [
+            cell for cell in self._data if cell["cell_uuid"] not in removed_uuids
+        ]
+        self._update()
+
+        sly.logger.debug(f"Removed {len(removed)} cells from the gallery.")
+
+        return [cell["column_index"] for cell in removed]
+
+    def _update(self):
+        if not self._deferred:
+            super()._update()
+
+    def clean_up(self):
+        self._cells = {}
+        super().clean_up()
+
+
+class BatchTransfer(Transfer):
+    """Transfer, which items are patched instead of being replaced with set_items, so the
+    selection of items, which stay in the list, is kept and the widget is synced once.
+    """
+
+    def patch(
+        self, keys: List[str], labels: Optional[List[str]] = None
+    ) -> Tuple[int, int]:
+        """Sets the items to keys: items of other keys are removed, new keys are added and
+        transferred, other items keep their side. Returns numbers of removed and added items.
+
+        :param keys: keys of items, e.g. ids of images.
+        :param labels: optional labels of items shown instead of keys, e.g. names of images.
+        """
+        current_keys = {item.key for item in self._items}
+        removed = current_keys - set(keys)
+        added = [key for key in keys if key not in current_keys]
+
+        if not removed and not added:
+            return 0, 0
+
+        transferred = self.get_transferred_items()
+
+        self._items = [item for item in self._items if item.key not in removed]
+        label_of = dict(zip(keys, labels or keys))
+        self._items.extend(Transfer.Item(key=key, label=label_of[key]) for key in added)
+        self._transferred_items = [
+            key for key in transferred if key not in removed
+        ] + added
+
+        self.update_data()
+        self.update_state()
+        DataJson().send_changes()
+        StateJson().send_changes()
+
+        return len(removed), len(added)
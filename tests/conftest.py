@@ -0,0 +1,6 @@
+import os
+
+# Modules of the app read the server address and the data directory from the environment,
+# requests are never sent, the API is replaced with benchmarks.mock_api.MockApi or fakes.
+os.environ.setdefault("SERVER_ADDRESS", "http://localhost")
+os.environ.setdefault("API_TOKEN", "x" * 128)
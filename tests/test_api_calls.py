@@ -0,0 +1,104 @@
+"""Counts requests of infos and project metas made by the app steps against the mock API.
+
+Drives the same functions as the UI: import of the app modules, load_dataset (the load
+button), reading of the project meta by save_settings twice (the second time without changes
+of the project) and creation of the tag meta before tagging. Infos of teams, workspaces,
+projects and datasets and project metas are served from the cache of infos (src.info_cache),
+so each of them is requested once at most and the import sends none.
+"""
+
+import os
+import tempfile
+
+import pytest
+import supervisely as sly
+
+from benchmarks.mock_api import MockApi, MockPreviewAdapter
+
+INFO_ENDPOINTS = (
+    "teams.info",
+    "workspaces.info",
+    "projects.info",
+    "datasets.info",
+    "projects.meta",
+    "projects.meta.update",
+)
+
+
+def info_calls(api) -> dict:
+    return {
+        endpoint: api.calls[endpoint]
+        for endpoint in INFO_ENDPOINTS
+        if api.calls[endpoint]
+    }
+
+
+@pytest.fixture(scope="module")
+def api():
+    # The app reads its configuration from the environment at import time, the app is
+    # started from the ecosystem, so the dataset is selected with the load button.
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv("ENV", "production")
+        monkeypatch.setenv("TEAM_ID", "1")
+        monkeypatch.setenv("WORKSPACE_ID", "1")
+        monkeypatch.setenv(
+            "SLY_APP_DATA_DIR", tempfile.mkdtemp(prefix="batch-tagging-")
+        )
+
+        api = MockApi(images_count=100)
+
+        import src.globals as g
+
+        # The app creates its API lazily with get_api.
+        monkeypatch.setattr(g, "get_api", lambda: api)
+        g.STATE.previews.session.mount("http://localhost", MockPreviewAdapter())
+
+        yield api
+
+
+def test_import_sends_no_requests(api):
+    api.calls.clear()
+
+    import src.ui.input
+    import src.ui.settings
+    import src.ui.tagging
+
+    assert info_calls(api) == {}
+
+    # The directory of previews is created with the app, not at import.
+    import src.globals as g
+
+    assert not os.path.exists(g.PREVIEWS_DIR)
+
+
+def test_infos_are_requested_once(api):
+    import src.globals as g
+    import src.ui.input as input
+    import src.ui.tagging as tagging
+
+    # Created with the app in src.main.
+    g.init_static_dir()
+
+    input.select_dataset.get_selected_ids = lambda: [api.DATASET_ID]
+    g.STATE.tag_metas = [sly.TagMeta("benchmark", sly.TagValueType.NONE)]
+
+    api.calls.clear()
+    input.load_dataset()
+    assert info_calls(api) == {"datasets.info": 1, "projects.info": 1}
+
+    api.calls.clear()
+    g.STATE.save_project_meta()
+    assert info_calls(api) == {"projects.meta": 1}
+
+    api.calls.clear()
+    g.STATE.save_project_meta()
+    assert info_calls(api) == {}
+
+    # Ids of the new tag metas are known only after the meta is read back.
+    api.calls.clear()
+    tagging.get_tag_metas()
+    assert info_calls(api) == {"projects.meta": 1, "projects.meta.update": 1}
+
+    api.calls.clear()
+    g.STATE.save_project_meta()
+    assert info_calls(api) == {}
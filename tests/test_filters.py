@@ -0,0 +1,69 @@
+import supervisely as sly
+from supervisely.api.module_api import ApiField
+
+from src.filters import ImageFilter
+
+
+def image_info(image_id, name, meta=None):
+    empty = {field: None for field in sly.ImageInfo._fields}
+    return sly.ImageInfo(**{**empty, "id": image_id, "name": name, "meta": meta})
+
+
+def date_filters(image_filter):
+    params = image_filter.server_params(sly.ProjectMeta())
+    return [(f["operator"], f["value"]) for f in params[ApiField.FILTER]]
+
+
+def test_end_date_includes_the_whole_day():
+    image_filter = ImageFilter(created_range=["2024-01-01", "2024-01-31"])
+
+    assert date_filters(image_filter) == [(">=", "2024-01-01"), ("<", "2024-02-01")]
+
+
+def test_end_at_midnight_includes_the_whole_day():
+    image_filter = ImageFilter(
+        updated_range=["2024-02-01T00:00:00.000Z", "2024-02-29T00:00:00.000Z"]
+    )
+
+    assert date_filters(image_filter) == [
+        (">=", "2024-02-01T00:00:00.000Z"),
+        ("<", "2024-03-01T00:00:00.000Z"),
+    ]
+
+
+def test_end_with_time_is_inclusive():
+    image_filter = ImageFilter(
+        created_range=["2024-01-01T08:00:00Z", "2024-01-01T18:30:00Z"]
+    )
+
+    assert date_filters(image_filter)[1] == ("<=", "2024-01-01T18:30:00Z")
+
+
+def test_meta_value_matches_only_images_with_the_key():
+    image_infos = [
+        image_info(1, "a.jpg", {"status": "None"}),
+        image_info(2, "b.jpg", {}),
+        image_info(3, "c.jpg", None),
+        image_info(4, "d.jpg", {"status": None}),
+        image_info(5, "e.jpg", {"status": "done"}),
+    ]
+
+    mask = ImageFilter(meta_key="status", meta_value="None").local_mask(image_infos)
+    assert mask.tolist() == [True, False, False, True, False]
+
+    mask = ImageFilter(meta_key="status").local_mask(image_infos)
+    assert mask.tolist() == [True, False, False, True, True]
+
+
+def test_glob_and_meta_predicates_are_combined():
+    image_infos = [
+        image_info(1, "frame_1.jpg", {"camera": 1}),
+        image_info(2, "frame_2.png", {"camera": 1}),
+        image_info(3, "frame_3.jpg", {"camera": 2}),
+    ]
+    image_filter = ImageFilter(
+        name_pattern="frame_*.jpg", meta_key="camera", meta_value="1"
+    )
+
+    assert image_filter.needs_local_scan
+    assert image_filter.local_mask(image_infos).tolist() == [True, False, False]
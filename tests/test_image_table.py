@@ -0,0 +1,84 @@
+import supervisely as sly
+
+from src.image_table import ImageTable
+
+
+def image_info(image_id, name):
+    empty = {field: None for field in sly.ImageInfo._fields}
+    return sly.ImageInfo(
+        **{
+            **empty,
+            "id": image_id,
+            "name": name,
+            "full_storage_url": f"https://app.supervise.ly/images/original/{image_id}.jpg",
+        }
+    )
+
+
+def two_datasets_table():
+    """Table of two datasets with 3 and 2 images, both have the image named b.jpg."""
+    table = ImageTable(5, per_page=2)
+    table.set_segments([10, 20], [3, 2])
+    table.set_rows(0, [image_info(103, "a.jpg"), image_info(101, "b.jpg")])
+    table.set_rows(2, [image_info(102, "c.jpg")])
+    table.set_rows(3, [image_info(201, "b.jpg"), image_info(200, "d.jpg")])
+    return table
+
+
+def test_rows_by_ids_across_segments():
+    table = two_datasets_table()
+
+    assert table.rows_by_ids([200, 101, 102, 999, 103]) == [4, 1, 2, 0]
+    assert table.row_by_id(201) == 3
+    assert table.row_by_id(999) is None
+    assert table.dataset_of([0, 2, 3, 4]).tolist() == [10, 10, 20, 20]
+
+
+def test_rows_by_ids_sees_rows_loaded_later():
+    table = ImageTable(4, per_page=2)
+    table.set_rows(0, [image_info(1, "a.jpg"), image_info(2, "b.jpg")])
+    assert table.rows_by_ids([3, 2]) == [1]
+
+    table.set_rows(2, [image_info(3, "c.jpg"), image_info(4, "d.jpg")])
+    assert table.rows_by_ids([3, 2]) == [2, 1]
+
+
+def test_row_by_name_across_segments():
+    table = two_datasets_table()
+
+    assert table.row_by_name("d.jpg") == 4
+    assert table.row_by_name("missing.jpg") is None
+    # Names are unique only within a dataset.
+    assert table.row_by_name("b.jpg") == 1
+    assert table.row_by_name("b.jpg", dataset_id=10) == 1
+    assert table.row_by_name("b.jpg", dataset_id=20) == 3
+    assert table.row_by_name("a.jpg", dataset_id=20) is None
+
+
+def test_pages_dont_cross_segments():
+    table = two_datasets_table()
+
+    assert table.pages_count == 3
+    assert table.page_of(2) == table.page_of(0) + 1
+    assert table.page_of(3) == table.page_of(4) != table.page_of(2)
+
+
+def test_page_rows_skip_tagged_images():
+    table = ImageTable(5, per_page=2)
+    table.mark_tagged([1, 4])
+
+    assert table.page_of(3) == 2
+    assert table.page_rows(1).tolist() == [0]
+    assert table.page_rows(3).tolist() == []
+
+
+def test_tagged_ids_are_marked_when_rows_are_loaded():
+    table = ImageTable(4, per_page=2)
+    table.set_rows(0, [image_info(1, "a.jpg"), image_info(2, "b.jpg")])
+
+    assert table.set_tagged_ids([2, 4]) == [1]
+    assert table.tagged_count == 2
+
+    table.set_rows(2, [image_info(3, "c.jpg"), image_info(4, "d.jpg")])
+    assert table.tagged.tolist() == [False, True, False, True]
+    assert table.tagged_count == 2
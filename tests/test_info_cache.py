@@ -0,0 +1,76 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from src.info_cache import InfoCache
+
+
+class SlowDatasetApi:
+    """Returns infos of datasets after the event is set, counts requests."""
+
+    def __init__(self, missing_ids=()):
+        self.missing_ids = set(missing_ids)
+        self.requests = 0
+        self.release = threading.Event()
+
+    def get_info_by_id(self, id):
+        self.requests += 1
+        self.release.wait(5)
+        if id in self.missing_ids:
+            return None
+        return SimpleNamespace(id=id)
+
+
+def lookup_concurrently(cache, api, dataset_id, count=8):
+    with ThreadPoolExecutor(count) as executor:
+        futures = [
+            executor.submit(cache.dataset, api, dataset_id) for _ in range(count)
+        ]
+        # All lookups are started before the response is returned.
+        time.sleep(0.1)
+        api.dataset.release.set()
+        return futures
+
+
+def test_concurrent_misses_send_one_request():
+    cache = InfoCache(ttl=60)
+    api = SimpleNamespace(dataset=SlowDatasetApi())
+
+    futures = lookup_concurrently(cache, api, 1)
+
+    assert {future.result().id for future in futures} == {1}
+    assert api.dataset.requests == 1
+
+    cache.dataset(api, 1)
+    assert api.dataset.requests == 1
+
+
+def test_failed_request_is_raised_to_all_waiting_lookups():
+    cache = InfoCache(ttl=60)
+    api = SimpleNamespace(dataset=SlowDatasetApi(missing_ids=[2]))
+
+    futures = lookup_concurrently(cache, api, 2)
+
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result()
+    assert api.dataset.requests == 1
+
+    # Failures aren't cached.
+    with pytest.raises(ValueError):
+        cache.dataset(api, 2)
+    assert api.dataset.requests == 2
+
+
+def test_expired_entries_are_requested_again():
+    cache = InfoCache(ttl=0)
+    api = SimpleNamespace(dataset=SlowDatasetApi())
+    api.dataset.release.set()
+
+    cache.dataset(api, 1)
+    cache.dataset(api, 1)
+
+    assert api.dataset.requests == 2
@@ -0,0 +1,71 @@
+import threading
+import time
+
+from src.jobs import JobRunner, JobStatus, TagJob
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return
+        time.sleep(0.01)
+    raise AssertionError("The condition wasn't met in time.")
+
+
+def test_stop_drops_queued_jobs_and_stops_the_running_one():
+    started = threading.Event()
+    release = threading.Event()
+    handled = []
+
+    def handler(job):
+        handled.append(job)
+        started.set()
+        release.wait(5)
+        # The handler of a page returns the job for the next page.
+        return TagJob(job.page_number + 1, {})
+
+    runner = JobRunner(handler)
+    running = runner.submit(TagJob(1, {1: []}))
+    queued = [runner.submit(TagJob(page, {page: []})) for page in (5, 6)]
+    assert started.wait(5)
+
+    runner.stop()
+    assert running.stop_requested
+    assert not running.should_continue()
+    assert [job.status for job in queued] == [JobStatus.STOPPED] * 2
+
+    release.set()
+    wait_for(lambda: not runner.is_busy())
+
+    assert running.status == JobStatus.STOPPED
+    # Neither the dropped jobs nor the next page of the stopped job are processed.
+    assert handled == [running]
+    assert not runner.is_page_scheduled(2)
+
+
+def test_jobs_submitted_after_stop_are_processed():
+    done = threading.Event()
+    runner = JobRunner(lambda job: done.set())
+
+    runner.stop()
+    job = runner.submit(TagJob(1, {1: []}))
+
+    assert done.wait(5)
+    wait_for(lambda: job.status in JobStatus.FINISHED)
+    assert job.status == JobStatus.DONE
+
+
+def test_failed_job_doesnt_stop_the_runner():
+    def handler(job):
+        if job.page_number == 1:
+            raise RuntimeError("Server is not available.")
+
+    runner = JobRunner(handler)
+    failed = runner.submit(TagJob(1, {1: []}))
+    done = runner.submit(TagJob(2, {2: []}))
+    wait_for(lambda: done.status in JobStatus.FINISHED)
+
+    assert failed.status == JobStatus.FAILED
+    assert failed.error == "Server is not available."
+    assert done.status == JobStatus.DONE
@@ -0,0 +1,181 @@
+import json
+from types import SimpleNamespace
+
+from src.journal import TaggingJournal
+
+
+def reopen(journal):
+    """Opens the journal file again, as the app does after the restart."""
+    journal.close()
+    replayed = TaggingJournal(journal.path, compact_every=journal.compact_every)
+    replayed.replay()
+    return replayed
+
+
+def test_intent_without_ack_is_unconfirmed_after_restart(tmp_path):
+    journal = TaggingJournal(str(tmp_path / "run.jsonl"))
+    journal.intent([7], [1, 2])
+    journal.ack([1, 2])
+    # The app is killed after the request for the second batch was sent.
+    journal.intent([7], [3, 4])
+
+    state = reopen(journal).state
+
+    assert list(state.tagged_ids) == [1, 2]
+    assert list(state.unconfirmed_ids) == [3, 4]
+    assert state.tag_ids == [7]
+
+
+def test_incomplete_last_record_is_skipped(tmp_path):
+    journal = TaggingJournal(str(tmp_path / "run.jsonl"))
+    journal.intent([7], [1, 2])
+    journal.ack([1, 2])
+    journal.close()
+
+    with open(journal.path, "a", encoding="utf-8") as file:
+        file.write(json.dumps({"op": "ack", "ids": [3, 4]})[:10])
+
+    state = reopen(journal).state
+
+    assert list(state.tagged_ids) == [1, 2]
+    assert not state.unconfirmed_ids
+
+
+def test_forgotten_images_are_not_tagged(tmp_path):
+    journal = TaggingJournal(str(tmp_path / "run.jsonl"))
+    journal.intent([7], [1, 2, 3])
+    journal.ack([1, 2, 3])
+    journal.forget([2])
+    journal.page(4)
+
+    state = reopen(journal).state
+
+    assert list(state.tagged_ids) == [1, 3]
+    assert state.page_number == 4
+
+
+def test_compaction_keeps_the_state(tmp_path):
+    journal = TaggingJournal(str(tmp_path / "run.jsonl"), compact_every=3)
+    for image_id in range(1, 5):
+        journal.intent([7, 8], [image_id])
+        journal.ack([image_id])
+    journal.intent([7, 8], [5])
+    journal.page(4)
+
+    with open(journal.path, encoding="utf-8") as file:
+        assert len(file.readlines()) <= 3
+
+    state = reopen(journal).state
+
+    assert list(state.tagged_ids) == [1, 2, 3, 4]
+    assert list(state.unconfirmed_ids) == [5]
+    assert state.tag_ids == [7, 8]
+    assert state.page_number == 4
+
+
+def test_unconfirmed_images_are_checked_on_server(tmp_path):
+    journal = TaggingJournal(str(tmp_path / "run.jsonl"))
+    journal.intent([7], [1, 2])
+    journal = reopen(journal)
+
+    images_on_server = [
+        SimpleNamespace(id=1, tags=[{"tagId": 7}]),
+        SimpleNamespace(id=2, tags=[]),
+    ]
+    api = SimpleNamespace(
+        image=SimpleNamespace(get_list=lambda dataset_id, filters: images_on_server)
+    )
+    journal.confirm(api, [10], [7])
+
+    assert list(journal.state.tagged_ids) == [1]
+    assert not journal.state.unconfirmed_ids
+    assert list(reopen(journal).state.tagged_ids) == [1]
+
+
+def test_journal_is_reset_if_tags_were_recreated(tmp_path):
+    journal = TaggingJournal(str(tmp_path / "run.jsonl"))
+    journal.intent([7], [1])
+    journal.ack([1])
+    journal = reopen(journal)
+
+    journal.confirm(SimpleNamespace(), [10], [9])
+
+    assert not journal.state.tagged_ids
+    assert not reopen(journal).state.tagged_ids
+
+
+def test_batches_are_undoable_after_restart(tmp_path):
+    journal = TaggingJournal(str(tmp_path / "run.jsonl"))
+    journal.intent([7, 8], [1, 2], 1, {1: [7], 2: [7, 8]})
+    journal.ack([1, 2])
+    journal.intent([7], [3, 4], 2)
+    journal.ack([3])
+
+    batches = reopen(journal).undoable_batches(5)
+
+    assert [batch.page_number for batch in batches] == [2, 1]
+    assert batches[0].tags == {3: [7]}
+    assert batches[1].tags == {1: [7], 2: [7, 8]}
+
+
+def test_forgotten_images_are_dropped_from_batches(tmp_path):
+    journal = TaggingJournal(str(tmp_path / "run.jsonl"))
+    journal.intent([7], [1, 2], 1)
+    journal.ack([1, 2])
+    journal.intent([7], [3], 2)
+    journal.ack([3])
+    journal.forget([3, 1])
+
+    batches = reopen(journal).undoable_batches(5)
+
+    assert [(batch.page_number, batch.tags) for batch in batches] == [(1, {2: [7]})]
+
+
+def test_batches_survive_compaction(tmp_path):
+    journal = TaggingJournal(str(tmp_path / "run.jsonl"), compact_every=2)
+    journal.intent([7, 8], [1, 2], 1, {1: [8], 2: [7, 8]})
+    journal.ack([1])
+    journal.intent([7], [3], 2)
+
+    journal = reopen(journal)
+    [batch] = journal.undoable_batches(5)
+    assert batch.tags == {1: [8]}
+
+    journal.ack([2, 3])
+    batches = reopen(journal).undoable_batches(5)
+    assert [(batch.page_number, batch.tags) for batch in batches] == [
+        (2, {3: [7]}),
+        (1, {1: [8], 2: [7, 8]}),
+    ]
+
+
+def test_confirmed_images_are_added_to_their_batches(tmp_path):
+    journal = TaggingJournal(str(tmp_path / "run.jsonl"))
+    journal.intent([7], [1, 2], 1)
+    journal = reopen(journal)
+
+    images_on_server = [
+        SimpleNamespace(id=1, tags=[{"tagId": 7}]),
+        SimpleNamespace(id=2, tags=[]),
+    ]
+    api = SimpleNamespace(
+        image=SimpleNamespace(get_list=lambda dataset_id, filters: images_on_server)
+    )
+    journal.confirm(api, [10], [7])
+
+    [batch] = reopen(journal).undoable_batches(5)
+    assert batch.tags == {1: [7]}
+    assert not batch.pending
+
+
+def test_batches_being_undone_are_skipped(tmp_path):
+    journal = TaggingJournal(str(tmp_path / "run.jsonl"))
+    for page_number in (1, 2, 3):
+        journal.intent([7], [page_number], page_number)
+        journal.ack([page_number])
+
+    latest = journal.undoable_batches(1)
+    assert [batch.page_number for batch in latest] == [3]
+
+    latest[0].undoing = True
+    assert [batch.page_number for batch in journal.undoable_batches(5)] == [2, 1]
@@ -0,0 +1,75 @@
+import time
+
+from src.leases import LeaseTable
+
+
+def tables(tmp_path, **kwargs):
+    path = str(tmp_path / "leases.json")
+    return (
+        LeaseTable(path, session="first", **kwargs),
+        LeaseTable(path, session="second", **kwargs),
+    )
+
+
+def test_page_is_claimed_by_one_session(tmp_path):
+    first, second = tables(tmp_path, cache_ttl=0)
+
+    assert first.claim(1)
+    assert first.claim(1)
+    assert not second.claim(1)
+    assert second.claimed_by_others() == {1}
+    assert second.holder(1) == "first"
+
+    first.release(1)
+    assert second.claim(1)
+    assert first.claimed_by_others() == {1}
+
+
+def test_expired_lease_can_be_claimed(tmp_path):
+    first, second = tables(tmp_path, ttl=0.1, cache_ttl=0)
+
+    assert first.claim(1)
+    time.sleep(0.2)
+
+    assert second.holder(1) is None
+    assert second.claim(1)
+
+
+def test_held_pages_are_renewed_until_released(tmp_path):
+    first, second = tables(tmp_path, ttl=0.3, cache_ttl=0)
+
+    assert first.claim(1)
+    assert first.claim(2)
+    first.hold([1])
+    time.sleep(0.6)
+
+    assert second.claimed_by_others() == {1}
+
+    first.release_all()
+    assert second.claimed_by_others() == set()
+    assert second.claim(1)
+
+
+def test_pages_of_other_sessions_are_not_renewed(tmp_path):
+    first, second = tables(tmp_path, ttl=0.3, cache_ttl=0)
+
+    assert second.claim(1)
+    first.hold([1])
+    second.release(1)
+    time.sleep(0.4)
+
+    assert first.holder(1) is None
+    first.release_all()
+
+
+def test_reads_are_cached(tmp_path):
+    first, second = tables(tmp_path, cache_ttl=0.2)
+
+    assert second.claimed_by_others() == set()
+    assert first.claim(1)
+    assert second.claimed_by_others() == set()
+
+    time.sleep(0.3)
+    assert second.claimed_by_others() == {1}
+    # Claims read the table under the lock, not from the cache.
+    assert not second.claim(1)
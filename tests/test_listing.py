@@ -0,0 +1,18 @@
+from benchmarks.mock_api import FIRST_IMAGE_ID, MockApi
+from src.listing import ImageCursor
+
+
+def test_pages_are_requested_with_fields_of_get_list():
+    api = MockApi(images_count=25)
+    requests = []
+    list_images = api._images_list
+    api._images_list = lambda data: requests.append(data) or list_images(data)
+
+    cursor = ImageCursor(api, api.DATASET_ID, per_page=10)
+    cursor.load_page(2)
+
+    assert len(cursor) == 25 and cursor.pages_count == 3
+    assert [data["page"] for data in requests] == [1, 3]
+    # Sizes and metadata of images added by links are sent only when forced.
+    assert all(data["forceMetadataForLinks"] and data["filter"] == [] for data in requests)
+    assert int(cursor.table.ids[20]) == FIRST_IMAGE_ID + 20
@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+from src import pipeline
+from src.journal import TaggingJournal
+
+
+class FakeAdvancedApi:
+    """Records bulk removals of tags, requests with failing image ids fail with 400."""
+
+    def __init__(self, failing_ids=()):
+        self.failing_ids = set(failing_ids)
+        self.removed = []
+
+    def remove_tags_from_images(self, tag_ids, image_ids):
+        if self.failing_ids.intersection(image_ids):
+            raise ValueError(f"Can't remove tags of {image_ids}")
+        self.removed.extend(
+            (image_id, tag_id) for image_id in image_ids for tag_id in tag_ids
+        )
+
+
+def test_undo_removes_only_tags_added_by_the_batch(tmp_path):
+    journal = TaggingJournal(str(tmp_path / "run.jsonl"))
+    journal.intent([7, 8], [1, 2, 3], 4, {1: [7], 2: [7, 8], 3: [8]})
+    journal.ack([1, 2, 3])
+    [batch] = journal.undoable_batches(1)
+
+    api = SimpleNamespace(advanced=FakeAdvancedApi())
+    result = pipeline.untag_images(
+        api, journal, dict(batch.tags), chunk_size=10, page_number=batch.page_number
+    )
+
+    assert sorted(result.tagged) == [1, 2, 3]
+    assert sorted(api.advanced.removed) == [(1, 7), (2, 7), (2, 8), (3, 8)]
+    assert not journal.state.tagged_ids
+    assert journal.undoable_batches(1) == []
+
+
+def test_images_which_kept_tags_can_be_undone_again(tmp_path):
+    journal = TaggingJournal(str(tmp_path / "run.jsonl"))
+    journal.intent([7], [1, 2], 4)
+    journal.ack([1, 2])
+
+    api = SimpleNamespace(advanced=FakeAdvancedApi(failing_ids=[2]))
+    result = pipeline.untag_images(
+        api, journal, {1: [7], 2: [7]}, chunk_size=10, page_number=4
+    )
+
+    assert result.tagged == [1]
+    assert list(result.errors) == [2]
+
+    journal.close()
+    replayed = TaggingJournal(journal.path)
+    replayed.replay()
+    assert list(replayed.state.tagged_ids) == [2]
+    [batch] = replayed.undoable_batches(5)
+    assert (batch.page_number, batch.tags) == (4, {2: [7]})
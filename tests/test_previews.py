@@ -0,0 +1,67 @@
+import time
+from types import SimpleNamespace
+
+import requests
+
+from benchmarks.mock_api import MockApi
+from src.previews import PreviewCache
+
+
+class RecordingAdapter(requests.adapters.BaseAdapter):
+    """Answers any request with an empty preview, records URLs and headers of requests."""
+
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        self.requests.append(request)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b"jpeg"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def download_preview(tmp_path, url):
+    api = MockApi(images_count=1)
+    cache = PreviewCache(str(tmp_path), static_url="static/previews")
+    adapter = RecordingAdapter()
+    cache.session.mount("http://", adapter)
+    cache.session.mount("https://", adapter)
+
+    cache.prefetch(api, [SimpleNamespace(id=1, hash="hash", preview_url=url)])
+
+    deadline = time.monotonic() + 5
+    while cache.url(1, "hash") is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert cache.url(1, "hash") is not None
+    return api, adapter.requests[0]
+
+
+def test_relative_preview_url_is_downloaded_from_server(tmp_path):
+    api, request = download_preview(tmp_path, "/previews/image.jpg")
+
+    assert request.url == "http://localhost/previews/image.jpg"
+    assert request.headers["x-api-key"] == api.token
+
+
+def test_token_isnt_sent_to_other_hosts(tmp_path):
+    _, request = download_preview(tmp_path, "https://storage.example.com/image.jpg")
+
+    assert request.url == "https://storage.example.com/image.jpg"
+    assert "x-api-key" not in request.headers
+
+
+def test_directory_is_created_on_first_use(tmp_path):
+    directory = tmp_path / "previews"
+    cache = PreviewCache(str(directory), static_url="static/previews")
+    assert not directory.exists()
+
+    assert len(cache) == 0
+    assert directory.is_dir()
@@ -0,0 +1,105 @@
+from types import SimpleNamespace
+
+import supervisely as sly
+
+from src.image_table import ImageTable
+from src.status import ImageStatus, status_of, with_status, write_statuses
+
+
+class FakeImageApi:
+    """Stores the metadata of images of two datasets, counts requests."""
+
+    def __init__(self, metas, dataset_of):
+        self.metas = metas
+        self.dataset_of = dataset_of
+        self.listings = []
+        self.updated = []
+
+    def get_list(self, dataset_id, filters):
+        image_ids = filters[0]["value"]
+        self.listings.append((dataset_id, list(image_ids)))
+        return [
+            SimpleNamespace(id=image_id, meta=self.metas[image_id])
+            for image_id in image_ids
+            if image_id in self.metas and self.dataset_of[image_id] == dataset_id
+        ]
+
+    def update_meta(self, image_id, meta):
+        self.updated.append(image_id)
+        self.metas[image_id] = meta
+
+
+def image_info(image_id, meta=None):
+    empty = {field: None for field in sly.ImageInfo._fields}
+    return sly.ImageInfo(
+        **{
+            **empty,
+            "id": image_id,
+            "name": f"{image_id}.jpg",
+            "meta": meta,
+            "full_storage_url": f"https://app.supervise.ly/images/original/{image_id}.jpg",
+        }
+    )
+
+
+def test_statuses_are_merged_into_metadata_read_before_writing():
+    table = ImageTable(4, per_page=4)
+    table.set_segments([10, 20], [2, 2])
+    table.set_rows(0, [image_info(1), image_info(2), image_info(3), image_info(4)])
+
+    time = "2024-01-01T00:00:00+00:00"
+    server_metas = {
+        # Another session saved the status of its tag after the listing.
+        1: with_status({"camera": 1}, "other", ImageStatus.TAGGED, 1, time),
+        # The status was already saved by another session of the same run.
+        2: with_status({}, "reviewed", ImageStatus.TAGGED, 3, time),
+        3: {},
+        4: {"camera": 2},
+    }
+    api = SimpleNamespace(
+        image=FakeImageApi(server_metas, {1: 10, 2: 10, 3: 20, 4: 20})
+    )
+    statuses = {row: ImageStatus.TAGGED for row in range(4)}
+
+    result = write_statuses(api, table, "reviewed", statuses, batch=3, chunk_size=4)
+
+    assert sorted(result.tagged) == [1, 2, 3, 4]
+    assert sorted(api.image.updated) == [1, 3, 4]
+    # One listing request for each dataset of the chunk.
+    assert sorted(dataset_id for dataset_id, _ in api.image.listings) == [10, 20]
+
+    meta = server_metas[1]
+    assert status_of(meta, "other")["status"] == ImageStatus.TAGGED
+    assert status_of(meta, "reviewed")["status"] == ImageStatus.TAGGED
+    assert status_of(meta, "reviewed")["batch"] == 3
+    assert meta["camera"] == 1
+    assert table.meta_of(0) == meta
+    assert status_of(table.meta_of(3), "reviewed")["status"] == ImageStatus.TAGGED
+
+
+def test_images_with_the_status_in_the_listing_are_skipped():
+    time = "2024-01-01T00:00:00+00:00"
+    meta = with_status({}, "reviewed", ImageStatus.SKIPPED, 1, time)
+    table = ImageTable(2, per_page=2, dataset_id=10)
+    table.set_rows(0, [image_info(1, meta), image_info(2)])
+
+    api = SimpleNamespace(image=FakeImageApi({1: meta, 2: {}}, {1: 10, 2: 10}))
+    write_statuses(
+        api, table, "reviewed", {0: ImageStatus.SKIPPED, 1: ImageStatus.PENDING}, 1
+    )
+
+    assert api.image.listings == [(10, [2])]
+    assert api.image.updated == [2]
+
+
+def test_deleted_images_are_reported():
+    table = ImageTable(2, per_page=2, dataset_id=10)
+    table.set_rows(0, [image_info(1), image_info(2)])
+
+    api = SimpleNamespace(image=FakeImageApi({2: {}}, {2: 10}))
+    result = write_statuses(
+        api, table, "reviewed", {0: ImageStatus.TAGGED, 1: ImageStatus.TAGGED}, 1
+    )
+
+    assert result.tagged == [2]
+    assert list(result.errors) == [1]
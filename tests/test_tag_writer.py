@@ -0,0 +1,128 @@
+import requests
+
+from benchmarks.mock_api import FIRST_IMAGE_ID, MockApi
+from src.metrics import instrument_api
+from src.tag_writer import write_client, write_tag_assignments, write_tags
+
+
+class FakeImageApi:
+    """Records bulk tag requests, requests with failing image ids fail with 400,
+    the first requests fail with errors from throttled.
+    """
+
+    def __init__(self, failing_ids=(), throttled=()):
+        self.failing_ids = set(failing_ids)
+        self.throttled = list(throttled)
+        self.requests = []
+
+    def add_tag_batch(self, image_ids, tag_id, value=None):
+        self.requests.append((list(image_ids), tag_id, value))
+        if self.throttled:
+            raise self.throttled.pop()
+        if self.failing_ids.intersection(image_ids):
+            raise ValueError(f"Can't tag {self.failing_ids.intersection(image_ids)}")
+
+    def add_tag(self, image_id, tag_id, value=None):
+        self.add_tag_batch([image_id], tag_id, value)
+
+
+class FakeApi:
+    def __init__(self, failing_ids=(), throttled=()):
+        self.image = FakeImageApi(failing_ids, throttled)
+
+
+def http_error(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.exceptions.HTTPError(response=response)
+
+
+def test_failed_chunk_is_bisected_to_failing_images():
+    api = FakeApi(failing_ids=[5])
+    image_ids = list(range(16))
+
+    result = write_tags(api, image_ids, 1, chunk_size=8)
+
+    assert list(result.errors) == [5]
+    assert result.tagged == [image_id for image_id in image_ids if image_id != 5]
+    # Two chunks and the halves of the failing chunk down to the failing image.
+    assert len(api.image.requests) == 2 + 2 + 2 + 2
+
+
+def test_throttled_chunk_is_retried_without_splitting():
+    api = FakeApi(throttled=[http_error(429)])
+
+    result = write_tags(api, list(range(4)), 1, chunk_size=4)
+
+    assert result.tagged == [0, 1, 2, 3]
+    assert not result.errors
+    assert [image_ids for image_ids, _, _ in api.image.requests] == [[0, 1, 2, 3]] * 2
+
+
+def test_chunk_is_reported_after_retries_are_exhausted():
+    api = FakeApi(throttled=[http_error(503)] * 2)
+
+    result = write_tags(api, list(range(3)), 1, chunk_size=3, max_retries=1)
+
+    assert result.tagged == []
+    assert sorted(result.errors) == [0, 1, 2]
+
+
+def test_stopped_writing_sends_no_requests():
+    api = FakeApi()
+
+    result = write_tags(
+        api, list(range(10)), 1, chunk_size=2, should_continue=lambda: False
+    )
+
+    assert api.image.requests == []
+    assert result.tagged == [] and not result.errors
+
+
+def test_split_chunk_doesnt_resend_written_tags():
+    api = FakeApi(failing_ids=[3])
+    assignments = {image_id: [(1, None), (2, "a")] for image_id in range(4)}
+    assignments[3] = [(2, "a")]
+
+    result = write_tag_assignments(api, assignments, chunk_size=4)
+
+    assert result.tagged == [0, 1, 2]
+    assert list(result.errors) == [3]
+
+    written = [
+        (image_id, tag_id, value)
+        for image_ids, tag_id, value in api.image.requests
+        if not api.image.failing_ids.intersection(image_ids)
+        for image_id in image_ids
+    ]
+    assert len(written) == len(set(written))
+    assert {(image_id, 1, None) for image_id in range(3)} <= set(written)
+
+
+def test_write_client_sends_requests_once():
+    api = instrument_api(MockApi(images_count=10))
+    client = write_client(api)
+
+    assert client.retry_count == 1 and api.retry_count == 10
+    assert client.image._api is client and api.image._api is api
+    assert client.post is not api.post
+
+
+def test_throttled_write_is_retried_by_limiter_not_by_client():
+    # Every request is throttled, sly.Api would retry each of them 10 times itself.
+    api = MockApi(images_count=4, capacity=0)
+
+    result = write_tags(api, api.image_ids(), 1, chunk_size=4, max_retries=2)
+
+    assert sorted(result.errors) == api.image_ids()
+    assert api.calls["image-tags.bulk.add-to-image"] == 1 + 2
+
+
+def test_failing_images_are_reported_through_client():
+    api = MockApi(images_count=8, failing_ids=[FIRST_IMAGE_ID + 5])
+
+    result = write_tags(api, api.image_ids(), 1, chunk_size=4)
+
+    assert list(result.errors) == [FIRST_IMAGE_ID + 5]
+    assert len(result.tagged) == 7
+    assert all(api.tag_count(image_id, 1) == 1 for image_id in result.tagged)